@@ -1,23 +1,169 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+import asyncio
+import hashlib
+import os
+import time
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import orjson
+from fastapi import BackgroundTasks, FastAPI, File, Header, HTTPException, Query, UploadFile
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from app.agents.analysis_agent import AnalysisAgent
 from app.orchestrator.orchestrator import OrchestratorAgent
+from app.orchestrator.response_formatter import RESPONSE_FIELDS, parse_fields
+from app.orchestrator.states import AnswerTier
+from app.services.campaign_ingest import CampaignIngestor, UnsupportedFormatError
+from app.services.job_queue import JobConflictError, JobQueue, QueueFullError
+from app.services.precompute_scheduler import PrecomputeScheduler
+from app.services.prefetcher import Prefetcher
 from app.utils.conversation_manager import ConversationManager, MessageType
-from typing import Optional
+from app.utils.llm_scheduler import Priority, default_llm_scheduler, llm_request_context
+from app.utils.profiling import flush_profiles, parse_profile_modes
+from app.utils.traffic_recording import record_turn, traffic_recorder
+from typing import Dict, FrozenSet, List, Optional
+from uuid import uuid4
 
-app = FastAPI()
+def _json_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson; returned directly, it also skips FastAPI's jsonable_encoder pass"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_json_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    conversation_manager.load()
+    job_queue.start()
+    # Set PRECOMPUTE_IN_PROCESS=1 to pre-compute in the API process instead of
+    # running `python -m app.services.precompute_scheduler` as a separate worker
+    precompute_scheduler = None
+    if os.getenv("PRECOMPUTE_IN_PROCESS") == "1":
+        precompute_scheduler = PrecomputeScheduler(
+            llm=orchestrator.llm,
+            result_cache=orchestrator.agent_handlers.result_cache,
+            campaign_store=orchestrator.agent_handlers.campaign_store,
+            timeseries_store=orchestrator.agent_handlers.timeseries_store
+        )
+        precompute_scheduler.start()
+    yield
+    # Running jobs record their responses when they finish, so the queue stops before conversations are saved
+    await asyncio.to_thread(job_queue.stop)
+    if precompute_scheduler is not None:
+        await asyncio.to_thread(precompute_scheduler.stop)
+    conversation_manager.save()
+    await asyncio.to_thread(flush_profiles)
+    # Set TRAFFIC_RECORD_FILE to record /chat traffic for replaying with `python -m app.services.traffic_replay`
+    recorder = traffic_recorder()
+    if recorder is not None:
+        recorder.close()
+
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 orchestrator = OrchestratorAgent()
 conversation_manager = ConversationManager()
+prefetcher = Prefetcher(orchestrator.agent_handlers)
+campaign_ingestor = CampaignIngestor(
+    orchestrator.agent_handlers.campaign_store,
+    orchestrator.agent_handlers.timeseries_store
+)
+
+def _record_response(session_id: str, result: Dict):
+    """Record the system response for a completed orchestration run; DONE and failed turns have none"""
+    if result.get('user_input_type') == 'DONE' or result.get('error'):
+        return
+    recommendations = result.get('recommendations') or []
+    response_content = f"Analysis: {result.get('analysis')}\nRecommendations: {', '.join(map(str, recommendations))}"
+    conversation_manager.add_message(
+        session_id=session_id,
+        content=response_content,
+        msg_type=MessageType.SYSTEM_RESPONSE,
+        metadata={
+            'campaign_data': result.get('campaign_data'),
+            'analysis': result.get('analysis'),
+            'recommendations': recommendations,
+            # Every campaign of the answer, so a follow-up to a comparison stays on all of them
+            'context': {'campaign_ids': (result.get('context') or {}).get('campaign_ids') or []}
+        }
+    )
+
+def _profile_modes(x_profile: Optional[str]) -> FrozenSet[str]:
+    """
+    Profiling modes from an X-Profile header. Profiling slows the whole process
+    (tracemalloc and cProfile are process-wide), so the header is refused
+    unless PROFILE_HEADER_ENABLED=1
+    """
+    modes = parse_profile_modes(x_profile)
+    if modes and os.getenv("PROFILE_HEADER_ENABLED") != "1":
+        raise HTTPException(status_code=403, detail="Profiling via X-Profile is disabled on this server")
+    return modes
+
+@lru_cache(maxsize=4)
+def _parse_api_keys(value: str) -> Dict[str, str]:
+    """Tenant of each key in API_KEYS ("key=tenant,..."); a key without one gets a digest of itself"""
+    keys = {}
+    for item in value.split(","):
+        key, _, tenant = item.strip().partition("=")
+        if key:
+            keys[key] = tenant.strip() or "key-" + hashlib.sha256(key.encode()).hexdigest()[:12]
+    return keys
+
+def _tenant(api_key: Optional[str]) -> Optional[str]:
+    """
+    LLM scheduling tenant of the caller's X-API-Key, which must be listed in
+    API_KEYS. A client-chosen tenant would be a fresh quota for the asking,
+    so without API_KEYS every request shares the default tenant
+    """
+    keys = _parse_api_keys(os.getenv("API_KEYS", ""))
+    if not keys:
+        return None
+    if api_key not in keys:
+        raise HTTPException(status_code=401, detail="Missing or unknown X-API-Key")
+    return keys[api_key]
+
+job_queue = JobQueue(orchestrator, on_complete=lambda job: _record_response(job.session_id, job.result))
 
 class ChatRequest(BaseModel):
     user_input: str
     session_id: Optional[str] = None
+    prefetch: bool = os.getenv("PREFETCH_ENABLED") == "1"
+    # Latency budget for the turn; parts that would overrun it are answered more cheaply
+    deadline_seconds: Optional[float] = Field(None, gt=0)
+    # "rules" answers in milliseconds from rule templates, without calling the LLM
+    tier: AnswerTier = AnswerTier.LLM
+
+# Fields /chat can return besides session_id; content is the one display string a chat widget renders
+CHAT_FIELDS = RESPONSE_FIELDS + ("user_input_type", "conversation_history")
+DEFAULT_CHAT_FIELDS = ("campaign_data", "analysis", "recommendations", "conversation_history")
+# What recording the turn and prefetching need from every run, whatever the client asked for
+RECORDED_FIELDS = ("campaign_data", "analysis", "recommendations", "context")
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest,
+                        background_tasks: BackgroundTasks,
+                        fields: Optional[str] = Query(None, description="Comma-separated response fields, e.g. recommendations,summary"),
+                        x_api_key: Optional[str] = Header(None),
+                        x_profile: Optional[str] = Header(None, description="Profiling modes, e.g. stacks,memory")):
+    tenant = _tenant(x_api_key)
+    try:
+        selected = parse_fields(fields, CHAT_FIELDS) or DEFAULT_CHAT_FIELDS
+        profile = _profile_modes(x_profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     session_id = request.session_id
     if not session_id:
         # Create new session if none provided
-        session_id = conversation_manager.create_session(session_id).session_id
+        session_id = conversation_manager.create_session(str(uuid4())).session_id
     elif session_id not in conversation_manager.sessions:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -34,29 +180,43 @@ async def chat_endpoint(request: ChatRequest):
         'session_id': session_id
     }
 
-    # Run the LangGraph workflow with user input and context
-    result = orchestrator.run(request.user_input, context=context)
+    # Run the LangGraph workflow with user input and context, building only the fields used below
+    with llm_request_context(tenant), \
+            record_turn(session_id, request.user_input, tenant=tenant, tier=request.tier.value,
+                        deadline_seconds=request.deadline_seconds) as turn:
+        result = await orchestrator.arun(
+            request.user_input,
+            context=context,
+            fields=RECORDED_FIELDS + tuple(field for field in selected if field in RESPONSE_FIELDS and field not in RECORDED_FIELDS),
+            deadline_seconds=request.deadline_seconds,
+            tier=request.tier,
+            profile=profile
+        )
+        if result.get("error"):
+            turn["error"] = result["error"]
 
-    # Record system response
-    response_content = f"Analysis: {result['analysis']}\nRecommendations: {', '.join(result['recommendations'])}"
-    conversation_manager.add_message(
-        session_id=session_id,
-        content=response_content,
-        msg_type=MessageType.SYSTEM_RESPONSE,
-        metadata={
-            'campaign_data': result['campaign_data'],
-            'analysis': result['analysis'],
-            'recommendations': result['recommendations']
-        }
-    )
+    _record_response(session_id, result)
 
-    return {
-        "session_id": session_id,
-        "campaign_data": result["campaign_data"],
-        "analysis": result["analysis"],
-        "recommendations": result["recommendations"],
-        "conversation_history": conversation_manager.get_conversation_history(session_id)
-    }
+    # Rule-based turns are for callers that never wait on the LLM, so there is nothing to prefetch
+    if request.prefetch and request.tier == AnswerTier.LLM:
+        # Runs after the response has been sent
+        background_tasks.add_task(
+            prefetcher.maybe_prefetch,
+            session_id,
+            result,
+            conversation_manager.get_conversation_history(session_id),
+            tenant
+        )
+
+    response = {"session_id": session_id, "degraded": result.get("degraded", {})}
+    if "profile" in result:
+        response["profile"] = result["profile"]
+    for field in selected:
+        if field == "conversation_history":
+            response[field] = conversation_manager.get_conversation_history(session_id)
+        else:
+            response[field] = result.get(field)
+    return FastJSONResponse(response)
 
 @app.get("/chat/history/{session_id}")
 async def get_chat_history(session_id: str):
@@ -66,4 +226,154 @@ async def get_chat_history(session_id: str):
     return {
         "session_id": session_id,
         "history": conversation_manager.get_conversation_history(session_id)
-    }
\ No newline at end of file
+    }
+
+@app.get("/metrics/llm")
+async def get_llm_metrics():
+    return default_llm_scheduler().stats()
+
+@app.get("/metrics/prefetch")
+async def get_prefetch_metrics():
+    return prefetcher.stats()
+
+class QueryRequest(BaseModel):
+    query: str
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+    # Batch queries yield the LLM to interactive ones
+    batch: bool = False
+    tier: AnswerTier = AnswerTier.LLM
+
+@app.post("/api/query")
+async def submit_query(request: QueryRequest,
+                       x_api_key: Optional[str] = Header(None),
+                       x_profile: Optional[str] = Header(None, description="Profiling modes, e.g. stacks,memory")):
+    tenant = _tenant(x_api_key)
+    try:
+        profile = _profile_modes(x_profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    session_id = request.session_id or str(uuid4())
+    if session_id not in conversation_manager.sessions:
+        conversation_manager.create_session(session_id)
+
+    message = conversation_manager.add_message(
+        session_id=session_id,
+        content=request.query,
+        msg_type=MessageType.USER_INPUT
+    )
+    context = {
+        'conversation_history': conversation_manager.get_conversation_history(session_id),
+        'session_id': session_id
+    }
+    try:
+        job_queue.submit(
+            session_id,
+            request.query,
+            context,
+            user_id=request.user_id,
+            tenant=tenant,
+            priority=Priority.BATCH if request.batch else Priority.INTERACTIVE,
+            tier=request.tier,
+            profile=profile
+        )
+    except (QueueFullError, JobConflictError) as e:
+        # The query was not accepted, so it should not appear in the history
+        conversation_manager.remove_message(session_id, message)
+        status_code = 429 if isinstance(e, QueueFullError) else 409
+        raise HTTPException(status_code=status_code, detail=str(e))
+
+    return {"session_id": session_id, "status": "processing"}
+
+@app.get("/api/state/{session_id}")
+async def get_query_state(session_id: str):
+    job = job_queue.get(session_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No job found for session")
+    return job.to_dict()
+
+@app.delete("/api/query/{session_id}")
+async def cancel_query(session_id: str):
+    if not job_queue.cancel(session_id):
+        raise HTTPException(status_code=404, detail="No active job found for session")
+    return {"session_id": session_id, "status": "cancelling"}
+
+@app.get("/metrics/jobs")
+async def get_job_metrics():
+    return job_queue.stats()
+
+@app.post("/api/upload")
+async def upload_campaigns(file: UploadFile = File(...)):
+    """Stream a CSV or NDJSON campaign export into the campaign store"""
+    try:
+        # The upload is spooled to disk by the multipart parser and read back in
+        # a worker thread, so large files neither fill memory nor block the loop
+        report = await asyncio.to_thread(campaign_ingestor.ingest, file.file, file.filename)
+    except UnsupportedFormatError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    return {"status": "uploaded", "filename": file.filename, **report}
+
+@app.get("/api/campaigns/search")
+async def search_campaigns(q: str, limit: int = Query(5, ge=1, le=50)):
+    """Campaigns matching a typed name or ID, tolerating typos and partial names"""
+    return {"query": q, "matches": orchestrator.agent_handlers.campaign_store.names.search(q, limit)}
+
+@app.get("/api/conversations/search")
+async def search_conversations(q: str,
+                               limit: int = Query(10, ge=1, le=100),
+                               session_id: Optional[str] = None,
+                               type: Optional[MessageType] = None):
+    """Messages from every session ranked by relevance to q, optionally within one session or message type"""
+    started = time.perf_counter()
+    hits = conversation_manager.search(q, limit, session_id=session_id, msg_type=type)
+    return {"query": q, "hits": hits, "took_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+@app.get("/api/budget/plan")
+async def get_budget_plan(budget: Optional[float] = None, objective: str = "revenue", top_n: int = 10):
+    """Optimal spend reallocation across the portfolio"""
+    try:
+        plan = await asyncio.to_thread(orchestrator.agent_handlers.budget_optimizer.plan, budget, objective)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return plan.to_dict(top_n=top_n)
+
+@app.get("/api/portfolio/issues")
+async def get_portfolio_issues(top_n: int = Query(10, ge=1, le=100)):
+    """Threshold issues across every campaign, with the campaigns most in need of attention"""
+    handlers = orchestrator.agent_handlers
+    analysis_agent = AnalysisAgent(llm=handlers.llm)
+    # Reading the campaigns may mean scanning the upload log, so it happens off the loop as well
+    return await asyncio.to_thread(
+        lambda: analysis_agent.scan_portfolio(handlers.campaign_store.list_campaigns(), top_n)
+    )
+
+class SimulationRequest(BaseModel):
+    campaign_ids: List[str]
+    # Relative changes per lever, e.g. {"spend": 0.2, "ctr": -0.05}
+    scenario: Dict[str, float]
+    draws: Optional[int] = Field(None, ge=100, le=1_000_000)
+
+@app.post("/api/simulate")
+async def simulate_scenario(request: SimulationRequest):
+    """Monte Carlo what-if for one campaign, or for the combined campaigns under the same change"""
+    handlers = orchestrator.agent_handlers
+    campaigns = []
+    for campaign_id in request.campaign_ids:
+        campaign = handlers.campaign_store.get(campaign_id)
+        if campaign is None:
+            raise HTTPException(status_code=404, detail=f"Campaign {campaign_id} not found")
+        campaigns.append(campaign)
+    if not campaigns:
+        raise HTTPException(status_code=400, detail="No campaigns given")
+
+    try:
+        if len(campaigns) == 1:
+            return await asyncio.to_thread(
+                handlers.what_if.simulate_campaign, campaigns[0], request.scenario, request.draws
+            )
+        return await asyncio.to_thread(
+            handlers.what_if.simulate_portfolio, campaigns, [request.scenario] * len(campaigns), request.draws
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,32 +1,84 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
+import numpy as np
 from langchain_core.tools import Tool
 from langchain_core.messages import HumanMessage
+from app.utils.anomaly_detector import METRIC_LABELS, TRACKED_METRICS
+from app.utils.benchmarks import describe_benchmark, format_metric
+from app.utils.campaign_record import CampaignRecord, as_record
 from app.utils.llm import LLMInitializer
+from app.utils.portfolio_kernels import METRIC_COLUMNS, portfolio_columns, portfolio_issues
+from app.utils.sharded_executor import ShardedExecutor
+
+# How much each kind of issue weighs on the campaign's results, for ranking them
+ISSUE_WEIGHTS = {
+    "low_roi": 1.0,
+    "roi_below_target": 0.9,
+    "low_conversion": 0.8,
+    "declining_conversions": 0.8,
+    "high_cost": 0.7,
+    "rising_cpc": 0.6,
+    "anomaly": 0.6,
+    "low_ctr": 0.5,
+    "declining_ctr": 0.5,
+    "ctr_below_target": 0.5,
+}
+
+
+def rank_issues(issues: List[Dict]) -> List[Dict]:
+    """Issues most worth acting on first: the kind's weight, scaled up with severity"""
+    return sorted(
+        issues, key=lambda issue: ISSUE_WEIGHTS.get(issue["pattern"], 0.5) * (1 + issue["severity"]), reverse=True
+    )
+
 
 class AnalysisAgent:
     def __init__(self, llm=None):
         self.llm = llm or LLMInitializer().llm
 
-        # Define performance patterns with tuples of (function, message)
+        # Performance patterns as (value function, threshold, direction, message):
+        # direction -1 flags values below the threshold, 1 values above it.
+        # Undefined rates are None and never match
         self.performance_patterns = {
             "low_ctr": (
-                lambda data: data["clicks"] / data["impressions"] < 0.02,
+                lambda record: record.ctr, 2, -1,
                 "CTR below 2%"
             ),
             "high_cost": (
-                lambda data: data["spend"] / data["clicks"] > 5,
+                lambda record: record.cost_per_click, 5, 1,
                 "Cost per click above $5"
             ),
             "low_roi": (
-                lambda data: (data["revenue"] - data["spend"]) / data["spend"] < 1,
+                lambda record: record.roi, 100, -1,
                 "ROI below 100%"
             ),
             "low_conversion": (
-                lambda data: data["conversions"] / data["clicks"] < 0.05,
+                lambda record: record.conversion_rate, 5, -1,
                 "Conversion rate below 5%"
+            ),
+            # Trend patterns only apply when daily data is available
+            "declining_ctr": (
+                lambda record: record["trends"]["week_over_week"]["ctr"], -0.15, -1,
+                "CTR down more than 15% week over week"
+            ),
+            "declining_conversions": (
+                lambda record: record["trends"]["week_over_week"]["conversions"], -0.2, -1,
+                "Conversions down more than 20% week over week"
+            ),
+            "rising_cpc": (
+                lambda record: record["trends"]["week_over_week"]["cost_per_click"], 0.2, 1,
+                "Cost per click up more than 20% week over week"
             )
         }
 
+        # Fixed thresholds that give way to portfolio percentiles when the
+        # campaign's vertical (or the whole portfolio) has enough campaigns
+        self.benchmark_metrics = {
+            "low_ctr": "ctr",
+            "high_cost": "cost_per_click",
+            "low_roi": "roi",
+            "low_conversion": "conversion_rate",
+        }
+
         # Create Tool instances
         self.analyze_metrics_tool = Tool(
             name="analyze_metrics",
@@ -40,55 +92,111 @@ class AnalysisAgent:
             func=self._detect_patterns
         )
 
-    def _detect_patterns(self, campaign_data: Dict) -> List[str]:
+    def _detect_patterns(self, campaign_data: CampaignRecord) -> List[str]:
         """Internal method to detect patterns"""
+        return [issue["message"] for issue in self.detect_issues(campaign_data)]
+
+    def detect_issues(self, campaign_data: CampaignRecord) -> List[Dict]:
+        """
+        Detected issues with the pattern and metric behind each and a severity
+        from 0 to 1: how far past its threshold the value is, or how close to
+        the bottom of its benchmark segment
+        """
+        campaign_data = as_record(campaign_data)
         issues = []
-        for pattern_name, (check_fn, message) in self.performance_patterns.items():
+        benchmarks = campaign_data.get("benchmarks") or {}
+        for pattern_name, (value_fn, threshold, direction, message) in self.performance_patterns.items():
+            metric = self.benchmark_metrics.get(pattern_name)
+            if metric in benchmarks:
+                comparison = benchmarks[metric]
+                if comparison["adverse"]:
+                    # Distance from the median toward the adverse end of the segment
+                    distance = comparison["percentile"] - 50 if TRACKED_METRICS[metric][3] > 0 else 50 - comparison["percentile"]
+                    issues.append({
+                        "pattern": pattern_name,
+                        "metric": metric,
+                        "message": describe_benchmark(metric, comparison),
+                        "severity": min(max(distance / 50, 0.0), 1.0)
+                    })
+                continue
             try:
-                if check_fn(campaign_data):
-                    issues.append(message)
-            except (KeyError, ZeroDivisionError):
+                value = value_fn(campaign_data)
+            except (KeyError, TypeError, ZeroDivisionError):
                 continue
+            if value is not None and (value - threshold) * direction > 0:
+                issues.append({
+                    "pattern": pattern_name,
+                    "metric": metric,
+                    "message": message,
+                    "severity": min(abs(value - threshold) / abs(threshold), 1.0)
+                })
+
+        # Streaming anomaly alerts that broke from the campaign's own baseline,
+        # keeping only the latest adverse alert per metric
+        latest_alerts = {}
+        for alert in campaign_data.get("anomalies", []):
+            if alert.get("adverse"):
+                latest_alerts[alert["metric"]] = alert
+        for alert in latest_alerts.values():
+            issues.append({
+                "pattern": "anomaly",
+                "metric": alert["metric"],
+                "message": f"Anomaly on {alert['day']}: {alert['message']}",
+                "severity": 0.5
+            })
         return issues
 
-    def _analyze_metrics(self, campaign_data: Dict) -> Dict:
-        """Internal method to analyze metrics"""
+    def _analyze_metrics(self, campaign_data: CampaignRecord) -> Dict:
+        """Internal method to analyze metrics, including gaps to the campaign's targets"""
         try:
-            metrics = {
-                "ctr": (campaign_data["clicks"] / campaign_data["impressions"]) * 100,
-                "conversion_rate": (campaign_data["conversions"] / campaign_data["clicks"]) * 100,
-                "cost_per_click": campaign_data["spend"] / campaign_data["clicks"],
-                "cost_per_conversion": campaign_data["spend"] / campaign_data["conversions"],
-                "roi": ((campaign_data["revenue"] - campaign_data["spend"]) / campaign_data["spend"]) * 100
-            }
-
-            # Compare with targets if available
-            if "target_ctr" in campaign_data:
-                metrics["ctr_vs_target"] = metrics["ctr"] - (campaign_data["target_ctr"] * 100)
-            if "target_roi" in campaign_data:
-                metrics["roi_vs_target"] = metrics["roi"] - (campaign_data["target_roi"] * 100)
-
-            return metrics
-        except (KeyError, ZeroDivisionError) as e:
+            return as_record(campaign_data).metrics
+        except ValueError as e:
             raise ValueError(f"Error calculating metrics: {str(e)}")
 
-    def analyze_campaign(self, campaign_data: Dict) -> Dict:
+    def _format_trends(self, trends: Optional[Dict]) -> str:
+        """Internal method to describe rolling windows and week-over-week changes"""
+        if not trends:
+            return "No daily data available."
+
+        def fmt(value, suffix=""):
+            return "n/a" if value is None else f"{value:,.2f}{suffix}"
+
+        lines = [f"As of {trends['as_of']}:"]
+        for window in ("last_7d", "last_28d"):
+            w = trends[window]
+            lines.append(
+                f"- {window}: CTR {fmt(w['ctr'], '%')}, conversion rate {fmt(w['conversion_rate'], '%')}, "
+                f"CPC ${fmt(w['cost_per_click'])}, ROI {fmt(w['roi'], '%')}"
+            )
+        wow = trends.get("week_over_week")
+        if wow:
+            changes = ", ".join(
+                f"{key} {fmt(None if wow[key] is None else wow[key] * 100, '%')}"
+                for key in ("clicks", "conversions", "spend", "revenue", "ctr", "conversion_rate", "cost_per_click")
+            )
+            lines.append(f"- Week over week: {changes}, ROI {fmt(wow['roi_points'], ' pts')}")
+        return "\n".join(lines)
+
+    def _format_benchmarks(self, benchmarks: Optional[Dict]) -> str:
+        """Internal method to describe where the campaign sits in the portfolio"""
+        if not benchmarks:
+            return "Not enough comparable campaigns to benchmark against."
+        return "\n".join(f"- {describe_benchmark(metric, comparison)}" for metric, comparison in benchmarks.items())
+
+    def analyze_campaign(self, campaign_data: CampaignRecord) -> Dict:
         """Performs comprehensive campaign analysis"""
         try:
+            campaign_data = as_record(campaign_data)
+
             # Calculate metrics using the tool
             metrics = self.analyze_metrics_tool.invoke({"campaign_data": campaign_data})
 
             # Detect patterns/issues using the tool
             issues = self.detect_patterns_tool.invoke({"campaign_data": campaign_data})
 
-            # Summarize market context if available
-            market_context = ""
-            if "market_context" in campaign_data:
-                if isinstance(campaign_data["market_context"], dict):
-                    market_context = (f"{campaign_data['market_context'].get('trends', '')}\n"
-                                  f"{campaign_data['market_context'].get('background', '')}")
-                else:
-                    market_context = str(campaign_data["market_context"])
+            market_context = self._market_context(campaign_data)
+            trends = self._format_trends(campaign_data.get("trends"))
+            benchmarks = self._format_benchmarks(campaign_data.get("benchmarks"))
 
             # Generate analysis using LLM
             prompt = f"""
@@ -103,22 +211,172 @@ class AnalysisAgent:
             Market Context:
             {market_context}
             
+            Recent Trends:
+            {trends}
+            
+            Portfolio Benchmarks:
+            {benchmarks}
+            
             Provide a detailed analysis focusing on:
             1. Overall performance assessment
             2. Key strengths and weaknesses
             3. Market alignment
             4. Areas needing immediate attention
+            5. Whether recent performance is improving or deteriorating
+            6. How the campaign compares with similar campaigns
             """
 
             response = self.llm.invoke([HumanMessage(content=prompt)])
-
-            return {
-                "metrics": metrics,
-                "issues": issues,
-                "market_context": market_context,
-                "analysis": response.content
-            }
+            return self._result(campaign_data, metrics, issues, market_context, response.content)
 
         except Exception as e:
             print(f"Error in analyze_campaign: {str(e)}")
             raise
+
+    def scan_portfolio(self,
+                       campaigns: List[Dict],
+                       top_n: int = 10,
+                       executor: Optional[ShardedExecutor] = None) -> Dict:
+        """
+        Metrics and threshold issues for every campaign at once, sharded over
+        worker processes for large portfolios. Only the fixed thresholds and
+        target gaps apply here, not benchmark percentiles or trends. Returns
+        how many campaigns each issue affects and the top_n campaigns with
+        the most severe issues.
+        """
+        patterns = {
+            pattern: (metric, *self.performance_patterns[pattern][1:3])
+            for pattern, metric in self.benchmark_metrics.items()
+        }
+        metrics, severity, counts = portfolio_issues(portfolio_columns(campaigns), patterns, executor)
+        names = list(counts)
+        weights = np.array([ISSUE_WEIGHTS.get(name, 0.5) for name in names])
+        # Ranked as rank_issues ranks a campaign's own issues, summed over them
+        scores = ((severity > 0) * weights * (1 + severity)).sum(axis=1)
+        top = [i for i in np.argsort(-scores, kind="stable")[:top_n] if scores[i] > 0]
+        return {
+            "campaigns": len(campaigns),
+            "issue_counts": counts,
+            "top": [
+                {
+                    "campaign_id": campaigns[i].get("campaign_id"),
+                    "name": campaigns[i].get("name"),
+                    "score": float(scores[i]),
+                    "issues": {name: float(severity[i, j]) for j, name in enumerate(names) if severity[i, j] > 0},
+                    "metrics": {
+                        metric: float(metrics[i, j]) for j, metric in enumerate(METRIC_COLUMNS) if not np.isnan(metrics[i, j])
+                    }
+                }
+                for i in top
+            ]
+        }
+
+    def target_gaps(self, campaign_data: CampaignRecord) -> List[Dict]:
+        """Shortfalls against the campaign's own CTR and ROI targets, shaped like detected issues"""
+        campaign_data = as_record(campaign_data)
+        metrics = campaign_data.metrics
+        gaps = []
+        for metric, target in (("ctr", campaign_data.target_ctr), ("roi", campaign_data.target_roi)):
+            gap = metrics.get(f"{metric}_vs_target")
+            if gap is None or gap >= 0:
+                continue
+            gaps.append({
+                "pattern": f"{metric}_below_target",
+                "metric": metric,
+                "message": (f"{METRIC_LABELS[metric]} {format_metric(metric, metrics[metric])} is {-gap:.2f} pts "
+                            f"below the {format_metric(metric, target * 100)} target"),
+                "severity": min(-gap / (target * 100), 1.0) if target else 1.0
+            })
+        return gaps
+
+    def _strengths(self, campaign_data: CampaignRecord) -> List[str]:
+        """Rate metrics in the best quarter of their benchmark segment, or clear of their fixed threshold"""
+        benchmarks = campaign_data.get("benchmarks") or {}
+        thresholds = {metric: self.performance_patterns[pattern] for pattern, metric in self.benchmark_metrics.items()}
+        strengths = []
+        for metric, value in campaign_data.rates.items():
+            if metric in benchmarks:
+                percentile = benchmarks[metric]["percentile"]
+                if (percentile <= 25) if TRACKED_METRICS[metric][3] > 0 else (percentile >= 75):
+                    strengths.append(describe_benchmark(metric, benchmarks[metric]))
+            elif metric in thresholds:
+                _, threshold, direction, _ = thresholds[metric]
+                if (value - threshold) * direction < 0:
+                    side = "above" if direction < 0 else "below"
+                    strengths.append(
+                        f"{METRIC_LABELS[metric]} {format_metric(metric, value)} ({side} {format_metric(metric, threshold)})"
+                    )
+        return strengths
+
+    @staticmethod
+    def _trend_direction(trends: Optional[Dict]) -> Optional[str]:
+        """'improving', 'deteriorating' or 'stable' from week-over-week ROI and conversions"""
+        wow = (trends or {}).get("week_over_week")
+        if not wow:
+            return None
+        roi_points, conversions = wow.get("roi_points"), wow.get("conversions")
+        if (roi_points is not None and roi_points < -5) or (conversions is not None and conversions < -0.1):
+            return "deteriorating"
+        if (roi_points is not None and roi_points > 5) or (conversions is not None and conversions > 0.1):
+            return "improving"
+        return "stable"
+
+    def rule_based_analysis(self, campaign_data: CampaignRecord) -> Dict:
+        """
+        The same analysis, with its text built by templates from the computed
+        metrics, detected issues and target gaps instead of an LLM call. It is
+        deterministic and takes milliseconds.
+        """
+        campaign_data = as_record(campaign_data)
+        metrics = self._analyze_metrics(campaign_data)
+        detected = self.detect_issues(campaign_data)
+        ranked = rank_issues(detected + self.target_gaps(campaign_data))
+
+        roi = "n/a" if metrics.get("roi") is None else f"{metrics['roi']:.1f}%"
+        sections = [
+            f"Overall: {campaign_data.name} returned ${campaign_data.revenue:,.2f} on ${campaign_data.spend:,.2f} "
+            f"of spend (ROI {roi}); "
+            + (f"{len(ranked)} issue{'s' if len(ranked) != 1 else ''} need attention." if ranked
+               else "no metric is past its threshold, benchmark or target.")
+        ]
+        strengths = self._strengths(campaign_data)
+        sections.append("Strengths: " + ("; ".join(strengths) if strengths else "none stand out") + ".")
+        if ranked:
+            sections.append("Weaknesses: " + "; ".join(issue["message"] for issue in ranked) + ".")
+        direction = self._trend_direction(campaign_data.get("trends"))
+        if direction:
+            wow = campaign_data["trends"]["week_over_week"]
+            changes = [f"ROI {wow['roi_points']:+.1f} pts"] if wow.get("roi_points") is not None else []
+            changes += [
+                f"{label} {wow[key] * 100:+.0f}%"
+                for key, label in (("conversions", "conversions"), ("ctr", "CTR"), ("spend", "spend"))
+                if wow.get(key) is not None
+            ]
+            sections.append(f"Recent trend: {direction} week over week ({', '.join(changes)}).")
+        if ranked:
+            sections.append(f"Immediate attention: {ranked[0]['message']}.")
+
+        issues = [issue["message"] for issue in detected]
+        return self._result(campaign_data, metrics, issues, self._market_context(campaign_data), "\n".join(sections))
+
+    @staticmethod
+    def _market_context(campaign_data: CampaignRecord) -> str:
+        """Summarize market context if available"""
+        if "market_context" not in campaign_data:
+            return ""
+        if isinstance(campaign_data["market_context"], dict):
+            return (f"{campaign_data['market_context'].get('trends', '')}\n"
+                    f"{campaign_data['market_context'].get('background', '')}")
+        return str(campaign_data["market_context"])
+
+    @staticmethod
+    def _result(campaign_data: CampaignRecord, metrics: Dict, issues: List[str], market_context: str, analysis: str) -> Dict:
+        return {
+            "metrics": metrics,
+            "issues": issues,
+            "market_context": market_context,
+            "trends": campaign_data.get("trends"),
+            "anomalies": campaign_data.get("anomalies", []),
+            "benchmarks": campaign_data.get("benchmarks", {}),
+            "analysis": analysis
+        }
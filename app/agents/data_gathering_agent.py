@@ -1,12 +1,24 @@
-import json
-from typing import Dict, Optional
+import os
+from typing import Optional
 from langchain_core.tools import Tool
 import wikipedia
-from pathlib import Path
+from app.utils.campaign_record import CampaignRecord
+from app.utils.campaign_store import CampaignStore
+from app.utils.deadline import DeadlineExceeded, call_with_deadline, enrichment_allowed, enrichment_min_seconds
+from app.utils.knowledge_index import DEFAULT_TOKEN_BUDGET, KnowledgeIndex, default_knowledge_index
+from app.utils.timeseries import TimeSeriesStore
+from app.utils.verticals import VerticalClassifier, default_classifier
 
 class DataGatheringAgent:
-    def __init__(self):
-        self.campaign_data_path = Path(__file__).parent.parent / "data" / "campaign_data.json"
+    def __init__(self,
+                 campaign_store: Optional[CampaignStore] = None,
+                 timeseries_store: Optional[TimeSeriesStore] = None,
+                 vertical_classifier: Optional[VerticalClassifier] = None,
+                 knowledge_index: Optional[KnowledgeIndex] = None):
+        self.campaign_store = campaign_store or CampaignStore()
+        self.timeseries_store = timeseries_store or TimeSeriesStore()
+        self.vertical_classifier = vertical_classifier or default_classifier()
+        self.knowledge_index = knowledge_index or default_knowledge_index()
 
         # Create all tools with proper binding
         self.load_campaign_data_tool = Tool(
@@ -27,63 +39,98 @@ class DataGatheringAgent:
             description="Fetches relevant information from Wikipedia"
         )
 
-    def _load_campaign_data(self, campaign_id: Optional[str] = None) -> Dict:
-        """Internal method to load campaign data"""
+    def _load_campaign_data(self, campaign_id: Optional[str] = None) -> CampaignRecord:
+        """Internal method to load campaign data as a validated record"""
         try:
-            with open(self.campaign_data_path, 'r') as f:
-                data = json.load(f)
-                if campaign_id and data.get('campaign_id') != campaign_id:
-                    raise ValueError(f"Campaign {campaign_id} not found")
-                return data
+            campaign_id = campaign_id or self.campaign_store.default_campaign_id
+            data = self.campaign_store.get(campaign_id)
+            if data is None:
+                raise ValueError(f"Campaign {campaign_id} not found")
+
+            # Rolling daily trends, when per-day rows exist for the campaign
+            trends = self.timeseries_store.trends(campaign_id)
+            if trends:
+                data["trends"] = trends
+                data["anomalies"] = self.timeseries_store.anomalies(campaign_id)
+
+            # Where the campaign sits within its vertical across the portfolio
+            benchmarks = self.campaign_store.benchmarks.compare(data)
+            if benchmarks:
+                data["benchmarks"] = benchmarks
+            return CampaignRecord.from_dict(data)
         except Exception as e:
             raise ValueError(f"Error loading campaign data: {str(e)}")
 
-    def _get_wikipedia_info(self, topic: str) -> str:
-        """Internal method to fetch Wikipedia information"""
+    def _get_wikipedia_info(self, topic: str) -> Optional[str]:
+        """
+        Internal method to fetch background information, from the local
+        knowledge index first. Returns None when the live lookup is skipped
+        or cut short to meet the request deadline.
+        """
+        if self.knowledge_index is not None:
+            passages = self.knowledge_index.lookup(
+                topic, token_budget=int(os.getenv("KNOWLEDGE_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+            )
+            if passages:
+                return passages
+
+        # Set KNOWLEDGE_OFFLINE=1 where live Wikipedia is unreachable
+        if os.getenv("KNOWLEDGE_OFFLINE") == "1":
+            return f"No background information found for {topic}"
+
+        # wikipedia requests have no timeout, so the lookup is bounded by the request deadline
+        if not enrichment_allowed():
+            return None
         try:
             print(f"Performing search for information from Wikipedia.")
-            search_results = wikipedia.search(topic, results=1)
-            if not search_results:
-                return f"No Wikipedia information found for {topic}"
-
-            page = wikipedia.page(search_results[0])
-            return page.summary
+            return call_with_deadline(self._fetch_wikipedia_summary, topic, reserve=enrichment_min_seconds())
+        except DeadlineExceeded:
+            return None
         except Exception as e:
             return f"Error fetching Wikipedia info: {str(e)}"
 
+    @staticmethod
+    def _fetch_wikipedia_summary(topic: str) -> str:
+        search_results = wikipedia.search(topic, results=1)
+        if not search_results:
+            return f"No Wikipedia information found for {topic}"
+
+        page = wikipedia.page(search_results[0])
+        return page.summary
+
     def _search_market_trends(self, keyword: str) -> str:
         """Internal method to search market trends"""
-        mock_trends = {
-            "fintech": "Growing adoption of digital payments, rise in mobile banking",
-            "ecommerce": "Increased mobile shopping, social commerce growth",
-            "digital marketing": "Focus on personalization, rise of video content",
-            "social media": "Short-form video dominance, increased ad spend",
-        }
-        return mock_trends.get(keyword.lower(), "No trend data available")
-
-    def gather_campaign_context(self, campaign_id: str):
-        """Gathers all relevant context for a campaign"""
+        return self.vertical_classifier.trends(keyword.lower()) or "No trend data available"
+
+    def gather_campaign_context(self, campaign_id: str, background: bool = True) -> CampaignRecord:
+        """Gathers all relevant context for a campaign; background=False leaves out the background research"""
         campaign_data = self.load_campaign_data_tool.invoke({"campaign_id": campaign_id})
 
         # Enrich with market context
         if "name" in campaign_data:
-            campaign_name = campaign_data.get('name').lower()
+            campaign_name = campaign_data.name.lower()
             print(f"🔍 Gathering context for campaign: {campaign_name}")
 
-            if "fintech" in campaign_name:
-                market_trends = self.search_market_trends_tool.invoke({"keyword": "fintech"})
-                wiki_info = self.get_wikipedia_info_tool.invoke({"topic": "Financial technology"})
-            elif "ecommerce" in campaign_name:
-                market_trends = self.search_market_trends_tool.invoke({"keyword": "ecommerce"})
-                wiki_info = self.get_wikipedia_info_tool.invoke({"topic": "E-commerce"})
+            # Weighted verticals from the campaign name and keywords, strongest first
+            verticals = self.vertical_classifier.classify(campaign_data)
+            if len(verticals) == 1:
+                market_trends = self.search_market_trends_tool.invoke({"keyword": verticals[0][0]})
             else:
-                market_trends = self.search_market_trends_tool.invoke({"keyword": "digital marketing"})
-                wiki_info = self.get_wikipedia_info_tool.invoke({"topic": "Digital marketing"})
-
-            # Add context to campaign data
-            campaign_data["market_context"] = {
-                "trends": market_trends,
-                "background": wiki_info
-            }
+                market_trends = "\n".join(
+                    f"{vertical} ({weight:.0%}): {self.search_market_trends_tool.invoke({'keyword': vertical})}"
+                    for vertical, weight in verticals
+                )
+            wiki_info = self.get_wikipedia_info_tool.invoke(
+                {"topic": self.vertical_classifier.topic(verticals[0][0])}
+            ) if background else None
+
+            # Add context to campaign data; background is left out when it was skipped
+            market_context = {"trends": market_trends}
+            if wiki_info is not None:
+                market_context["background"] = wiki_info
+            campaign_data = campaign_data.with_fields(
+                verticals=[{"vertical": vertical, "weight": weight} for vertical, weight in verticals],
+                market_context=market_context
+            )
 
         return campaign_data
@@ -1,27 +1,108 @@
 from datetime import datetime
 from langchain_core.messages import HumanMessage
-from typing import Dict, List
+from typing import Dict, List, Optional
 
+from app.agents.analysis_agent import AnalysisAgent, rank_issues
+from app.utils.anomaly_detector import METRIC_LABELS
+from app.utils.benchmarks import format_comparison
+from app.utils.campaign_record import CampaignRecord, as_record
 from app.utils.conversation_manager import Message, MessageType
 from app.utils.llm import LLMInitializer
 
+# Playbook per detected issue pattern for rule-based recommendations:
+# (action, implementation steps, what-if lever that quotes its impact, timeline)
+RECOMMENDATION_PLAYBOOKS = {
+    "low_roi": (
+        "Shift {name}'s budget from its lowest-returning placements to its best ones",
+        ["Rank ad groups and placements by ROI over the last 28 days",
+         "Cap the bottom quarter and move their budget to the top quarter"],
+        "conversion_rate", "2-4 weeks"
+    ),
+    "roi_below_target": (
+        "Close the ROI gap to target on {name}",
+        ["Lower bids on keywords and audiences returning below the target ROI",
+         "Move the savings to segments converting above the campaign average"],
+        "conversion_rate", "2-4 weeks"
+    ),
+    "low_conversion": (
+        "Improve landing-page conversion for {name}",
+        ["A/B test the landing page headline, form length and call to action",
+         "Check that the ad copy matches the offer on the landing page"],
+        "conversion_rate", "2-3 weeks"
+    ),
+    "declining_conversions": (
+        "Find the cause of falling conversions on {name}",
+        ["Compare this week's traffic sources, devices and landing pages with last week's",
+         "Check conversion tracking and the checkout flow for recent breakages"],
+        "conversion_rate", "1 week"
+    ),
+    "high_cost": (
+        "Bring down cost per click on {name}",
+        ["Add negative keywords for irrelevant search terms",
+         "Move broad-match keywords to phrase or exact match and lower their bids"],
+        "ctr", "1-2 weeks"
+    ),
+    "rising_cpc": (
+        "Contain rising cost per click on {name}",
+        ["Check auction insights for new competitors on the main keywords",
+         "Set bid caps on the keywords whose cost rose most"],
+        None, "1 week"
+    ),
+    "anomaly": (
+        "Investigate the {metric} anomaly on {name}",
+        ["Review changes to bids, creative, targeting and tracking around the day of the anomaly",
+         "Roll back any change that lines up with it"],
+        None, "Immediately"
+    ),
+    "low_ctr": (
+        "Refresh creative and targeting to lift CTR on {name}",
+        ["Test two new headline and visual variants against the current ad",
+         "Narrow targeting to the audiences with above-average CTR"],
+        "ctr", "1-2 weeks"
+    ),
+    "declining_ctr": (
+        "Counter ad fatigue behind the CTR decline on {name}",
+        ["Rotate in fresh creative and lower the frequency cap",
+         "Exclude audiences that have already seen the ad many times"],
+        "ctr", "1 week"
+    ),
+    "ctr_below_target": (
+        "Lift CTR toward target on {name}",
+        ["Test ad copy that leads with the campaign's strongest offer",
+         "Pause the ads with the lowest CTR in each ad group"],
+        "ctr", "2-3 weeks"
+    ),
+}
+
+
 class RecommendationAgent:
     def __init__(self, llm=None):
         self.llm = llm or LLMInitializer().llm
 
     def generate_recommendations(self,
-                                 campaign_data: Dict,
+                                 campaign_data: CampaignRecord,
                                  analysis: Dict,
-                                 conversation_history: List[Message] = None) -> Dict:
+                                 conversation_history: List[Message] = None,
+                                 budget_plan: Optional[Dict] = None,
+                                 what_if: Optional[List[Dict]] = None,
+                                 peers: Optional[List[Dict]] = None,
+                                 comparison: Optional[List[Dict]] = None) -> Dict:
         """
-        Generate or refine recommendations based on campaign data, analysis, and conversation history
+        Generate or refine recommendations based on campaign data, analysis, and conversation history.
+        budget_plan is the BudgetOptimizer output for this campaign and the portfolio, what_if the
+        simulated outcomes of candidate changes and peers the best similar campaigns, if available.
+        comparison holds every campaign's data and analysis when the user compares several.
         """
         try:
             # Customize recommendations considering conversation history
             custom_recs = self._customize_recommendations(
-                campaign_data=campaign_data,
+                campaign_data=as_record(campaign_data),
                 analysis=analysis,
-                conversation_history=conversation_history
+                conversation_history=conversation_history,
+                budget_plan=budget_plan,
+                what_if=what_if,
+                peers=peers,
+                comparison=comparison
             )
 
             # Ensure we have at least some recommendations
@@ -34,9 +115,16 @@ class RecommendationAgent:
                 "timestamp": datetime.now().isoformat(),
                 "context": {
                     "had_previous_interaction": bool(conversation_history),
-                    "issues_addressed": analysis.get("issues", [])
+                    "issues_addressed": analysis.get("issues", []),
+                    "budget_plan": (budget_plan or {}).get("campaign"),
+                    "what_if": what_if or [],
+                    "peers": [peer["campaign_id"] for peer in peers or []],
+                    "compared": [entry["campaign_data"]["campaign_id"] for entry in comparison or []]
                 }
             }
+        except TimeoutError:
+            # Deadline timeouts are left to the caller, which takes a cheaper path
+            raise
         except Exception as e:
             print(f"Error generating recommendations: {str(e)}")
             return {
@@ -46,10 +134,84 @@ class RecommendationAgent:
                 "error": str(e)
             }
 
+    def rule_based_recommendations(self,
+                                   campaign_data: CampaignRecord,
+                                   analysis: Dict,
+                                   budget_plan: Optional[Dict] = None,
+                                   what_if: Optional[List[Dict]] = None) -> Dict:
+        """
+        Recommendations from playbook templates instead of an LLM call: the
+        optimizer's budget move, then one action per metric for the highest
+        ranked detected issues and target gaps, quoting the simulated impact
+        of the matching what-if scenario. Same shape as generate_recommendations.
+        """
+        campaign_data = as_record(campaign_data)
+        analysis_agent = AnalysisAgent(llm=self.llm)
+        ranked = rank_issues(analysis_agent.detect_issues(campaign_data) + analysis_agent.target_gaps(campaign_data))
+
+        actions = []
+        allocation = (budget_plan or {}).get("campaign") or {}
+        if allocation.get("spend_change_pct"):
+            impact = self._rule_impact(what_if, "spend")
+            if allocation.get("expected_roi") is not None:
+                impact += f", for an expected ROI of {allocation['expected_roi']:,.1f}%"
+            actions.append("\n".join([
+                f"Move spend from ${allocation['current_spend']:,.2f} to ${allocation['recommended_spend']:,.2f} "
+                f"({allocation['spend_change_pct']:+.1f}%) as the budget optimizer suggests",
+                f"- Change the daily budget by {allocation['spend_change_pct']:+.1f}% and hold it for two weeks",
+                f"- Expected impact: {impact}",
+                "- Timeline: 1-2 weeks"
+            ]))
+
+        covered = set()
+        for issue in ranked:
+            key = issue["metric"] or issue["pattern"]
+            playbook = RECOMMENDATION_PLAYBOOKS.get(issue["pattern"])
+            if key in covered or not playbook:
+                continue
+            covered.add(key)
+            action, steps, lever, timeline = playbook
+            metric_label = METRIC_LABELS.get(issue["metric"], "metric")
+            actions.append("\n".join([
+                f"{action.format(name=campaign_data.name, metric=metric_label)} ({issue['message']})",
+                *(f"- {step}" for step in steps),
+                f"- Expected impact: {self._rule_impact(what_if, lever)}",
+                f"- Timeline: {timeline}"
+            ]))
+        if not actions:
+            actions = [f"Keep {campaign_data.name} running as is; no metric is past its threshold, benchmark or target"]
+
+        return {
+            "recommendations": [f"Priority #{rank}: {action}" for rank, action in enumerate(actions[:3], start=1)],
+            "template_used": True,
+            "timestamp": datetime.now().isoformat(),
+            "context": {
+                "had_previous_interaction": False,
+                "issues_addressed": analysis.get("issues", []),
+                "budget_plan": allocation or None,
+                "what_if": what_if or []
+            }
+        }
+
+    @staticmethod
+    def _rule_impact(what_if: Optional[List[Dict]], lever: Optional[str]) -> str:
+        """Simulated revenue and ROI change of the what-if scenario that moves only this lever"""
+        for result in what_if or []:
+            moved = [name for name, change in result["scenario"].items() if change]
+            if lever and moved == [lever]:
+                change, roi_change = result["revenue_change"], result["roi_change"]
+                return (f"revenue change ${change['p50']:,.0f} (${change['p5']:,.0f} to ${change['p95']:,.0f}) and "
+                        f"ROI change {roi_change['p50']:+.1f} pts, as simulated for {result['label']}")
+        return "not simulated; track the metric week over week"
+
     def _customize_recommendations(self,
-                                   campaign_data: Dict,
+                                   campaign_data: CampaignRecord,
                                    analysis: Dict,
-                                   conversation_history: List[Message] = None):
+                                   conversation_history: List[Message] = None,
+                                   budget_plan: Optional[Dict] = None,
+                                   what_if: Optional[List[Dict]] = None,
+                                   peers: Optional[List[Dict]] = None,
+                                   comparison: Optional[List[Dict]] = None):
         """
         Customize recommendations considering conversation history and user preferences
         """
@@ -57,10 +219,9 @@ class RecommendationAgent:
             # Format conversation context
             conversation_context = self._format_conversation_history(conversation_history)
 
-            # Safely extract values with default fallbacks
-            campaign_name = campaign_data.get('name', 'Unknown')
-            campaign_spend = campaign_data.get('spend', 0)
-            campaign_revenue = campaign_data.get('revenue', 0)
+            campaign_name = campaign_data.name
+            campaign_spend = campaign_data.spend
+            campaign_revenue = campaign_data.revenue
 
             # Safely extract analysis data
             analysis_summary = analysis.get('analysis', '')
@@ -87,6 +248,18 @@ class RecommendationAgent:
             Market Context:
             {market_trends}
             
+            Similar Campaigns (best performers first):
+            {self._format_peers(peers)}
+            
+            Budget Optimizer Output:
+            {self._format_budget_plan(budget_plan)}
+            
+            Simulated Impact (Monte Carlo, 90% intervals):
+            {self._format_what_if(what_if)}
+            
+            Compared Campaigns:
+            {format_comparison(comparison) if comparison else "The user asked about this campaign only."}
+            
             """
 
             prompt = f"""
@@ -102,6 +275,12 @@ class RecommendationAgent:
             - Implementation timeline
             
             Note: Consider any specific requests or preferences mentioned in the conversation.
+            Where a similar campaign outperforms this one, point to what it does differently.
+            Any budget or spend change you recommend must use the figures from the Budget Optimizer
+            Output above; explain them rather than proposing different numbers. Quote expected impact
+            from the Simulated Impact ranges where a recommendation matches one of the scenarios.
+            If several campaigns are compared, contrast them, name the campaign each recommendation
+            is for, and keep in mind that the optimizer and simulation figures are for {campaign_name} only.
             """
 
             print("Making call to the LLM for recommendations...")
@@ -117,8 +296,70 @@ class RecommendationAgent:
                     return recommendations
 
         except Exception as e:
+            # Surfaces as the error of the result, so the caller can fall back to rule-based recommendations
             print(f"Error in customizing recommendations: {str(e)}")
-            return ["1. Review and optimize campaign settings for better performance."]
+            raise
+
+    def _format_budget_plan(self, budget_plan: Optional[Dict]) -> str:
+        """Format the optimizer's reallocation for this campaign and the portfolio"""
+        if not budget_plan or not budget_plan.get("campaign"):
+            return "No budget optimization available."
+
+        def money(value):
+            return "n/a" if value is None else f"${value:,.2f}"
+
+        def pct(value):
+            return "n/a" if value is None else f"{value:,.1f}%"
+
+        campaign, portfolio = budget_plan["campaign"], budget_plan.get("portfolio") or {}
+        lines = [
+            f"- This campaign: spend {money(campaign['current_spend'])} -> {money(campaign['recommended_spend'])} "
+            f"({pct(campaign['spend_change_pct'])}), expected revenue {money(campaign['current_revenue'])} -> "
+            f"{money(campaign['expected_revenue'])}, expected ROI {pct(campaign['expected_roi'])}, "
+            f"marginal revenue per extra dollar {money(campaign['marginal_revenue_per_dollar'])}"
+        ]
+        if portfolio:
+            lines.append(
+                f"- Portfolio ({portfolio['campaigns']} campaigns, objective: {portfolio['objective']}): "
+                f"spend {money(portfolio['current_spend'])} -> {money(portfolio['recommended_spend'])}, "
+                f"revenue {money(portfolio['current_revenue'])} -> {money(portfolio['expected_revenue'])}"
+            )
+            for move in portfolio.get("largest_moves", []):
+                lines.append(
+                    f"  - {move['name']}: {money(move['current_spend'])} -> {money(move['recommended_spend'])}"
+                )
+        return "\n".join(lines)
+
+    def _format_peers(self, peers: Optional[List[Dict]]) -> str:
+        """Format similar campaigns with their key rates"""
+        if not peers:
+            return "No similar campaigns found."
+
+        def fmt(value, template):
+            return "n/a" if value is None else template.format(value)
+
+        return "\n".join(
+            f"- {peer['name']} ({peer['vertical']}, similarity {peer['similarity']:.2f}): "
+            f"CTR {fmt(peer.get('ctr'), '{:.2f}%')}, conversion rate {fmt(peer.get('conversion_rate'), '{:.2f}%')}, "
+            f"CPC {fmt(peer.get('cost_per_click'), '${:,.2f}')}, ROI {fmt(peer.get('roi'), '{:,.1f}%')}, "
+            f"spend ${peer['spend']:,.0f}"
+            for peer in peers
+        )
+
+    def _format_what_if(self, what_if: Optional[List[Dict]]) -> str:
+        """Format simulated revenue and ROI ranges per scenario"""
+        if not what_if:
+            return "No simulations available."
+        lines = []
+        for result in what_if:
+            change, roi_change = result["revenue_change"], result["roi_change"]
+            lines.append(
+                f"- {result['label']}: revenue change ${change['p50']:,.0f} "
+                f"(${change['p5']:,.0f} to ${change['p95']:,.0f}), ROI change {roi_change['p50']:+.1f} pts "
+                f"({roi_change['p5']:+.1f} to {roi_change['p95']:+.1f}), "
+                f"P(revenue up) {result['probability_revenue_increase']:.0%}"
+            )
+        return "\n".join(lines)
 
     def _format_conversation_history(self, history: List[Message]) -> str:
         """Format conversation history into useful context"""
@@ -1,6 +1,8 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 from langchain_core.messages import HumanMessage
+from app.utils.benchmarks import format_comparison
+from app.utils.campaign_record import CampaignRecord, as_record
 from app.utils.llm import LLMInitializer
 from app.utils.conversation_manager import Message, MessageType
 
@@ -9,11 +11,14 @@ class SummaryAgent:
         self.llm = llm or LLMInitializer().llm
 
     def generate_summary(self,
-                         campaign_data: Dict,
+                         campaign_data: CampaignRecord,
                          analysis_results: Dict,
-                         conversation_history: List[Message] = None) -> Dict:
+                         conversation_history: List[Message] = None,
+                         comparison: Optional[List[Dict]] = None) -> Dict:
         """
-        Generate a summary based on campaign data, analysis, and conversation history
+        Generate a summary based on campaign data, analysis, and conversation history.
+        With comparison (every compared campaign's data and analysis) the summary
+        contrasts the campaigns instead.
         """
         try:
             # Format conversation context
@@ -21,22 +26,28 @@ class SummaryAgent:
 
             # Prepare context
             context = self._prepare_summary_context(
-                campaign_data=campaign_data,
+                campaign_data=as_record(campaign_data),
                 analysis_results=analysis_results,
                 conversation_context=conversation_context
             )
+            if comparison:
+                context += self._format_comparison_context(comparison)
 
             # Generate summary
-            summary = self._generate_summary_content(context)
+            summary = self._generate_summary_content(context, compare=bool(comparison))
 
             return {
                 "content": summary,
                 "timestamp": datetime.now().isoformat(),
                 "context": {
-                    "had_previous_interaction": bool(conversation_history)
+                    "had_previous_interaction": bool(conversation_history),
+                    "compared": [entry["campaign_data"]["campaign_id"] for entry in comparison or []]
                 }
             }
 
+        except TimeoutError:
+            # Deadline timeouts are left to the caller, which takes a cheaper path
+            raise
         except Exception as e:
             print(f"Error generating summary: {str(e)}")
             print(f"Full error details: ", e)
@@ -45,6 +56,28 @@ class SummaryAgent:
                 "error": str(e)
             }
 
+    def rule_based_summary(self,
+                           campaign_data: CampaignRecord,
+                           analysis_results: Dict,
+                           comparison: Optional[List[Dict]] = None) -> Dict:
+        """A summary made of the analysis text itself, one section per compared campaign, without an LLM call"""
+        campaign_data = as_record(campaign_data)
+        if comparison:
+            content = "\n\n".join(
+                f"{entry['campaign_data']['name']}:\n{entry['analysis'].get('analysis', 'No analysis available.')}"
+                for entry in comparison
+            )
+        else:
+            content = analysis_results.get("analysis") or f"No analysis available for {campaign_data.name}."
+        return {
+            "content": content,
+            "timestamp": datetime.now().isoformat(),
+            "context": {
+                "had_previous_interaction": False,
+                "compared": [entry["campaign_data"]["campaign_id"] for entry in comparison or []]
+            }
+        }
+
     def _format_conversation_history(self, history: List[Message]) -> str:
         """Format conversation history into useful context"""
         if not history:
@@ -60,7 +93,7 @@ class SummaryAgent:
         return "\n".join(relevant_interactions)
 
     def _prepare_summary_context(self,
-                                 campaign_data: Dict,
+                                 campaign_data: CampaignRecord,
                                  analysis_results: Dict,
                                  conversation_context: str) -> str:
         """Prepare context for summary generation"""
@@ -72,19 +105,16 @@ class SummaryAgent:
             elif isinstance(analysis_results.get('market_context'), str):
                 market_context = analysis_results['market_context']
 
-            # Calculate CTR safely
-            impressions = campaign_data.get('impressions', 0)
-            clicks = campaign_data.get('clicks', 0)
-            ctr = (clicks / impressions * 100) if impressions > 0 else 0
+            ctr = "n/a" if campaign_data.ctr is None else f"{campaign_data.ctr:.2f}%"
 
             context = f"""
             Campaign Information:
-            - Name: {campaign_data.get('name', 'Unknown Campaign')}
+            - Name: {campaign_data.name}
             - Performance Metrics:
-              * Spend: ${campaign_data.get('spend', 0):,.2f}
-              * Revenue: ${campaign_data.get('revenue', 0):,.2f}
-              * CTR: {ctr:.2f}%
-              * Conversions: {campaign_data.get('conversions', 0)}
+              * Spend: ${campaign_data.spend:,.2f}
+              * Revenue: ${campaign_data.revenue:,.2f}
+              * CTR: {ctr}
+              * Conversions: {campaign_data.conversions}
 
             Analysis Results:
             {analysis_results.get('analysis', 'No analysis available')}
@@ -103,15 +133,34 @@ class SummaryAgent:
             # Return a basic context if there's an error
             return f"""
             Campaign Information:
-            - Name: {campaign_data.get('name', 'Unknown Campaign')}
+            - Name: {campaign_data.name}
             
             Recent Conversation History:
             {conversation_context}
             """
 
-    def _generate_summary_content(self, context: str) -> str:
+    def _format_comparison_context(self, comparison: List[Dict]) -> str:
+        """Every compared campaign's metrics and the first lines of its analysis"""
+        analyses = "\n".join(
+            f"- {entry['campaign_data'].get('name') or entry['campaign_data']['campaign_id']}: "
+            f"{(entry.get('analysis') or {}).get('analysis', 'No analysis available')[:400]}"
+            for entry in comparison
+        )
+        return f"""
+            Compared Campaigns:
+            {format_comparison(comparison)}
+
+            Analysis per Campaign:
+            {analyses}
+            """
+
+    def _generate_summary_content(self, context: str, compare: bool = False) -> str:
         """Generate the actual summary content"""
         try:
+            comparison_point = (
+                "5. How the compared campaigns differ and which is performing best, with the metrics that show it"
+                if compare else ""
+            )
             prompt = f"""
             Based on the following campaign context:
             {context}
@@ -121,6 +170,7 @@ class SummaryAgent:
             2. Main insights from the analysis
             3. Critical areas requiring attention
             4. Market context relevance
+            {comparison_point}
 
             Format the summary in clear, actionable paragraphs.
             """
@@ -134,5 +184,6 @@ class SummaryAgent:
             raise ValueError("No valid response from LLM")
 
         except Exception as e:
+            # Surfaces as the error of the summary, so the caller can fall back to the rule-based one
             print(f"Error generating summary content: {str(e)}")
-            return "Unable to generate summary content due to an error."
+            raise
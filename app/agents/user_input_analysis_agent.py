@@ -1,6 +1,8 @@
+import re
 from enum import Enum
 from typing import Dict
 from langchain_core.messages import HumanMessage
+from app.utils.deadline import note_degraded
 from app.utils.llm import LLMInitializer
 
 class UserInputType(Enum):
@@ -9,6 +11,17 @@ class UserInputType(Enum):
     OTHER = "OTHER"
     DONE = "DONE"
 
+# Keyword rules used when there is no time to ask the LLM, checked in order. DONE only matches
+# a message that is nothing but a farewell, so "thanks, now what should I fix?" is not one
+KEYWORD_RULES = (
+    (UserInputType.RECOMMENDATION, re.compile(r"\b(recommend\w*|improve\w*|should|optimi[sz]\w*|fix|suggest\w*)\b")),
+    (UserInputType.SUMMARY, re.compile(r"\b(summar\w*|overview|report|status|how (is|are|did)|perform\w*)\b")),
+    (UserInputType.DONE, re.compile(
+        r"^\s*(?:\b(?:ok(?:ay)?|great|perfect|cheers|thanks|thank you|bye|goodbye|that's all|that is all"
+        r"|i'm done|done|quit|exit)\b\W*)+$"
+    )),
+)
+
 class UserInputAnalysisAgent:
     def __init__(self, llm=None):
         self.llm = llm or LLMInitializer().llm
@@ -46,7 +59,12 @@ class UserInputAnalysisAgent:
         """
 
         print("🤖 Analyzing user input...")
-        response = self.llm.invoke([HumanMessage(content=prompt.format(input=user_input))])
+        try:
+            response = self.llm.invoke([HumanMessage(content=prompt.format(input=user_input))])
+        except Exception as e:
+            # Out of time for the LLM, or the LLM failed
+            note_degraded("user_input_type", f"classified by keywords ({str(e)})")
+            return self.classify_by_keywords(user_input)
 
         try:
             # Parse LLM response
@@ -77,3 +95,23 @@ class UserInputAnalysisAgent:
                 "explanation": f"Error in classification: {str(e)}",
                 "original_input": user_input
             }
+
+    @staticmethod
+    def classify_by_keywords(user_input: str) -> Dict:
+        """Classify without the LLM; anything unmatched gets recommendations, as the workflow does by default"""
+        text = user_input.lower()
+        for input_type, pattern in KEYWORD_RULES:
+            match = pattern.search(text)
+            if match:
+                return {
+                    "type": input_type,
+                    "confidence": 0.5,
+                    "explanation": f"Matched keyword '{match.group(0)}'",
+                    "original_input": user_input
+                }
+        return {
+            "type": UserInputType.RECOMMENDATION,
+            "confidence": 0.3,
+            "explanation": "No keyword matched",
+            "original_input": user_input
+        }
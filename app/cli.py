@@ -1,12 +1,20 @@
+import argparse
+import contextlib
+import json
+import sys
+from app.services.batch_runner import BatchRunner, InvalidConversationError, read_conversations
 from app.services.interactive_session import InteractiveSession
+from app.utils.results_sink import ResultsSink
 from rich.console import Console
 from rich.markdown import Markdown
 from rich.panel import Panel
 
 console = Console()
+# Batch mode keeps stdout for the NDJSON results
+err_console = Console(stderr=True)
 
-def main():
-    session = InteractiveSession()
+def interactive(results_sink: ResultsSink = None):
+    session = InteractiveSession(results_sink=results_sink)
     session_id = session.start_session()
 
     console.print(Panel.fit(
@@ -57,5 +65,53 @@ def main():
 
     console.print("\n[bold]Session ended[/]")
 
+def batch(source: str, output: str, workers: int, deadline_seconds: float, results_sink: ResultsSink = None):
+    """Run the scripted sessions in source (a JSONL file, or - for stdin) and write NDJSON turn results"""
+    runner = BatchRunner(
+        session=InteractiveSession(prefetch=False, results_sink=results_sink),
+        workers=workers,
+        deadline_seconds=deadline_seconds
+    )
+    infile = sys.stdin if source == "-" else open(source)
+    outfile = sys.stdout if output == "-" else open(output, "w")
+    try:
+        # The agents report progress with print(), which must not end up among the results
+        with contextlib.redirect_stdout(sys.stderr):
+            stats = runner.write_ndjson(read_conversations(infile), outfile)
+    except InvalidConversationError as e:
+        err_console.print(f"[bold red]Error:[/] {str(e)}")
+        sys.exit(1)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    err_console.print(json.dumps(stats, indent=2))
+    if stats["errors"]:
+        sys.exit(2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Campaign analysis chat, interactive or as a headless batch")
+    parser.add_argument("--batch", metavar="FILE", nargs="?", const="-",
+                        help="Run the sessions in a JSONL file (or stdin) instead of the interactive prompt")
+    parser.add_argument("--output", default="-", help="Where batch results go as NDJSON (default stdout)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Sessions run concurrently in batch mode (default BATCH_WORKERS or 8)")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="Per-turn deadline in seconds (default REQUEST_DEADLINE_SECONDS)")
+    parser.add_argument("--results", metavar="DIR", nargs="?", const="",
+                        help="Also append each turn's results to Parquet files in DIR (default RESULTS_DIR)")
+    args = parser.parse_args()
+
+    results_sink = ResultsSink(args.results or None) if args.results is not None else None
+    try:
+        if args.batch is None:
+            interactive(results_sink)
+        else:
+            batch(args.batch, args.output, args.workers, args.deadline, results_sink)
+    finally:
+        if results_sink is not None:
+            results_sink.close()
+
 if __name__ == "__main__":
     main()
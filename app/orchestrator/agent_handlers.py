@@ -1,46 +1,235 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 from app.agents.analysis_agent import AnalysisAgent
 from app.agents.data_gathering_agent import DataGatheringAgent
 from app.agents.recommendation_agent import RecommendationAgent
 from app.agents.summary_agent import SummaryAgent
 from app.agents.user_input_analysis_agent import UserInputAnalysisAgent, UserInputType
-from .states import WorkflowState
+from app.utils.budget_optimizer import BudgetOptimizer
+from app.utils.campaign_record import CampaignRecord
+from app.utils.campaign_store import CampaignStore
+from app.utils.conversation_manager import MessageType
+from app.utils.deadline import deadline_scope, enrichment_allowed, map_in_context, note_degraded, stage_deadline
+from app.utils.result_cache import ResultCache, metric_snapshot
+from app.utils.session_cache import SessionCache
+from app.utils.single_flight import SingleFlight, campaign_fingerprint
+from app.utils.timeseries import TimeSeriesStore
+from app.utils.what_if import STANDARD_SCENARIOS, WhatIfSimulator
+from .states import AnswerTier, WorkflowState
+
+# Campaigns gathered and analyzed side by side in one comparison turn
+MAX_COMPARED_CAMPAIGNS = 5
 
 class AgentHandlers:
-    def __init__(self, llm):
+    def __init__(self, llm, result_cache: Optional[ResultCache] = None):
         self.llm = llm
         self.user_input_agent = UserInputAnalysisAgent(self.llm)
+        self.result_cache = result_cache or ResultCache()
+        self.campaign_store = CampaignStore()
+        self.timeseries_store = TimeSeriesStore()
+        self.budget_optimizer = BudgetOptimizer(self.campaign_store, self.timeseries_store)
+        self.what_if = WhatIfSimulator()
+        self.prefetch_cache = SessionCache(float(os.getenv("PREFETCH_TTL_SECONDS", "300")))
+        self.single_flight = SingleFlight()
 
     def analyze_user_input(self, state: WorkflowState) -> WorkflowState:
         """Analyze user input to determine intent"""
-        analysis_result = self.user_input_agent.analyze_input(state.user_input)
+        if state.tier == AnswerTier.RULES:
+            analysis_result = UserInputAnalysisAgent.classify_by_keywords(state.user_input)
+        else:
+            analysis_result = self.user_input_agent.analyze_input(state.user_input)
         state.user_input_type = analysis_result["type"]
         print(f"📝 User input classified as: {state.user_input_type.value}")
         return state
 
     def gather_data(self, state: WorkflowState) -> WorkflowState:
-        """Gather campaign data"""
-        data_agent = DataGatheringAgent()
-        campaign_id = "CAMPAIGN123"
-        campaign_data = data_agent.gather_campaign_context(campaign_id)
+        """Gather data for every campaign the user asked about, in parallel when there are several"""
+        campaign_ids = self._resolve_campaign_ids(state)
+        background = state.tier == AnswerTier.LLM
+        if len(campaign_ids) == 1:
+            gathered = [self.single_flight.do(*self._gather_call(campaign_ids[0], background))]
+        else:
+            with ThreadPoolExecutor(max_workers=len(campaign_ids)) as pool:
+                gathered = map_in_context(
+                    pool,
+                    lambda campaign_id: self.single_flight.do(*self._gather_call(campaign_id, background)),
+                    campaign_ids
+                )
+        print(f"\n📊 Campaign data gathered.")
+        return self._set_gathered(state, campaign_ids, gathered)
+
+    async def agather_data(self, state: WorkflowState) -> WorkflowState:
+        """Async variant of gather_data that awaits in-flight duplicates"""
+        campaign_ids = self._resolve_campaign_ids(state)
+        background = state.tier == AnswerTier.LLM
+        gathered = await asyncio.gather(*(
+            self.single_flight.do_async(*self._gather_call(campaign_id, background)) for campaign_id in campaign_ids
+        ))
         print(f"\n📊 Campaign data gathered.")
-        state.campaign_data = campaign_data
+        return self._set_gathered(state, campaign_ids, gathered)
+
+    @staticmethod
+    def _set_gathered(state: WorkflowState,
+                      campaign_ids: List[str],
+                      gathered: List[CampaignRecord]) -> WorkflowState:
+        # The rules tier leaves background research out by choice, not to meet the deadline
+        if state.tier == AnswerTier.LLM and any(AgentHandlers._enrichment_skipped(record) for record in gathered):
+            note_degraded("market_context", "background research skipped to meet the deadline")
+        state.campaign_ids = campaign_ids
+        # Records are immutable, so every coalesced caller can share the same one
+        state.campaign_data = gathered[0]
+        state.comparison = (
+            [{"campaign_data": campaign_data} for campaign_data in gathered] if len(gathered) > 1 else None
+        )
         return state
 
+    @staticmethod
+    def _enrichment_skipped(campaign_data: Dict) -> bool:
+        return "market_context" in campaign_data and "background" not in campaign_data["market_context"]
+
+    def _resolve_campaign_ids(self, state: WorkflowState) -> List[str]:
+        """
+        Campaigns named in the user input (by name, ID or a close misspelling).
+        A turn that names none stays on the campaigns of the previous answer,
+        and a new session starts on the default campaign.
+        """
+        context = state.context or {}
+        if context.get("campaign_ids"):
+            return list(context["campaign_ids"])[:MAX_COMPARED_CAMPAIGNS]
+
+        mentions = self.campaign_store.names.resolve(state.user_input or "", limit=MAX_COMPARED_CAMPAIGNS)
+        if mentions:
+            print("🔎 Campaigns mentioned: " + ", ".join(
+                f"{mention['name']} ({mention['campaign_id']})" for mention in mentions
+            ))
+            return [mention["campaign_id"] for mention in mentions]
+
+        for message in reversed(context.get("conversation_history") or []):
+            metadata = message.metadata or {}
+            previous = (
+                (metadata.get("context") or {}).get("campaign_ids")
+                or [(metadata.get("campaign_data") or {}).get("campaign_id")]
+            )
+            previous = [campaign_id for campaign_id in previous if campaign_id in self.campaign_store]
+            if previous:
+                return previous
+        return [self.campaign_store.default_campaign_id]
+
+    def _gather_call(self, campaign_id: str, background: bool = True) -> Tuple:
+        """Single-flight key and callable for gathering a campaign's context"""
+        data_agent = DataGatheringAgent(self.campaign_store, self.timeseries_store)
+        record = self.campaign_store.get(campaign_id) or {"campaign_id": campaign_id}
+        record["trends"] = self.timeseries_store.trends(campaign_id)
+        key = ("gather_data", background, campaign_fingerprint(record))
+        return key, data_agent.gather_campaign_context, campaign_id, background
+
     def analyze_data(self, state: WorkflowState) -> WorkflowState:
-        """Analyze campaign data"""
-        analysis_agent = AnalysisAgent(llm=self.llm)
+        """Analyze campaign data, every compared campaign in parallel"""
         print("📊 Analyzing campaign data with AnalysisAgent...")
 
         if not state.campaign_data:
             raise ValueError("No campaign data to analyze.")
 
-        analysis_result = analysis_agent.analyze_campaign(state.campaign_data)
-        state.analysis_results = analysis_result
-        print("📈 Analysis complete.")
+        if state.tier == AnswerTier.RULES:
+            return self._rule_analyses(state)
+
+        # Analysis leaves part of the deadline for the recommendation or summary step
+        with deadline_scope(stage_deadline()):
+            if state.comparison:
+                with ThreadPoolExecutor(max_workers=len(state.comparison)) as pool:
+                    analyses = map_in_context(pool, self._analyze, [entry["campaign_data"] for entry in state.comparison])
+                return self._set_analyses(state, analyses)
+
+            state.analysis_results = self._analyze(state.campaign_data)
         return state
 
+    async def aanalyze_data(self, state: WorkflowState) -> WorkflowState:
+        """Async variant of analyze_data that awaits in-flight duplicates"""
+        print("📊 Analyzing campaign data with AnalysisAgent...")
+
+        if not state.campaign_data:
+            raise ValueError("No campaign data to analyze.")
+
+        if state.tier == AnswerTier.RULES:
+            return self._rule_analyses(state)
+
+        with deadline_scope(stage_deadline()):
+            if state.comparison:
+                analyses = await asyncio.gather(*(
+                    self._aanalyze(entry["campaign_data"]) for entry in state.comparison
+                ))
+                return self._set_analyses(state, analyses)
+
+            state.analysis_results = await self._aanalyze(state.campaign_data)
+        return state
+
+    def _rule_analyses(self, state: WorkflowState) -> WorkflowState:
+        """Rule-based analysis of every campaign; it takes milliseconds, so neither threads nor the cache are needed"""
+        analysis_agent = AnalysisAgent(llm=self.llm)
+        if state.comparison:
+            return self._set_analyses(
+                state, [analysis_agent.rule_based_analysis(entry["campaign_data"]) for entry in state.comparison]
+            )
+        state.analysis_results = analysis_agent.rule_based_analysis(state.campaign_data)
+        return state
+
+    @staticmethod
+    def _set_analyses(state: WorkflowState, analyses: List[Dict]) -> WorkflowState:
+        state.comparison = [{**entry, "analysis": analysis} for entry, analysis in zip(state.comparison, analyses)]
+        state.analysis_results = analyses[0]
+        return state
+
+    def _analyze(self, campaign_data: Dict) -> Dict:
+        cached = self._cached_analysis(campaign_data)
+        if cached:
+            return cached
+        try:
+            analysis_result = dict(self.single_flight.do(*self._analysis_call(campaign_data)))
+        except Exception as e:
+            return self._degraded_analysis(campaign_data, e)
+        print("📈 Analysis complete.")
+        return analysis_result
+
+    async def _aanalyze(self, campaign_data: Dict) -> Dict:
+        cached = self._cached_analysis(campaign_data)
+        if cached:
+            return cached
+        try:
+            analysis_result = dict(await self.single_flight.do_async(*self._analysis_call(campaign_data)))
+        except Exception as e:
+            return self._degraded_analysis(campaign_data, e)
+        print("📈 Analysis complete.")
+        return analysis_result
+
+    def _degraded_analysis(self, campaign_data: Dict, error: Exception) -> Dict:
+        """Out of time for the LLM, or the LLM failed: the last cached analysis, however stale, or a rule-based one"""
+        stale = self.result_cache.get(campaign_data.get("campaign_id"), "analysis")
+        if stale:
+            note_degraded("analysis", f"reused the analysis cached at {stale['updated_at']} ({str(error)})")
+            return stale["value"]
+        note_degraded("analysis", f"rule-based analysis without the LLM ({str(error)})")
+        return AnalysisAgent(llm=self.llm).rule_based_analysis(campaign_data)
+
+    def _cached_analysis(self, campaign_data: Dict) -> Optional[Dict]:
+        cached = self.result_cache.lookup(campaign_data.get("campaign_id"), "analysis", campaign_data)
+        if cached:
+            print("⚡ Analysis served from cache.")
+        return cached
+
+    def _analysis_call(self, campaign_data: Dict) -> Tuple:
+        """Single-flight key and callable for analyzing a campaign"""
+        def analyze():
+            analysis_result = AnalysisAgent(llm=self.llm).analyze_campaign(campaign_data)
+            # An analysis without the background research is not worth keeping
+            if not self._enrichment_skipped(campaign_data):
+                self.result_cache.put(campaign_data.get("campaign_id"), "analysis", analysis_result, campaign_data)
+            return analysis_result
+
+        return ("analyze_data", campaign_fingerprint(campaign_data)), analyze
+
     def generate_recommendations(self, state: WorkflowState) -> WorkflowState:
         """Generate recommendations"""
         try:
@@ -53,32 +242,46 @@ class AgentHandlers:
             if not state.analysis_results:
                 raise ValueError("Analysis results are missing")
 
-            # Generate recommendations
-            rec_result = recommendation_agent.generate_recommendations(
-                campaign_data=state.campaign_data,
-                analysis=state.analysis_results,
-                conversation_history=state.context.get('conversation_history', [])
-            )
-
-            # Ensure rec_result is not None
-            if not rec_result:
-                raise ValueError("Recommendation generation returned None")
+            if state.tier == AnswerTier.RULES:
+                budget_plan = self._budget_plan(state.campaign_data.get("campaign_id"))
+                what_if = self._what_if(state.campaign_data, budget_plan)
+                rec_result = recommendation_agent.rule_based_recommendations(
+                    state.campaign_data, state.analysis_results, budget_plan, what_if
+                )
+                return self._set_recommendations(state, rec_result)
 
-            # Extract recommendations with fallback
-            recommendations = rec_result.get("recommendations", [])
-            if not recommendations:
-                recommendations = ["No specific recommendations available at this time."]
-
-            # Update state
-            state.recommendations = recommendations
-            state.recommendation_context = {
-                "timestamp": datetime.now().isoformat(),
-                "template_used": rec_result.get("template_used", False),
-                "had_previous_interaction": bool(state.context.get('conversation_history'))
-            }
+            prefetched = self._pop_prefetched(state, "recommendations")
+            if prefetched:
+                state.recommendations = prefetched["recommendations"]
+                state.recommendation_context = prefetched["recommendation_context"]
+                print("⚡ Recommendations served from prefetch.")
+                return state
 
-            print("✅ Recommendations generated successfully")
-            return state
+            # Generate recommendations
+            budget_plan = self._budget_plan(state.campaign_data.get("campaign_id"))
+            if enrichment_allowed():
+                what_if = self._what_if(state.campaign_data, budget_plan)
+            else:
+                what_if = []
+                note_degraded("what_if", "impact simulation skipped to meet the deadline")
+            try:
+                rec_result = recommendation_agent.generate_recommendations(
+                    campaign_data=state.campaign_data,
+                    analysis=state.analysis_results,
+                    conversation_history=state.context.get('conversation_history', []),
+                    budget_plan=budget_plan,
+                    what_if=what_if,
+                    peers=self.campaign_store.similar_campaigns.query(state.campaign_data, k=5),
+                    comparison=state.comparison
+                )
+            except TimeoutError as e:
+                rec_result = {"error": str(e)}
+            if rec_result and rec_result.get("error"):
+                note_degraded("recommendations", f"rule-based recommendations without the LLM ({rec_result['error']})")
+                rec_result = recommendation_agent.rule_based_recommendations(
+                    state.campaign_data, state.analysis_results, budget_plan, what_if
+                )
+            return self._set_recommendations(state, rec_result)
 
         except Exception as e:
             print(f"❌ Error in recommendation generation: {str(e)}")
@@ -89,17 +292,97 @@ class AgentHandlers:
             }
             return state
 
+    @staticmethod
+    def _set_recommendations(state: WorkflowState, rec_result: Optional[Dict]) -> WorkflowState:
+        # Ensure rec_result is not None
+        if not rec_result:
+            raise ValueError("Recommendation generation returned None")
+
+        # Extract recommendations with fallback
+        recommendations = rec_result.get("recommendations", [])
+        if not recommendations:
+            recommendations = ["No specific recommendations available at this time."]
+
+        # Update state
+        state.recommendations = recommendations
+        state.recommendation_context = {
+            "timestamp": datetime.now().isoformat(),
+            "template_used": rec_result.get("template_used", False),
+            "had_previous_interaction": bool(state.context.get('conversation_history')),
+            "budget_plan": rec_result.get("context", {}).get("budget_plan"),
+            "what_if": rec_result.get("context", {}).get("what_if")
+        }
+
+        print("✅ Recommendations generated successfully")
+        return state
+
+    def _budget_plan(self, campaign_id: str) -> Optional[Dict]:
+        """Portfolio reallocation for the recommendation prompt; recommendations go ahead without it on failure"""
+        try:
+            plan = self.budget_optimizer.plan()
+            return {"campaign": plan.allocation_for(campaign_id), "portfolio": plan.to_dict(top_n=5)}
+        except ValueError as e:
+            print(f"⚠️ Budget optimization unavailable: {str(e)}")
+            return None
+
+    def _what_if(self, campaign_data: Dict, budget_plan: Optional[Dict]) -> List[Dict]:
+        """Simulated impact of the optimizer's budget move and the standard levers"""
+        scenarios = dict(STANDARD_SCENARIOS)
+        allocation = (budget_plan or {}).get("campaign") or {}
+        if allocation.get("spend_change_pct"):
+            change = allocation["spend_change_pct"]
+            scenarios = {f"Optimizer budget ({change:+.0f}% spend)": {"spend": change / 100}, **scenarios}
+        try:
+            return [
+                {"label": label,
+                 **self.what_if.simulate_campaign(campaign_data, scenario, elasticity=allocation.get("elasticity"))}
+                for label, scenario in scenarios.items()
+            ]
+        except ValueError as e:
+            print(f"⚠️ What-if simulation unavailable: {str(e)}")
+            return []
+
     def generate_summary(self, state: WorkflowState) -> WorkflowState:
         """Generate summary using SummaryAgent"""
         try:
             summary_agent = SummaryAgent(llm=self.llm)
             print("📊 Generating summary...")
 
-            summary_result = summary_agent.generate_summary(
-                campaign_data=state.campaign_data,
-                analysis_results=state.analysis_results,
-                conversation_history=state.context.get('conversation_history', [])
-            )
+            if state.tier == AnswerTier.RULES:
+                state.summary = summary_agent.rule_based_summary(
+                    state.campaign_data, state.analysis_results, state.comparison
+                )
+                return state
+
+            prefetched = self._pop_prefetched(state, "summary")
+            if prefetched:
+                state.summary = prefetched["summary"]
+                print("⚡ Summary served from prefetch.")
+                return state
+
+            # Baseline summaries are precomputed without conversation history,
+            # so they can only stand in for the first question of a session
+            history = state.context.get('conversation_history', [])
+            if not state.comparison and not any(msg.type == MessageType.SYSTEM_RESPONSE for msg in history):
+                cached = self.result_cache.lookup(
+                    state.campaign_data.get("campaign_id"), "summary", state.campaign_data
+                )
+                if cached:
+                    state.summary = cached
+                    print("⚡ Summary served from cache.")
+                    return state
+
+            try:
+                summary_result = summary_agent.generate_summary(
+                    campaign_data=state.campaign_data,
+                    analysis_results=state.analysis_results,
+                    conversation_history=state.context.get('conversation_history', []),
+                    comparison=state.comparison
+                )
+            except TimeoutError as e:
+                summary_result = self._degraded_summary(summary_agent, state, str(e))
+            if summary_result.get("error"):
+                summary_result = self._degraded_summary(summary_agent, state, summary_result["error"])
 
             state.summary = summary_result
             print("✅ Summary generated successfully")
@@ -113,6 +396,29 @@ class AgentHandlers:
             }
         return state
 
+    def _degraded_summary(self, summary_agent: SummaryAgent, state: WorkflowState, error: str) -> Dict:
+        """Out of time for the LLM, or the LLM failed: the last cached baseline summary, however stale, or the analysis itself"""
+        stale = None if state.comparison else self.result_cache.get(state.campaign_data.get("campaign_id"), "summary")
+        if stale:
+            note_degraded("summary", f"reused the summary cached at {stale['updated_at']} ({error})")
+            return stale["value"]
+        note_degraded("summary", f"analysis shown without an LLM summary ({error})")
+        return summary_agent.rule_based_summary(state.campaign_data, state.analysis_results, state.comparison)
+
+    def _pop_prefetched(self, state: WorkflowState, branch: str) -> Optional[Dict]:
+        """Take a speculative result for this session if it was computed from the same campaign data"""
+        session_id = state.context.get('session_id')
+        # Prefetched branches cover a single campaign, not a comparison
+        if not session_id or state.context.get('speculative') or state.comparison:
+            return None
+
+        return self.prefetch_cache.pop(
+            session_id, branch,
+            usable=lambda prefetched: bool(prefetched)
+            and prefetched["campaign_id"] == state.campaign_data.get("campaign_id")
+            and prefetched["snapshot"] == metric_snapshot(state.campaign_data)
+        )
+
     def route_after_analysis(self, state: WorkflowState) -> str:
         """Route to appropriate next step based on user input type"""
         if state.user_input_type == UserInputType.SUMMARY:
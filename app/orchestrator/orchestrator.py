@@ -1,12 +1,18 @@
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterable, Optional
 from dotenv import load_dotenv
+from langchain_core.runnables import RunnableLambda
 
+from app.utils.deadline import Deadline, deadline_scope, request_deadline
 from app.utils.llm import LLMInitializer
-from .states import WorkflowState, CampaignState
+from app.utils.profiling import RequestProfile, profile_scope, profiled_node, request_profile
+from .states import AnswerTier, WorkflowState, CampaignState
 from .workflow import WorkflowBuilder
 from .agent_handlers import AgentHandlers
 from .response_formatter import ResponseFormatter
 
+class WorkflowCancelled(Exception):
+    pass
+
 class OrchestratorAgent:
     def __init__(self):
         load_dotenv()
@@ -15,37 +21,124 @@ class OrchestratorAgent:
         self.workflow = self._create_workflow()
 
     def _create_workflow(self):
+        handlers = self.agent_handlers
+        # Nodes report their work to the request's profile, when it has one
         agent_methods = {
-            "analyze_user_input": self.agent_handlers.analyze_user_input,
-            "gather_data": self.agent_handlers.gather_data,
-            "analyze_data": self.agent_handlers.analyze_data,
-            "generate_recommendations": self.agent_handlers.generate_recommendations,
-            "generate_summary": self.agent_handlers.generate_summary,
-            "route_after_analysis": self.agent_handlers.route_after_analysis
+            "analyze_user_input": profiled_node("analyze_user_input", handlers.analyze_user_input),
+            # Both variants are registered so ainvoke can await coalesced work
+            "gather_data": RunnableLambda(
+                profiled_node("gather_data", handlers.gather_data),
+                afunc=profiled_node("gather_data", handlers.agather_data),
+                name="gather_data"
+            ),
+            "analyze_data": RunnableLambda(
+                profiled_node("analyze_data", handlers.analyze_data),
+                afunc=profiled_node("analyze_data", handlers.aanalyze_data),
+                name="analyze_data"
+            ),
+            "generate_recommendations": profiled_node("generate_recommendations", handlers.generate_recommendations),
+            "generate_summary": profiled_node("generate_summary", handlers.generate_summary),
+            "route_after_analysis": handlers.route_after_analysis
         }
         return WorkflowBuilder.create_workflow(agent_methods)
 
     def run(self,
             user_input: str,
             feedback: Optional[str] = None,
-            context: Optional[Dict] = None) -> Dict:
-        """Run the workflow with user input and context"""
+            context: Optional[Dict] = None,
+            fields: Optional[Iterable[str]] = None,
+            deadline_seconds: Optional[float] = None,
+            tier: AnswerTier = AnswerTier.LLM,
+            profile: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Run the workflow with user input and context; fields selects the response
+        fields. Nodes degrade to cheaper paths to finish within deadline_seconds
+        (REQUEST_DEADLINE_SECONDS by default) and the response lists what they degraded.
+        AnswerTier.RULES answers from rule templates without calling the LLM.
+        profile names the profiling modes to record the run with (see app.utils.profiling);
+        the response then carries the path of the artifacts.
+        """
         try:
-            initial_state = WorkflowState(
-                current_state=CampaignState.DATA_GATHERING,
-                user_input=user_input,
-                feedback=feedback,
-                context=context or {}
-            )
+            initial_state = self._initial_state(user_input, feedback, context, tier)
+            with profile_scope(request_profile(profile)) as profiler:
+                with deadline_scope(request_deadline(deadline_seconds)) as deadline:
+                    final_state = self.workflow.compile().invoke(initial_state)
+            return self._format_final_state(final_state, context, fields, deadline, profiler)
+
+        except Exception as e:
+            return ResponseFormatter.format_error_response(e)
 
-            compiled_workflow = self.workflow.compile()
-            final_state = compiled_workflow.invoke(initial_state)
+    def run_with_progress(self,
+                          user_input: str,
+                          progress: Callable[[str, str], bool],
+                          feedback: Optional[str] = None,
+                          context: Optional[Dict] = None,
+                          fields: Optional[Iterable[str]] = None,
+                          deadline_seconds: Optional[float] = None,
+                          tier: AnswerTier = AnswerTier.LLM,
+                          profile: Optional[Iterable[str]] = None) -> Dict:
+        """
+        Run the workflow, calling progress(event, node) as LangGraph starts
+        ("task") and finishes ("task_result") each node. Returning False from
+        progress stops the run at the next node boundary.
+        """
+        initial_state = self._initial_state(user_input, feedback, context, tier)
+        final_state = None
+        with profile_scope(request_profile(profile)) as profiler:
+            with deadline_scope(request_deadline(deadline_seconds)) as deadline:
+                for mode, chunk in self.workflow.compile().stream(initial_state, stream_mode=["debug", "values"]):
+                    if mode == "values":
+                        final_state = chunk
+                    elif chunk["type"] in ("task", "task_result"):
+                        if progress(chunk["type"], chunk["payload"]["name"]) is False:
+                            raise WorkflowCancelled("Workflow run was cancelled")
 
-            # Convert final_state to dict if it isn't already
-            if not isinstance(final_state, dict):
-                final_state = final_state.dict()
+        return self._format_final_state(final_state, context, fields, deadline, profiler)
 
-            return ResponseFormatter.format_success_response(final_state, context)
+    async def arun(self,
+                   user_input: str,
+                   feedback: Optional[str] = None,
+                   context: Optional[Dict] = None,
+                   fields: Optional[Iterable[str]] = None,
+                   deadline_seconds: Optional[float] = None,
+                   tier: AnswerTier = AnswerTier.LLM,
+                   profile: Optional[Iterable[str]] = None) -> Dict:
+        """Async variant of run, for callers on an event loop"""
+        try:
+            initial_state = self._initial_state(user_input, feedback, context, tier)
+            with profile_scope(request_profile(profile)) as profiler:
+                with deadline_scope(request_deadline(deadline_seconds)) as deadline:
+                    final_state = await self.workflow.compile().ainvoke(initial_state)
+            return self._format_final_state(final_state, context, fields, deadline, profiler)
 
         except Exception as e:
-            return ResponseFormatter.format_error_response(e)
\ No newline at end of file
+            return ResponseFormatter.format_error_response(e)
+
+    @staticmethod
+    def _initial_state(user_input: str,
+                       feedback: Optional[str],
+                       context: Optional[Dict],
+                       tier: AnswerTier = AnswerTier.LLM) -> WorkflowState:
+        return WorkflowState(
+            current_state=CampaignState.DATA_GATHERING,
+            user_input=user_input,
+            feedback=feedback,
+            context=context or {},
+            tier=tier
+        )
+
+    @staticmethod
+    def _format_final_state(final_state,
+                            context: Optional[Dict],
+                            fields: Optional[Iterable[str]] = None,
+                            deadline: Optional[Deadline] = None,
+                            profiler: Optional[RequestProfile] = None) -> Dict:
+        # Shallow field view of the state: the formatter reads only the fields
+        # it was asked for, so there is no point deep-dumping the whole model
+        final_state = dict(final_state)
+        final_state['degraded'] = dict(deadline.degraded) if deadline else {}
+
+        response = ResponseFormatter.format_success_response(final_state, context, fields)
+        if profiler is not None and profiler.path:
+            response['profile'] = profiler.path
+        return response
\ No newline at end of file
@@ -1,11 +1,37 @@
 from datetime import datetime
-from typing import Dict, Any
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
 from app.agents.user_input_analysis_agent import UserInputType
 
+# Fields a caller can select; user_input_type and degraded are always included
+RESPONSE_FIELDS = ("campaign_data", "analysis", "recommendations", "summary", "comparison", "content", "context")
+# What a response carries when no fields are requested
+DEFAULT_RESPONSE_FIELDS = ("campaign_data", "analysis", "recommendations", "summary", "comparison", "context")
+
+
+def parse_fields(fields: Union[None, str, Iterable[str]],
+                 allowed: Tuple[str, ...] = RESPONSE_FIELDS) -> Optional[Tuple[str, ...]]:
+    """Normalize 'recommendations,summary' or a list of names; None means the default set"""
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    selected = tuple(dict.fromkeys(field.strip() for field in fields if field.strip()))
+    unknown = [field for field in selected if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown response fields: {', '.join(unknown)}. Choose from: {', '.join(allowed)}")
+    return selected or None
+
+
 class ResponseFormatter:
     @staticmethod
-    def format_success_response(final_state: Dict[str, Any], context: Dict = None) -> Dict[str, Any]:
-        """Format successful response from workflow execution"""
+    def format_success_response(final_state: Dict[str, Any],
+                                context: Dict = None,
+                                fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Format successful response from workflow execution. Only the selected
+        fields are built (all but content by default), so a caller asking for
+        the rendered content alone never pays for the analysis or history.
+        """
         if final_state.get('user_input_type') == UserInputType.DONE:
             return {
                 "message": "Conversation ended. Goodbye!",
@@ -13,19 +39,48 @@ class ResponseFormatter:
                 "user_input_type": UserInputType.DONE.value
             }
 
-        return {
-            "user_input_type": (final_state.get('user_input_type') or UserInputType.RECOMMENDATION).value,
-            "campaign_data": final_state.get('campaign_data', {}),
-            "analysis": final_state.get('analysis_results', {}),
-            "recommendations": final_state.get('recommendations', []),
-            "summary": final_state.get('summary', {}),
-            "context": {
+        user_input_type = final_state.get('user_input_type') or UserInputType.RECOMMENDATION
+        builders: Dict[str, Callable[[], Any]] = {
+            "campaign_data": lambda: dict(final_state.get('campaign_data') or {}),
+            "analysis": lambda: final_state.get('analysis_results', {}),
+            "recommendations": lambda: final_state.get('recommendations', []),
+            "summary": lambda: final_state.get('summary', {}),
+            "comparison": lambda: [
+                {**entry, "campaign_data": dict(entry["campaign_data"])} for entry in final_state['comparison']
+            ] if final_state.get('comparison') else None,
+            "content": lambda: ResponseFormatter.format_content(
+                user_input_type.value, final_state.get('summary'), final_state.get('recommendations')
+            ),
+            "context": lambda: {
+                "campaign_ids": final_state.get('campaign_ids') or [],
                 "had_previous_interaction": bool(context and context.get('conversation_history')),
                 "conversation_history": context.get('conversation_history', []) if context else [],
                 "timestamp": datetime.now().isoformat()
-            }
+            },
         }
 
+        # Parts answered by a cheaper path to meet the request deadline, with the reason
+        response = {"user_input_type": user_input_type.value, "degraded": final_state.get('degraded') or {}}
+        for field in fields or DEFAULT_RESPONSE_FIELDS:
+            response[field] = builders[field]()
+        return response
+
+    @staticmethod
+    def format_content(user_input_type: Optional[str],
+                       summary: Optional[Dict],
+                       recommendations: Optional[list]) -> str:
+        """The single message a chat client displays for a turn"""
+        if user_input_type == UserInputType.DONE.value:
+            return "Thank you for using the service. Goodbye!"
+
+        if user_input_type == UserInputType.SUMMARY.value:
+            return (summary or {}).get('content', "Unable to generate summary. Please try again.")
+
+        if recommendations:
+            return "\n\n".join(recommendations)
+
+        return "Unable to process request. Please try again."
+
     @staticmethod
     def format_error_response(error: Exception) -> Dict[str, Any]:
         """Format error response"""
@@ -37,4 +92,4 @@ class ResponseFormatter:
                 "error_timestamp": datetime.now().isoformat(),
                 "error_type": type(error).__name__
             }
-        }
\ No newline at end of file
+        }
@@ -1,17 +1,28 @@
 from enum import Enum
 from typing import Dict, List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, field_validator
 from app.agents.user_input_analysis_agent import UserInputType
+from app.utils.campaign_record import CampaignRecord, as_record
 
 class CampaignState(Enum):
+    INPUT_ANALYSIS = "INPUT_ANALYSIS"
     DATA_GATHERING = "DATA_GATHERING"
     ANALYSIS = "ANALYSIS"
     RECOMMENDATION_GENERATION = "RECOMMENDATION_GENERATION"
     SUMMARY_GENERATION = "SUMMARY_GENERATION"
 
+class AnswerTier(Enum):
+    """How answers are produced: by the LLM, or from rule templates over the computed metrics"""
+    LLM = "llm"
+    RULES = "rules"
+
 class WorkflowState(BaseModel):
+    # Records are immutable, so pydantic keeps them by reference across node transitions
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     current_state: CampaignState
-    campaign_data: Optional[Dict] = None
+    campaign_ids: Optional[List[str]] = None
+    campaign_data: Optional[CampaignRecord] = None
     analysis_results: Optional[Dict] = None
     recommendations: Optional[List[str]] = None
     summary: Optional[Dict] = None
@@ -20,4 +31,12 @@ class WorkflowState(BaseModel):
     feedback: Optional[str] = None
     context: Optional[Dict] = None
     recommendation_context: Optional[Dict] = None
-    summary_context: Optional[Dict] = None
\ No newline at end of file
+    summary_context: Optional[Dict] = None
+    # Every resolved campaign's data and analysis when the user compares several
+    comparison: Optional[List[Dict]] = None
+    tier: AnswerTier = AnswerTier.LLM
+
+    @field_validator("campaign_data", mode="before")
+    @classmethod
+    def _campaign_record(cls, value):
+        return None if value is None else as_record(value)
\ No newline at end of file
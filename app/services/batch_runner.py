@@ -0,0 +1,180 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, TextIO
+from uuid import uuid4
+
+from app.orchestrator.states import AnswerTier
+from app.services.interactive_session import InteractiveSession
+from app.utils.llm_scheduler import Priority, llm_request_context
+from app.utils.quantile_sketch import TDigest
+
+DEFAULT_BATCH_WORKERS = 8
+
+
+class InvalidConversationError(ValueError):
+    pass
+
+
+def parse_conversation(line: str, line_number: int) -> Dict:
+    """
+    One scripted session from a JSONL line: either a list of user turns or
+    {"turns": [...], "session_id": ..., "tenant": ..., "tier": "llm" | "rules"}
+    """
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise InvalidConversationError(f"Line {line_number}: invalid JSON ({str(e)})")
+    if isinstance(data, list):
+        data = {"turns": data}
+    turns = data.get("turns") if isinstance(data, dict) else None
+    if not turns or not isinstance(turns, list) or not all(isinstance(turn, str) for turn in turns):
+        raise InvalidConversationError(f"Line {line_number}: expected a non-empty list of user turns")
+    try:
+        tier = AnswerTier(data.get("tier", AnswerTier.LLM.value))
+    except ValueError:
+        raise InvalidConversationError(f"Line {line_number}: unknown tier {data.get('tier')!r}")
+    return {
+        "session_id": str(data.get("session_id") or uuid4()),
+        "turns": turns,
+        "tenant": data.get("tenant"),
+        "tier": tier,
+        "line": line_number
+    }
+
+
+def read_conversations(lines: Iterable[str]) -> Iterator[Dict]:
+    """Conversations from JSONL lines, skipping blank ones; raises InvalidConversationError"""
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip():
+            yield parse_conversation(line, line_number)
+
+
+class BatchRunner:
+    """
+    Runs scripted sessions headless, many at a time. Turns within a session
+    run in order, since each builds on the conversation so far, while up to
+    `workers` sessions run concurrently against one InteractiveSession, so
+    they share its orchestrator, caches and LLM scheduler. Turns run in the
+    batch lane of the scheduler, yielding the LLM to interactive traffic.
+    """
+
+    def __init__(self,
+                 session: Optional[InteractiveSession] = None,
+                 workers: Optional[int] = None,
+                 deadline_seconds: Optional[float] = None):
+        self.session = session or InteractiveSession(prefetch=False)
+        self.workers = workers or int(os.getenv("BATCH_WORKERS", DEFAULT_BATCH_WORKERS))
+        self.deadline_seconds = deadline_seconds
+        self._lock = threading.Lock()
+        self._latency = TDigest()
+        self._counts = {"sessions": 0, "turns": 0, "errors": 0}
+        self._started: Optional[float] = None
+
+    def run(self, conversations: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Run every conversation and yield a result per turn as soon as it
+        finishes, so results stream out in completion order. Conversations are
+        read lazily, at most a few per worker ahead of the ones running.
+        """
+        self._started = time.perf_counter()
+        results: queue.Queue = queue.Queue()
+        # Bounds how far reading runs ahead of the workers
+        slots = threading.Semaphore(self.workers * 2)
+        done = object()
+
+        def run_session(conversation: Dict):
+            try:
+                for result in self._run_session(conversation):
+                    results.put(result)
+            except Exception as e:
+                # One broken session is reported and the rest of the batch carries on
+                with self._lock:
+                    self._counts["errors"] += 1
+                results.put({"session_id": conversation["session_id"], "error": str(e)})
+            finally:
+                slots.release()
+
+        def submit_all():
+            try:
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-session") as pool:
+                    for conversation in conversations:
+                        slots.acquire()
+                        pool.submit(run_session, conversation)
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(done)
+
+        threading.Thread(target=submit_all, name="batch-reader", daemon=True).start()
+        while True:
+            item = results.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _run_session(self, conversation: Dict) -> Iterator[Dict]:
+        session_id = conversation["session_id"]
+        self.session.start_session(session_id)
+        try:
+            with llm_request_context(conversation["tenant"], Priority.BATCH):
+                for turn, user_input in enumerate(conversation["turns"]):
+                    started_at = datetime.now().isoformat()
+                    started = time.perf_counter()
+                    response = self.session.process_message(
+                        session_id, user_input, prefetch=False, tier=conversation["tier"],
+                        deadline_seconds=self.deadline_seconds
+                    )
+                    seconds = time.perf_counter() - started
+                    result = {
+                        "session_id": session_id,
+                        "turn": turn,
+                        "user_input": user_input,
+                        "user_input_type": response.get("user_input_type"),
+                        "content": response["content"],
+                        "degraded": response.get("degraded", {}),
+                        "started_at": started_at,
+                        "seconds": round(seconds, 4)
+                    }
+                    if response["type"] == "error":
+                        result["error"] = response["content"]
+                    self._record(seconds, error="error" in result)
+                    yield result
+                    if response.get("is_done"):
+                        break
+        finally:
+            self.session.end_session(session_id)
+            with self._lock:
+                self._counts["sessions"] += 1
+
+    def _record(self, seconds: float, error: bool):
+        with self._lock:
+            self._latency.add(seconds)
+            self._counts["turns"] += 1
+            self._counts["errors"] += int(error)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            elapsed = time.perf_counter() - self._started if self._started else 0.0
+            return {
+                **self._counts,
+                "workers": self.workers,
+                "elapsed_seconds": round(elapsed, 3),
+                "turns_per_second": round(self._counts["turns"] / elapsed, 3) if elapsed else None,
+                "turn_seconds": {
+                    f"p{int(q * 100)}": self._latency.quantile(q) for q in (0.5, 0.95, 0.99)
+                }
+            }
+
+    def write_ndjson(self, conversations: Iterable[Dict], out: TextIO) -> Dict:
+        """Stream every turn result to out as one JSON line, flushed as it arrives; returns stats()"""
+        for result in self.run(conversations):
+            out.write(json.dumps(result, default=str) + "\n")
+            out.flush()
+        return self.stats()
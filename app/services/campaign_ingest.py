@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.campaign_record import FIELD_TYPES, parse_number
+from app.utils.campaign_store import CampaignStore, parse_date
+from app.utils.timeseries import TimeSeriesStore
+
+CSV_EXTENSIONS = (".csv",)
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+
+
+class UnsupportedFormatError(ValueError):
+    pass
+
+
+class CampaignIngestor:
+    """
+    Streams CSV or NDJSON campaign exports into the CampaignStore. Rows are
+    validated and type-converted one at a time and appended in batches, so
+    memory use does not depend on the size of the file. Rows with a `date`
+    column are per-day metrics and go to the TimeSeriesStore instead.
+    """
+
+    def __init__(self,
+                 campaign_store: CampaignStore,
+                 timeseries_store: Optional[TimeSeriesStore] = None,
+                 batch_size: int = 5000,
+                 max_reported_errors: int = 100):
+        self.campaign_store = campaign_store
+        self.timeseries_store = timeseries_store
+        self.batch_size = batch_size
+        self.max_reported_errors = max_reported_errors
+
+    def ingest(self, stream: BinaryIO, filename: str) -> Dict:
+        """Validate and append every row of a binary stream, returning a per-row error report"""
+        rows = self._iter_rows(stream, filename)
+        batch: List[Dict] = []
+        daily_batch: List[Tuple[int, Dict]] = []
+        errors: List[Dict] = []
+        stats = {"rows_read": 0, "rows_ingested": 0, "rows_rejected": 0}
+
+        def reject(row_number: int, row_errors: Dict):
+            stats["rows_rejected"] += 1
+            if len(errors) < self.max_reported_errors:
+                errors.append({"row": row_number, "errors": row_errors})
+
+        def flush_daily():
+            rejected = self.timeseries_store.append_many(record for _, record in daily_batch)
+            for i, (row_number, _) in enumerate(daily_batch):
+                if i in rejected:
+                    reject(row_number, {"date": rejected[i]})
+            stats["rows_ingested"] += len(daily_batch) - len(rejected)
+            daily_batch.clear()
+
+        # Indexes that are costly to persist are saved once, after the last batch
+        with self.campaign_store.bulk():
+            for row_number, raw in rows:
+                stats["rows_read"] += 1
+                record, row_errors = self.validate_row(raw)
+                if row_errors:
+                    reject(row_number, row_errors)
+                    continue
+
+                if "date" in record:
+                    if self.timeseries_store is None:
+                        reject(row_number, {"date": "per-day rows are not supported here"})
+                        continue
+                    daily_batch.append((row_number, record))
+                    if len(daily_batch) >= self.batch_size:
+                        flush_daily()
+                    continue
+
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self.campaign_store.append_many(batch)
+                    stats["rows_ingested"] += len(batch)
+                    batch = []
+
+            self.campaign_store.append_many(batch)
+            stats["rows_ingested"] += len(batch)
+            if daily_batch:
+                flush_daily()
+        stats["errors"] = errors
+        stats["errors_truncated"] = stats["rows_rejected"] > len(errors)
+        print(f"📥 Ingested {stats['rows_ingested']} campaigns from {filename} "
+              f"({stats['rows_rejected']} rejected)")
+        return stats
+
+    def _iter_rows(self, stream: BinaryIO, filename: str) -> Iterator[Tuple[int, Dict]]:
+        name = (filename or "").lower()
+        if name.endswith(CSV_EXTENSIONS):
+            return self._iter_csv_rows(stream)
+        if name.endswith(NDJSON_EXTENSIONS):
+            return self._iter_ndjson_rows(stream)
+        raise UnsupportedFormatError(f"Unsupported file type for {filename}, expected CSV or NDJSON")
+
+    @staticmethod
+    def _iter_csv_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict]]:
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        try:
+            # Row numbers count the header as line 1, matching spreadsheet views
+            for row_number, row in enumerate(csv.DictReader(text), start=2):
+                yield row_number, row
+        finally:
+            # Don't let the wrapper close the caller's stream
+            text.detach()
+
+    @staticmethod
+    def _iter_ndjson_rows(stream: BinaryIO) -> Iterator[Tuple[int, Dict]]:
+        for row_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = {"__error__": f"Invalid JSON: {str(e)}"}
+            if not isinstance(row, dict):
+                row = {"__error__": "Expected a JSON object"}
+            yield row_number, row
+
+    @staticmethod
+    def validate_row(raw: Dict) -> Tuple[Optional[Dict], Dict[str, str]]:
+        """Return a typed record, or the errors found per field"""
+        if "__error__" in raw:
+            return None, {"row": raw["__error__"]}
+
+        errors = {}
+        record = {
+            key.strip(): value.strip() if isinstance(value, str) else value
+            for key, value in raw.items() if key is not None
+        }
+
+        if record.get("campaign_id") in (None, ""):
+            errors["campaign_id"] = "missing"
+        else:
+            record["campaign_id"] = str(record["campaign_id"])
+
+        for field, (kind, required) in FIELD_TYPES.items():
+            value = record.get(field)
+            if value in (None, ""):
+                if required:
+                    errors[field] = "missing"
+                record.pop(field, None)
+                continue
+            try:
+                record[field] = parse_number(value, kind)
+            except (TypeError, ValueError) as e:
+                errors[field] = f"invalid value {value!r}: {str(e)}"
+
+        if "date" in record and parse_date(record["date"]) is None:
+            errors["date"] = f"invalid date {record['date']!r}, expected YYYY-MM-DD"
+
+        for field in ("start_date", "end_date"):
+            if record.get(field) and parse_date(record[field]) is None:
+                errors[field] = f"invalid date {record[field]!r}, expected YYYY-MM-DD"
+
+        if not errors and record["clicks"] > record["impressions"]:
+            errors["clicks"] = "exceeds impressions"
+
+        # CSV exports carry keywords as a single ';'-separated cell
+        if isinstance(record.get("keywords"), str):
+            record["keywords"] = [k.strip() for k in record["keywords"].split(";") if k.strip()]
+
+        if errors:
+            return None, errors
+        return record, {}
@@ -1,22 +1,45 @@
-from typing import Dict
+import os
+import time
+from typing import Dict, Optional
 from uuid import uuid4
 from app.orchestrator.orchestrator import OrchestratorAgent
+from app.orchestrator.response_formatter import ResponseFormatter
+from app.orchestrator.states import AnswerTier
+from app.services.prefetcher import Prefetcher
 from app.utils.conversation_manager import ConversationManager, MessageType
+from app.utils.llm_scheduler import current_llm_context
+from app.utils.results_sink import ResultsSink
+from app.utils.traffic_recording import record_turn
 
 class InteractiveSession:
-    def __init__(self):
+    def __init__(self, prefetch: Optional[bool] = None, results_sink: Optional[ResultsSink] = None):
         self.orchestrator = OrchestratorAgent()
         self.conversation_manager = ConversationManager()
+        self.prefetch = prefetch if prefetch is not None else os.getenv("PREFETCH_ENABLED") == "1"
+        self.prefetcher = Prefetcher(self.orchestrator.agent_handlers)
+        # Every turn's results are appended here as Parquet rows, when set
+        self.results_sink = results_sink
 
-    def start_session(self) -> str:
+    def start_session(self, session_id: Optional[str] = None) -> str:
         """Start a new conversation session"""
-        session_id = str(uuid4())
+        session_id = session_id or str(uuid4())
         self.conversation_manager.create_session(session_id)
         return session_id
 
-    def process_message(self, session_id: str, user_message: str) -> Dict:
+    def end_session(self, session_id: str):
+        """Forget a finished session and its history"""
+        self.conversation_manager.end_session(session_id)
+
+    def process_message(self,
+                        session_id: str,
+                        user_message: str,
+                        prefetch: Optional[bool] = None,
+                        tier: AnswerTier = AnswerTier.LLM,
+                        deadline_seconds: Optional[float] = None) -> Dict:
         """
-        Process a user message and return appropriate response
+        Process a user message and return appropriate response.
+        With prefetch enabled, the likely next branch is started in the background.
+        AnswerTier.RULES answers from rule templates without calling the LLM.
         Returns:
             Dict containing response data including:
             - type: str
@@ -39,10 +62,19 @@ class InteractiveSession:
             }
 
             # Process message through orchestrator
-            result = self.orchestrator.run(
-                user_input=user_message,
-                context=context
-            )
+            started = time.perf_counter()
+            with record_turn(session_id, user_message, tenant=current_llm_context()[0], tier=tier.value,
+                             deadline_seconds=deadline_seconds) as turn:
+                result = self.orchestrator.run(
+                    user_input=user_message,
+                    context=context,
+                    tier=tier,
+                    deadline_seconds=deadline_seconds
+                )
+                if result.get('error'):
+                    turn['error'] = result['error']
+            if self.results_sink is not None:
+                self._record_result(session_id, user_message, tier, result, time.perf_counter() - started)
 
             # Check if we're in DONE state
             is_done = result.get('user_input_type') == 'DONE'
@@ -61,11 +93,19 @@ class InteractiveSession:
                 }
             )
 
+            if tier == AnswerTier.LLM and (prefetch if prefetch is not None else self.prefetch):
+                self.prefetcher.maybe_prefetch(
+                    session_id,
+                    result,
+                    self.conversation_manager.get_conversation_history(session_id)
+                )
+
             return {
                 'type': 'response',
                 'content': response_content,
                 'session_id': session_id,
                 'user_input_type': result.get('user_input_type'),
+                'degraded': result.get('degraded', {}),
                 'is_done': is_done
             }
 
@@ -87,19 +127,27 @@ class InteractiveSession:
                 'is_done': False
             }
 
+    def _record_result(self, session_id: str, user_message: str, tier: AnswerTier, result: Dict, seconds: float):
+        tenant, priority = current_llm_context()
+        llm = self.orchestrator.llm
+        if "model" in (result.get('degraded') or {}):
+            llm = getattr(llm, 'fallback_llm', None) or llm
+        self.results_sink.record(
+            result,
+            session_id=session_id,
+            tenant=tenant,
+            lane=priority.name.lower(),
+            user_input=user_message,
+            tier=tier.value,
+            model="rules" if tier == AnswerTier.RULES else str(getattr(llm, 'model', None)),
+            latency_seconds=seconds
+        )
+
     def _format_response_content(self, result: Dict) -> str:
         """Format the response content based on result type"""
-        if result.get('user_input_type') == 'DONE':
-            return "Thank you for using the service. Goodbye!"
-
-        if result.get('user_input_type') == 'SUMMARY':
-            return result.get('summary', {}).get('content',
-                                                 "Unable to generate summary. Please try again.")
-
-        if result.get('recommendations'):
-            return "\n\n".join(result['recommendations'])
-
-        return "Unable to process request. Please try again."
+        return ResponseFormatter.format_content(
+            result.get('user_input_type'), result.get('summary'), result.get('recommendations')
+        )
 
     def get_session_history(self, session_id: str) -> list:
         """Get formatted conversation history"""
@@ -0,0 +1,220 @@
+import os
+import queue
+import threading
+import time
+from enum import Enum
+from typing import Callable, Dict, FrozenSet, List, Optional
+
+from app.orchestrator.orchestrator import OrchestratorAgent, WorkflowCancelled
+from app.orchestrator.states import AnswerTier, CampaignState
+from app.utils.llm_scheduler import Priority, llm_request_context
+
+# Orchestration state reported while each LangGraph node runs
+NODE_STATES = {
+    "analyze_user_input": CampaignState.INPUT_ANALYSIS,
+    "gather_data": CampaignState.DATA_GATHERING,
+    "analyze_data": CampaignState.ANALYSIS,
+    "generate_recommendations": CampaignState.RECOMMENDATION_GENERATION,
+    "generate_summary": CampaignState.SUMMARY_GENERATION,
+}
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobConflictError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self,
+                 session_id: str,
+                 user_input: str,
+                 context: Dict,
+                 user_id: Optional[str] = None,
+                 tenant: Optional[str] = None,
+                 priority: Priority = Priority.INTERACTIVE,
+                 tier: AnswerTier = AnswerTier.LLM,
+                 profile: FrozenSet[str] = frozenset()):
+        self.session_id = session_id
+        self.user_input = user_input
+        self.context = context
+        self.user_id = user_id
+        self.tenant = tenant
+        self.priority = priority
+        self.tier = tier
+        self.profile = profile
+        self.status = JobStatus.QUEUED
+        self.state: Optional[CampaignState] = None
+        self.last_agent: Optional[str] = None
+        self.next: Optional[str] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (JobStatus.QUEUED, JobStatus.PROCESSING)
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "status": self.status.value,
+            "state": self.state.value if self.state else None,
+            "last_agent": self.last_agent,
+            "next": self.next,
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class JobQueue:
+    """
+    Bounded queue of orchestration jobs served by a pool of worker threads.
+    Jobs are tracked per session and report which LangGraph node is running.
+    """
+
+    def __init__(self,
+                 orchestrator: OrchestratorAgent,
+                 on_complete: Optional[Callable[[Job], None]] = None,
+                 workers: Optional[int] = None,
+                 max_queue_size: Optional[int] = None,
+                 result_ttl_seconds: Optional[float] = None):
+        self.orchestrator = orchestrator
+        self.on_complete = on_complete
+        self.workers = workers or int(os.getenv("ORCHESTRATOR_WORKERS", "4"))
+        self.max_queue_size = max_queue_size or int(os.getenv("JOB_QUEUE_SIZE", "100"))
+        self.result_ttl_seconds = result_ttl_seconds or float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_queue_size)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"orchestrator-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self,
+               session_id: str,
+               user_input: str,
+               context: Dict,
+               user_id: Optional[str] = None,
+               tenant: Optional[str] = None,
+               priority: Priority = Priority.INTERACTIVE,
+               tier: AnswerTier = AnswerTier.LLM,
+               profile: FrozenSet[str] = frozenset()) -> Job:
+        """Queue a job, raising QueueFullError when the queue is at capacity"""
+        with self._lock:
+            self._prune_finished()
+            existing = self._jobs.get(session_id)
+            if existing and existing.is_active:
+                raise JobConflictError(f"Session {session_id} already has a job in progress")
+
+            job = Job(session_id, user_input, context, user_id, tenant, priority, tier, profile)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError("Job queue is full, please retry later")
+            self._jobs[session_id] = job
+            return job
+
+    def get(self, session_id: str) -> Optional[Job]:
+        return self._jobs.get(session_id)
+
+    def cancel(self, session_id: str) -> bool:
+        """Cancel a queued job, or stop a running one at its next node"""
+        # Under the lock a worker takes to start the job, so a job is never both cancelled and run
+        with self._lock:
+            job = self._jobs.get(session_id)
+            if job is None or not job.is_active:
+                return False
+            job.cancel_event.set()
+            if job.status == JobStatus.QUEUED:
+                self._finish(job, JobStatus.CANCELLED)
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "processing": statuses.count(JobStatus.PROCESSING)
+        }
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            try:
+                if self._start(job):
+                    self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _start(self, job: Job) -> bool:
+        """Mark a queued job as processing, unless it was cancelled first"""
+        with self._lock:
+            if job.status != JobStatus.QUEUED:
+                return False
+            job.status = JobStatus.PROCESSING
+            return True
+
+    def _run(self, job: Job):
+        def progress(event: str, node: str) -> bool:
+            if event == "task":
+                job.state = NODE_STATES.get(node, job.state)
+                job.next = node
+            else:
+                job.last_agent = node
+                job.next = None
+            return not job.cancel_event.is_set()
+
+        try:
+            with llm_request_context(job.tenant, job.priority):
+                job.result = self.orchestrator.run_with_progress(
+                    job.user_input, progress, context=job.context, tier=job.tier, profile=job.profile
+                )
+            self._finish(job, JobStatus.COMPLETED)
+        except WorkflowCancelled:
+            self._finish(job, JobStatus.CANCELLED)
+        except Exception as e:
+            print(f"❌ Job for session {job.session_id} failed: {str(e)}")
+            job.error = str(e)
+            self._finish(job, JobStatus.FAILED)
+
+    def _finish(self, job: Job, status: JobStatus):
+        # Let the callback record the result before pollers can see completion
+        if status == JobStatus.COMPLETED and self.on_complete:
+            self.on_complete(job)
+        job.status = status
+        job.next = None
+        job.finished_at = time.time()
+
+    def _prune_finished(self):
+        cutoff = time.time() - self.result_ttl_seconds
+        for session_id in [sid for sid, job in self._jobs.items()
+                           if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[session_id]
@@ -0,0 +1,146 @@
+import argparse
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from app.agents.analysis_agent import AnalysisAgent
+from app.agents.data_gathering_agent import DataGatheringAgent
+from app.agents.summary_agent import SummaryAgent
+from app.utils.campaign_store import CampaignStore, parse_date
+from app.utils.llm import LLMInitializer
+from app.utils.llm_scheduler import Priority, llm_request_context
+from app.utils.result_cache import ResultCache
+from app.utils.timeseries import TimeSeriesStore
+
+
+def _parse_hours(value: str) -> Tuple[int, int]:
+    start, end = value.split("-")
+    return int(start), int(end)
+
+
+class PrecomputeScheduler:
+    """
+    Pre-computes analyses and baseline summaries for active campaigns during
+    off-peak hours, so interactive requests can be served from ResultCache.
+    """
+
+    def __init__(self,
+                 llm=None,
+                 result_cache: Optional[ResultCache] = None,
+                 campaign_store: Optional[CampaignStore] = None,
+                 timeseries_store: Optional[TimeSeriesStore] = None,
+                 off_peak_hours: Optional[Tuple[int, int]] = None,
+                 interval_seconds: Optional[int] = None,
+                 active_within_days: Optional[int] = None):
+        load_dotenv()
+        self.llm = llm or LLMInitializer().llm
+        self.result_cache = result_cache or ResultCache()
+        self.campaign_store = campaign_store or CampaignStore()
+        self.timeseries_store = timeseries_store or TimeSeriesStore()
+        self.off_peak_hours = off_peak_hours or _parse_hours(os.getenv("PRECOMPUTE_OFF_PEAK_HOURS", "1-6"))
+        self.interval_seconds = interval_seconds or int(os.getenv("PRECOMPUTE_INTERVAL_SECONDS", "900"))
+        self.active_within_days = (
+            active_within_days if active_within_days is not None
+            else int(os.getenv("PRECOMPUTE_ACTIVE_WITHIN_DAYS", "30"))
+        )
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def is_off_peak(self, now: Optional[datetime] = None) -> bool:
+        hour = (now or datetime.now()).hour
+        start, end = self.off_peak_hours
+        if start <= end:
+            return start <= hour < end
+        # Window wraps around midnight, e.g. 22-5
+        return hour >= start or hour < end
+
+    def prioritized_campaigns(self, today: Optional[date] = None) -> List[Dict]:
+        """Active campaigns ordered by spend, discounted by how long ago they last ran"""
+        today = today or date.today()
+        campaigns = self.campaign_store.list_active_campaigns(today, self.active_within_days)
+
+        def priority(campaign: Dict) -> float:
+            last_active = parse_date(campaign.get("end_date")) or today
+            days_since = max((today - min(last_active, today)).days, 0)
+            return campaign.get("spend", 0) / (1 + days_since / 7)
+
+        return sorted(campaigns, key=priority, reverse=True)
+
+    def run_once(self, force: bool = False) -> Dict:
+        """Refresh stale cache entries for every active campaign, in the batch lane of the LLM scheduler"""
+        with llm_request_context("precompute", Priority.BATCH):
+            return self._refresh(force)
+
+    def _refresh(self, force: bool) -> Dict:
+        data_agent = DataGatheringAgent(self.campaign_store, self.timeseries_store)
+        analysis_agent = AnalysisAgent(llm=self.llm)
+        summary_agent = SummaryAgent(llm=self.llm)
+        stats = {"refreshed": 0, "skipped": 0, "failed": 0}
+
+        for campaign in self.prioritized_campaigns():
+            campaign_id = campaign["campaign_id"]
+            campaign["trends"] = self.timeseries_store.trends(campaign_id)
+            if not force and not (
+                self.result_cache.needs_refresh(campaign_id, "analysis", campaign)
+                or self.result_cache.needs_refresh(campaign_id, "summary", campaign)
+            ):
+                stats["skipped"] += 1
+                continue
+
+            try:
+                print(f"🗓️ Pre-computing results for {campaign_id}...")
+                campaign_data = data_agent.gather_campaign_context(campaign_id)
+                analysis = analysis_agent.analyze_campaign(campaign_data)
+                self.result_cache.put(campaign_id, "analysis", analysis, campaign_data)
+
+                summary = summary_agent.generate_summary(campaign_data, analysis)
+                if "error" not in summary:
+                    self.result_cache.put(campaign_id, "summary", summary, campaign_data)
+                stats["refreshed"] += 1
+            except Exception as e:
+                print(f"❌ Pre-computation failed for {campaign_id}: {str(e)}")
+                stats["failed"] += 1
+
+        print(f"✅ Pre-computation pass complete: {stats}")
+        return stats
+
+    def run_forever(self):
+        """Run a pass every interval while inside the off-peak window"""
+        while not self._stop_event.is_set():
+            if self.is_off_peak():
+                self.campaign_store.reload()
+                self.timeseries_store.reload()
+                self.run_once()
+            self._stop_event.wait(self.interval_seconds)
+
+    def start(self) -> threading.Thread:
+        """Run the scheduler in a background thread of the current process"""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run_forever, name="precompute-scheduler", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-compute campaign analyses and summaries")
+    parser.add_argument("--once", action="store_true", help="Run a single pass and exit")
+    parser.add_argument("--force", action="store_true", help="Ignore the delta threshold and refresh everything")
+    args = parser.parse_args()
+
+    scheduler = PrecomputeScheduler()
+    if args.once:
+        scheduler.run_once(force=args.force)
+    else:
+        scheduler.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from app.agents.user_input_analysis_agent import UserInputType
+from app.orchestrator.agent_handlers import AgentHandlers
+from app.orchestrator.states import WorkflowState, CampaignState
+from app.utils.conversation_manager import Message
+from app.utils.llm_scheduler import Priority, current_llm_context, llm_request_context
+from app.utils.result_cache import metric_snapshot
+
+
+class Prefetcher:
+    """
+    Speculatively runs the branch the user is likely to ask for next
+    (recommendations after a summary and vice versa) and leaves the result in
+    the handlers' session-scoped prefetch cache.
+    """
+
+    def __init__(self, agent_handlers: AgentHandlers, max_concurrent: int = None):
+        self.agent_handlers = agent_handlers
+        self.max_concurrent = max_concurrent or int(os.getenv("PREFETCH_MAX_CONCURRENT", "4"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="prefetch")
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def maybe_prefetch(self,
+                       session_id: str,
+                       result: Dict,
+                       conversation_history: List[Message],
+                       tenant: Optional[str] = None) -> bool:
+        """
+        Start the opposite branch of the turn that just completed, if a slot is
+        free. Its LLM calls go to the tenant's prefetch lane, behind real requests.
+        """
+        user_input_type = result.get('user_input_type')
+        if user_input_type == UserInputType.SUMMARY.value:
+            branch = "recommendations"
+        elif user_input_type == UserInputType.RECOMMENDATION.value:
+            branch = "summary"
+        else:
+            return False
+
+        if not result.get('campaign_data') or not result.get('analysis'):
+            return False
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        with self._lock:
+            self.started += 1
+
+        state = WorkflowState(
+            current_state=CampaignState.ANALYSIS,
+            campaign_data=result['campaign_data'],
+            analysis_results=result['analysis'],
+            context={
+                'conversation_history': list(conversation_history),
+                'session_id': session_id,
+                'speculative': True
+            }
+        )
+        self._executor.submit(self._run_branch, session_id, branch, state, tenant or current_llm_context()[0])
+        return True
+
+    def _run_branch(self, session_id: str, branch: str, state: WorkflowState, tenant: str):
+        try:
+            print(f"🔮 Prefetching {branch} for session {session_id}...")
+            with llm_request_context(tenant, Priority.PREFETCH):
+                if branch == "recommendations":
+                    state = self.agent_handlers.generate_recommendations(state)
+                    value = {
+                        "recommendations": state.recommendations,
+                        "recommendation_context": state.recommendation_context
+                    }
+                    failed = "error" in (state.recommendation_context or {})
+                else:
+                    state = self.agent_handlers.generate_summary(state)
+                    value = {"summary": state.summary}
+                    failed = "error" in (state.summary or {})
+
+            if failed:
+                with self._lock:
+                    self.failed += 1
+                return
+
+            value["snapshot"] = metric_snapshot(state.campaign_data)
+            value["campaign_id"] = state.campaign_data.get("campaign_id")
+            self.agent_handlers.prefetch_cache.put(session_id, branch, value)
+            with self._lock:
+                self.completed += 1
+        except Exception as e:
+            print(f"❌ Prefetch of {branch} failed: {str(e)}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict:
+        """Counters for judging whether prefetching pays for its extra tokens"""
+        cache = self.agent_handlers.prefetch_cache
+        with self._lock:
+            return {
+                "started": self.started,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "hits": cache.hits,
+                "expired": cache.expired,
+                "stale": cache.stale,
+                "hit_rate": cache.hits / self.completed if self.completed else 0.0
+            }
@@ -0,0 +1,309 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+from dotenv import load_dotenv
+
+from app.orchestrator.states import AnswerTier
+from app.services.interactive_session import InteractiveSession
+from app.utils.llm_scheduler import llm_request_context
+from app.utils.quantile_sketch import TDigest
+from app.utils.traffic_recording import read_recording, replay_llm
+
+DEFAULT_REPLAY_WORKERS = 64
+# Quantiles every latency distribution in a report is summarized by
+REPORT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def parse_speed(value: str) -> Optional[float]:
+    """Replay speed from "1", "10x" or "max"; None means as fast as the target serves"""
+    if value.lower() == "max":
+        return None
+    try:
+        speed = float(value.lower().rstrip("x"))
+    except ValueError:
+        raise ValueError(f"Invalid speed {value!r}: expected a multiplier such as 1, 10 or max")
+    if speed <= 0:
+        raise ValueError(f"Invalid speed {value!r}: must be positive")
+    return speed
+
+
+def parse_tenant_keys(value: str) -> Dict[str, str]:
+    """API key to send for each recorded tenant, from tenant=key,..."""
+    keys = {}
+    for item in value.split(","):
+        tenant, separator, key = item.partition("=")
+        if not separator or not tenant.strip() or not key.strip():
+            raise ValueError(f"Invalid tenant key {item!r}: expected tenant=key")
+        keys[tenant.strip()] = key.strip()
+    return keys
+
+
+def sessions_of(turns: List[Dict]) -> List[List[Dict]]:
+    """Recorded turns grouped by session, sessions ordered by their first turn"""
+    sessions: Dict[str, List[Dict]] = {}
+    for turn in turns:
+        sessions.setdefault(turn["session_id"], []).append(turn)
+    return list(sessions.values())
+
+
+def _distribution(digest: TDigest, maximum: float) -> Dict:
+    summary = {f"p{int(q * 100)}": digest.quantile(q) for q in REPORT_QUANTILES}
+    summary["max"] = maximum if len(digest) else None
+    return {name: round(value, 4) if value is not None else None for name, value in summary.items()}
+
+
+def compare_reports(report: Dict, baseline: Dict) -> Dict:
+    """How a replay report differs from a baseline of the same recording: ratios above 1 mean more"""
+    def ratio(new, old):
+        return round(new / old, 3) if new is not None and old else None
+
+    current, previous = report["replayed"], baseline["replayed"]
+    return {
+        "throughput_ratio": ratio(current["turns_per_second"], previous["turns_per_second"]),
+        "latency_ratio": {
+            name: ratio(current["turn_seconds"][name], previous["turn_seconds"].get(name))
+            for name in current["turn_seconds"]
+        },
+        "error_rate_change": round(current["error_rate"] - previous["error_rate"], 4),
+    }
+
+
+class _ReplaySession:
+    """A recorded session being replayed: its turns and the next one to send"""
+
+    def __init__(self, order: int, turns: List[Dict]):
+        self.order = order
+        self.turns = turns
+        self.next = 0
+        self.session_id: Optional[str] = None
+        self.http: Optional[requests.Session] = None
+
+
+class TrafficReplayer:
+    """
+    Replays a traffic recording against InteractiveSession in this process, or
+    against the /chat endpoint of a running API, and reports throughput,
+    latency percentiles and error rates. Turns keep their recorded spacing
+    divided by speed (speed=None sends each as soon as the previous turn of
+    its session is answered), and turns within a session go in order. Each
+    turn is sent on one of up to `workers` threads once it is due, so a
+    session waiting for its next turn holds no worker.
+
+    In-process, the LLM is a ReplayLLM answering from the same recording with
+    the recorded latencies; an API under test should be started with
+    LLM_REPLAY_FILE pointing at the recording for the same effect. The API
+    takes the tenant from the caller's API key, so tenant_keys maps each
+    recorded tenant to a key of the target's.
+    """
+
+    def __init__(self,
+                 recording: Path,
+                 speed: Optional[float] = 1.0,
+                 target: Optional[str] = None,
+                 workers: Optional[int] = None,
+                 timeout: float = 120.0,
+                 tenant_keys: Optional[Dict[str, str]] = None):
+        self.recording = Path(recording)
+        self.header, self.turns = read_recording(self.recording)
+        self.speed = speed
+        self.target = target.rstrip("/") if target else None
+        self.workers = workers or int(os.getenv("REPLAY_WORKERS", DEFAULT_REPLAY_WORKERS))
+        self.timeout = timeout
+        self.tenant_keys = tenant_keys or {}
+        self.session = None
+        if self.target is None:
+            # LLMInitializer picks the replay stand-in up from the environment
+            os.environ["LLM_REPLAY_FILE"] = str(self.recording)
+            self.session = InteractiveSession(prefetch=False)
+        self._lock = threading.Lock()
+        self._latency = TDigest()
+        self._lag = TDigest()
+        self._max = {"latency": 0.0, "lag": 0.0}
+        self._counts = {"sessions": 0, "turns": 0, "errors": 0, "degraded": 0}
+        self._started: Optional[float] = None
+
+    def run(self) -> Dict:
+        """Replay every session and return the report"""
+        sessions = [_ReplaySession(order, turns) for order, turns in enumerate(sessions_of(self.turns))]
+        self._started = time.perf_counter()
+        # (due, order, session) for the next turn of every session not waiting on an answer
+        self._due: List = []
+        self._ready = threading.Condition()
+        self._active = len(sessions)
+        for session in sessions:
+            self._schedule(session)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(sessions))),
+                                thread_name_prefix="replay-turn") as pool:
+            with self._ready:
+                while self._active:
+                    now = time.perf_counter()
+                    if self._due and self._due[0][0] <= now:
+                        due, _, session = heapq.heappop(self._due)
+                        pool.submit(self._run_turn, session, due)
+                    else:
+                        self._ready.wait(self._due[0][0] - now if self._due else None)
+        return self.report(time.perf_counter() - self._started)
+
+    def _schedule(self, session: _ReplaySession):
+        turn = session.turns[session.next]
+        if self.speed is not None:
+            due = self._started + turn["at"] / self.speed
+        else:
+            due = time.perf_counter()
+        with self._ready:
+            heapq.heappush(self._due, (due, session.order, session))
+            self._ready.notify()
+
+    def _run_turn(self, session: _ReplaySession, due: float):
+        try:
+            # How long the turn waited for a worker past its recorded time
+            lag = max(time.perf_counter() - due, 0.0) if self.speed is not None else 0.0
+            if session.next == 0:
+                if self.session is not None:
+                    session.session_id = self.session.start_session()
+                else:
+                    # The API assigns the session id on the first turn
+                    session.http = requests.Session()
+            turn = session.turns[session.next]
+            started = time.perf_counter()
+            try:
+                if self.session is not None:
+                    error, degraded = self._send_in_process(session.session_id, turn)
+                else:
+                    session.session_id, error, degraded = self._send_http(session.http, session.session_id, turn)
+            except Exception as e:
+                error, degraded = str(e) or type(e).__name__, False
+            self._record(time.perf_counter() - started, lag, error, degraded)
+        finally:
+            session.next += 1
+            if session.next < len(session.turns):
+                self._schedule(session)
+            else:
+                self._end_session(session)
+
+    def _end_session(self, session: _ReplaySession):
+        try:
+            if self.session is not None:
+                if session.session_id is not None:
+                    self.session.end_session(session.session_id)
+            elif session.http is not None:
+                session.http.close()
+        finally:
+            with self._lock:
+                self._counts["sessions"] += 1
+            with self._ready:
+                self._active -= 1
+                self._ready.notify()
+
+    def _send_in_process(self, session_id: str, turn: Dict):
+        with llm_request_context(turn.get("tenant")):
+            response = self.session.process_message(
+                session_id, turn["user_input"], prefetch=False,
+                tier=AnswerTier(turn.get("tier", AnswerTier.LLM.value)),
+                deadline_seconds=turn.get("deadline_seconds")
+            )
+        error = response["content"] if response["type"] == "error" else None
+        return error, bool(response.get("degraded"))
+
+    def _send_http(self, http, session_id: Optional[str], turn: Dict):
+        payload = {"user_input": turn["user_input"], "prefetch": False, "tier": turn.get("tier", AnswerTier.LLM.value)}
+        if turn.get("deadline_seconds"):
+            payload["deadline_seconds"] = turn["deadline_seconds"]
+        if session_id:
+            payload["session_id"] = session_id
+        api_key = self.tenant_keys.get(turn.get("tenant"))
+        headers = {"X-API-Key": api_key} if api_key else {}
+        response = http.post(f"{self.target}/chat", json=payload, headers=headers, timeout=self.timeout)
+        if response.status_code != 200:
+            return session_id, f"HTTP {response.status_code}: {response.text[:200]}", False
+        body = response.json()
+        return body.get("session_id", session_id), None, bool(body.get("degraded"))
+
+    def _record(self, seconds: float, lag: float, error: Optional[str], degraded: bool):
+        with self._lock:
+            self._latency.add(seconds)
+            self._lag.add(lag)
+            self._max["latency"] = max(self._max["latency"], seconds)
+            self._max["lag"] = max(self._max["lag"], lag)
+            self._counts["turns"] += 1
+            self._counts["errors"] += int(error is not None)
+            self._counts["degraded"] += int(degraded)
+
+    def report(self, elapsed: float) -> Dict:
+        recorded_latency = TDigest()
+        recorded_latency.update(turn["seconds"] for turn in self.turns if "seconds" in turn)
+        with self._lock:
+            turns = self._counts["turns"]
+            report = {
+                "recording": str(self.recording),
+                "target": self.target or "session",
+                "speed": self.speed if self.speed is not None else "max",
+                "recorded": {
+                    "sessions": len(sessions_of(self.turns)),
+                    "turns": len(self.turns),
+                    "errors": sum(1 for turn in self.turns if turn.get("error")),
+                    "duration_seconds": round(max((turn["at"] + turn.get("seconds", 0) for turn in self.turns), default=0.0), 3),
+                    "turn_seconds": _distribution(recorded_latency, max((turn.get("seconds", 0) for turn in self.turns), default=0.0)),
+                },
+                "replayed": {
+                    **self._counts,
+                    "error_rate": round(self._counts["errors"] / turns, 4) if turns else 0.0,
+                    "duration_seconds": round(elapsed, 3),
+                    "turns_per_second": round(turns / elapsed, 3) if elapsed else None,
+                    "turn_seconds": _distribution(self._latency, self._max["latency"]),
+                    # How far behind the recorded schedule turns were sent; growing lag means the target could not keep up
+                    "schedule_lag_seconds": _distribution(self._lag, self._max["lag"]),
+                },
+            }
+        if self.session is not None:
+            report["stub"] = replay_llm(str(self.recording)).stats()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic and report throughput, latency and errors")
+    parser.add_argument("recording", type=Path, help="Recording written with TRAFFIC_RECORD_FILE")
+    parser.add_argument("--speed", default="1", help="1 for the recorded pace, 10 for ten times faster, max for no pacing")
+    parser.add_argument("--target", default="session",
+                        help="'session' to replay in-process, or the base URL of a running API (e.g. http://localhost:8000)")
+    parser.add_argument("--workers", type=int, default=None, help="Turns in flight at once")
+    parser.add_argument("--tenant-keys", default="",
+                        help="API key to send for each recorded tenant with --target, e.g. acme=key1,beta=key2")
+    parser.add_argument("--report", type=Path, default=None, help="Write the report JSON here")
+    parser.add_argument("--baseline", type=Path, default=None, help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    load_dotenv()
+    try:
+        speed = parse_speed(args.speed)
+        tenant_keys = parse_tenant_keys(args.tenant_keys) if args.tenant_keys else None
+    except ValueError as e:
+        parser.error(str(e))
+    replayer = TrafficReplayer(
+        args.recording,
+        speed=speed,
+        target=None if args.target == "session" else args.target,
+        workers=args.workers,
+        tenant_keys=tenant_keys
+    )
+    report = replayer.run()
+    if args.baseline:
+        report["comparison"] = compare_reports(report, json.loads(args.baseline.read_text()))
+    text = json.dumps(report, indent=2)
+    if args.report:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        args.report.write_text(text + "\n")
+    sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
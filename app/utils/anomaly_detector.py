@@ -0,0 +1,162 @@
+import math
+import threading
+from array import array
+from collections import deque
+from datetime import date
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+# metric -> (numerator, denominator, scale, adverse direction)
+TRACKED_METRICS = {
+    "ctr": ("clicks", "impressions", 100, -1),
+    "cost_per_click": ("spend", "clicks", 1, 1),
+    "conversion_rate": ("conversions", "clicks", 100, -1),
+    "roi": (None, "spend", 100, -1),
+}
+
+METRIC_LABELS = {
+    "ctr": "CTR",
+    "cost_per_click": "Cost per click",
+    "conversion_rate": "Conversion rate",
+    "roi": "ROI",
+}
+
+
+def period_rates(metrics: Dict) -> Dict[str, float]:
+    """Rate metrics for one period's totals, skipping any with a zero denominator"""
+    rates = {}
+    for name, (numerator, denominator, scale, _) in TRACKED_METRICS.items():
+        base = float(metrics.get(denominator) or 0)
+        if base <= 0:
+            continue
+        if name == "roi":
+            value = float(metrics.get("revenue") or 0) - base
+        else:
+            value = float(metrics.get(numerator) or 0)
+        rates[name] = value / base * scale
+    return rates
+
+
+class AnomalyDetector:
+    """
+    Streaming per-campaign anomaly detection over CTR, CPC, conversion rate and
+    ROI. Each campaign keeps an exponentially weighted mean and variance per
+    metric in flat arrays (O(1) state and update cost). Updates are winsorized
+    to the alert band, so a single outlier cannot drag the baseline with it.
+    """
+
+    def __init__(self,
+                 alpha: float = 0.2,
+                 z_threshold: float = 3.0,
+                 min_observations: int = 7,
+                 max_alerts_per_campaign: int = 20):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.min_observations = min_observations
+        self.max_alerts_per_campaign = max_alerts_per_campaign
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every baseline and alert"""
+        with self._lock:
+            self._slots: Dict[str, int] = {}
+            self._mean = {metric: array('d') for metric in TRACKED_METRICS}
+            self._var = {metric: array('d') for metric in TRACKED_METRICS}
+            self._count = {metric: array('l') for metric in TRACKED_METRICS}
+            self._alerts: Dict[str, Deque[Dict]] = {}
+
+    def _slot(self, campaign_id: str) -> int:
+        slot = self._slots.get(campaign_id)
+        if slot is None:
+            slot = self._slots[campaign_id] = len(self._slots)
+            for metric in TRACKED_METRICS:
+                self._mean[metric].append(0.0)
+                self._var[metric].append(0.0)
+                self._count[metric].append(0)
+        return slot
+
+    def observe(self, campaign_id: str, metrics: Dict, day: Optional[date] = None) -> List[Dict]:
+        """Consume one period's totals for a campaign and return any new alerts"""
+        rates = period_rates(metrics)
+        alerts = []
+        with self._lock:
+            slot = self._slot(campaign_id)
+            for metric, value in rates.items():
+                alert = self._update(campaign_id, slot, metric, value, day)
+                if alert:
+                    alerts.append(alert)
+            if alerts:
+                history = self._alerts.setdefault(campaign_id, deque(maxlen=self.max_alerts_per_campaign))
+                history.extend(alerts)
+        return alerts
+
+    def observe_many(self, updates: Iterable[Tuple[str, Dict, Optional[date]]]) -> List[Dict]:
+        alerts = []
+        for campaign_id, metrics, day in updates:
+            alerts.extend(self.observe(campaign_id, metrics, day))
+        return alerts
+
+    def _update(self, campaign_id: str, slot: int, metric: str, value: float, day: Optional[date]) -> Optional[Dict]:
+        means, variances, counts = self._mean[metric], self._var[metric], self._count[metric]
+        count = counts[slot]
+        if count == 0:
+            means[slot] = value
+            counts[slot] = 1
+            return None
+
+        mean, variance = means[slot], variances[slot]
+        std = math.sqrt(variance)
+        # Floor the spread at 5% of the mean so very steady series don't alert on noise
+        spread = max(std, abs(mean) * 0.05, 1e-9)
+        z_score = (value - mean) / spread
+
+        alert = None
+        if count >= self.min_observations and abs(z_score) >= self.z_threshold:
+            adverse = TRACKED_METRICS[metric][3] * z_score > 0
+            alert = {
+                "campaign_id": campaign_id,
+                "metric": metric,
+                "day": day.isoformat() if day else None,
+                "value": value,
+                "baseline": mean,
+                "z_score": z_score,
+                "adverse": adverse,
+                "message": (
+                    f"{METRIC_LABELS[metric]} {'rose' if z_score > 0 else 'fell'} to {value:,.2f} "
+                    f"against a baseline of {mean:,.2f} (z={z_score:+.1f})"
+                )
+            }
+
+        # Winsorize so the anomaly itself only nudges the baseline
+        bound = self.z_threshold * spread
+        clipped = min(max(value, mean - bound), mean + bound) if count >= self.min_observations else value
+        diff = clipped - mean
+        increment = self.alpha * diff
+        means[slot] = mean + increment
+        variances[slot] = (1 - self.alpha) * (variance + diff * increment)
+        counts[slot] = count + 1
+        return alert
+
+    def baseline(self, campaign_id: str) -> Optional[Dict]:
+        slot = self._slots.get(campaign_id)
+        if slot is None:
+            return None
+        return {
+            metric: {
+                "mean": self._mean[metric][slot],
+                "std": math.sqrt(self._var[metric][slot]),
+                "observations": self._count[metric][slot]
+            }
+            for metric in TRACKED_METRICS
+        }
+
+    def recent_alerts(self, campaign_id: str, since: Optional[date] = None) -> List[Dict]:
+        """Alerts for a campaign, optionally only those on or after a given day"""
+        alerts = list(self._alerts.get(campaign_id, ()))
+        if since is not None:
+            cutoff = since.isoformat()
+            alerts = [alert for alert in alerts if alert["day"] and alert["day"] >= cutoff]
+        return alerts
+
+    def __len__(self) -> int:
+        return len(self._slots)
@@ -0,0 +1,159 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.utils.anomaly_detector import METRIC_LABELS, TRACKED_METRICS, period_rates
+from app.utils.campaign_record import as_record
+from app.utils.quantile_sketch import TDigest
+from app.utils.verticals import classify_vertical
+
+PORTFOLIO_SEGMENT = "all"
+DEFAULT_MIN_SAMPLES = 20
+# Percentile (from the adverse side) at which a metric is flagged as an issue
+DEFAULT_ADVERSE_PERCENTILE = 25
+
+
+def ordinal(n: int) -> str:
+    if 10 <= n % 100 <= 20:
+        suffix = "th"
+    else:
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def format_metric(metric: str, value: float) -> str:
+    if metric == "cost_per_click":
+        return f"${value:,.2f}"
+    return f"{value:,.2f}%"
+
+
+def describe_benchmark(metric: str, comparison: Dict) -> str:
+    """e.g. 'CTR at the 12th percentile of fintech campaigns (median 2.10%)'"""
+    segment = comparison["segment"]
+    peers = "all campaigns" if segment == PORTFOLIO_SEGMENT else f"{segment} campaigns"
+    return (
+        f"{METRIC_LABELS[metric]} at the {ordinal(round(comparison['percentile']))} percentile "
+        f"of {peers} (median {format_metric(metric, comparison['median'])})"
+    )
+
+
+def format_comparison(comparison: List[Dict]) -> str:
+    """
+    One line per compared campaign: spend, revenue and rate metrics, with the
+    percentile of each rate within the campaign's benchmark segment.
+    """
+    lines = []
+    for entry in comparison:
+        campaign = as_record(entry["campaign_data"])
+        benchmarks = (entry.get("analysis") or {}).get("benchmarks") or campaign.get("benchmarks") or {}
+        rates = []
+        for metric, value in campaign.rates.items():
+            rate = f"{METRIC_LABELS[metric]} {format_metric(metric, value)}"
+            if metric in benchmarks:
+                rate += f" ({ordinal(round(benchmarks[metric]['percentile']))} pct)"
+            rates.append(rate)
+        lines.append(
+            f"- {campaign.name} ({campaign.campaign_id}, {classify_vertical(campaign)}): "
+            f"spend ${campaign.spend:,.2f}, revenue ${campaign.revenue:,.2f}, " + ", ".join(rates)
+        )
+    return "\n".join(lines)
+
+
+class PortfolioBenchmarks:
+    """
+    Per-vertical distributions of CTR, CPC, conversion rate and ROI across the
+    campaign store, held as t-digest sketches so that a campaign's percentile
+    is a binary search rather than a portfolio scan. Every campaign is also
+    added to the portfolio-wide segment, which is used for verticals with too
+    few campaigns to benchmark against.
+    """
+
+    def __init__(self,
+                 min_samples: Optional[int] = None,
+                 adverse_percentile: Optional[float] = None,
+                 compression: float = 100):
+        self.min_samples = (
+            min_samples if min_samples is not None
+            else int(os.getenv("BENCHMARK_MIN_SAMPLES", DEFAULT_MIN_SAMPLES))
+        )
+        self.adverse_percentile = (
+            adverse_percentile if adverse_percentile is not None
+            else float(os.getenv("BENCHMARK_ADVERSE_PERCENTILE", DEFAULT_ADVERSE_PERCENTILE))
+        )
+        self.compression = compression
+        self._sketches: Dict[Tuple[str, str], TDigest] = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, campaigns: Iterable[Dict]):
+        """Recompute every sketch, e.g. after campaigns were overwritten"""
+        sketches: Dict[Tuple[str, str], TDigest] = {}
+        for campaign in campaigns:
+            self._add(sketches, campaign)
+        with self._lock:
+            self._sketches = sketches
+
+    def add_many(self, campaigns: Iterable[Dict]):
+        with self._lock:
+            for campaign in campaigns:
+                self._add(self._sketches, campaign)
+
+    def _add(self, sketches: Dict[Tuple[str, str], TDigest], campaign: Dict):
+        vertical = classify_vertical(campaign)
+        for metric, value in period_rates(campaign).items():
+            for segment in (vertical, PORTFOLIO_SEGMENT):
+                sketch = sketches.get((segment, metric))
+                if sketch is None:
+                    sketch = sketches[(segment, metric)] = TDigest(self.compression)
+                sketch.add(value)
+
+    def _segment_sketch(self, vertical: str, metric: str) -> Optional[Tuple[str, TDigest]]:
+        """The most specific segment with enough campaigns to compare against"""
+        for segment in (vertical, PORTFOLIO_SEGMENT):
+            sketch = self._sketches.get((segment, metric))
+            if sketch is not None and sketch.count >= self.min_samples:
+                return segment, sketch
+        return None
+
+    def percentile(self, metric: str, value: float, segment: str = PORTFOLIO_SEGMENT) -> Optional[float]:
+        """Percentile (0-100) of value within a segment, or None if the segment is too small"""
+        with self._lock:
+            sketch = self._sketches.get((segment, metric))
+            if sketch is None or sketch.count < self.min_samples:
+                return None
+            return sketch.cdf(value) * 100
+
+    def compare(self, campaign: Dict) -> Dict[str, Dict]:
+        """Percentile and segment quartiles for each of a campaign's rate metrics"""
+        vertical = classify_vertical(campaign)
+        comparisons = {}
+        with self._lock:
+            for metric, value in period_rates(campaign).items():
+                found = self._segment_sketch(vertical, metric)
+                if found is None:
+                    continue
+                segment, sketch = found
+                percentile = sketch.cdf(value) * 100
+                # Adverse direction is -1 where low values are bad, 1 where high values are
+                adverse_direction = TRACKED_METRICS[metric][3]
+                comparisons[metric] = {
+                    "value": value,
+                    "percentile": percentile,
+                    "segment": segment,
+                    "sample_size": int(sketch.count),
+                    "p25": sketch.quantile(0.25),
+                    "median": sketch.quantile(0.5),
+                    "p75": sketch.quantile(0.75),
+                    "adverse": (
+                        percentile <= self.adverse_percentile if adverse_direction < 0
+                        else percentile >= 100 - self.adverse_percentile
+                    ),
+                }
+        return comparisons
+
+    def segment_sizes(self) -> Dict[str, int]:
+        """Campaigns per segment with at least one benchmarked metric"""
+        with self._lock:
+            sizes: Dict[str, int] = {}
+            for (segment, _), sketch in self._sketches.items():
+                sizes[segment] = max(sizes.get(segment, 0), int(sketch.count))
+            return sizes
@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.campaign_store import CampaignStore
+from app.utils.timeseries import TimeSeriesStore
+
+OBJECTIVES = ("revenue", "roi")
+
+# Response curves are revenue = a * spend ** b with 0 < b < 1 (diminishing returns)
+DEFAULT_ELASTICITY = 0.7
+MIN_ELASTICITY = 0.05
+MAX_ELASTICITY = 0.95
+MIN_HISTORY_DAYS = 7
+# Days of history at which a fitted elasticity and the portfolio prior weigh equally
+PRIOR_WEIGHT_DAYS = 14
+# Fitted campaigns needed before their median replaces DEFAULT_ELASTICITY as the prior
+MIN_PRIOR_CAMPAIGNS = 5
+DEFAULT_MAX_CHANGE = 0.5
+DEFAULT_PLAN_TTL_SECONDS = 300
+
+
+def fit_elasticities(spend: np.ndarray, revenue: np.ndarray, prior: Optional[float] = None) -> np.ndarray:
+    """
+    Per-campaign elasticity b from a log-log regression of daily revenue on
+    daily spend. spend and revenue are (campaigns, days) arrays with NaN for
+    missing days. Short or flat histories are shrunk towards the portfolio
+    median (or DEFAULT_ELASTICITY when too few campaigns could be fitted).
+    """
+    valid = (spend > 0) & (revenue > 0)
+    n = valid.sum(axis=1)
+    log_spend = np.where(valid, np.log(np.where(valid, spend, 1.0)), 0.0)
+    log_revenue = np.where(valid, np.log(np.where(valid, revenue, 1.0)), 0.0)
+    counts = np.maximum(n, 1)
+    centered_spend = np.where(valid, log_spend - (log_spend.sum(axis=1) / counts)[:, None], 0.0)
+    centered_revenue = np.where(valid, log_revenue - (log_revenue.sum(axis=1) / counts)[:, None], 0.0)
+    variance = (centered_spend ** 2).sum(axis=1)
+    covariance = (centered_spend * centered_revenue).sum(axis=1)
+
+    fitted = (n >= MIN_HISTORY_DAYS) & (variance > 1e-6)
+    slope = np.clip(
+        np.divide(covariance, variance, out=np.zeros_like(variance), where=fitted),
+        MIN_ELASTICITY, MAX_ELASTICITY
+    )
+    if prior is None:
+        prior = float(np.median(slope[fitted])) if fitted.sum() >= MIN_PRIOR_CAMPAIGNS else DEFAULT_ELASTICITY
+    weight = np.where(fitted, n / (n + PRIOR_WEIGHT_DAYS), 0.0)
+    return weight * slope + (1 - weight) * prior
+
+
+def calibrate_scale(spend: np.ndarray, revenue: np.ndarray, elasticity: np.ndarray) -> np.ndarray:
+    """Scale a so that each curve passes through the campaign's current (spend, revenue)"""
+    safe_spend = np.where(spend > 0, spend, 1.0)
+    return np.where((spend > 0) & (revenue > 0), revenue / safe_spend ** elasticity, 0.0)
+
+
+def optimize_allocation(scale: np.ndarray,
+                        elasticity: np.ndarray,
+                        budget: float,
+                        lower: np.ndarray,
+                        upper: np.ndarray,
+                        objective: str = "revenue",
+                        iterations: int = 100) -> np.ndarray:
+    """
+    Spend per campaign maximizing sum(a * x ** b) subject to sum(x) <= budget
+    and lower <= x <= upper. By the KKT conditions every unclipped campaign
+    has the same marginal revenue lambda, so x(lambda) has a closed form and
+    lambda is found by bisection on the total spend.
+
+    "revenue" spends the whole budget where the bounds allow. "roi" never
+    buys revenue at a marginal return below $1 per $1, so it may leave part
+    of the budget unspent.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {', '.join(OBJECTIVES)}")
+    if lower.sum() > budget * (1 + 1e-9):
+        raise ValueError(f"Budget {budget:,.2f} is below the sum of per-campaign minimums {lower.sum():,.2f}")
+
+    active = (scale > 0) & (upper > lower)
+    gain = np.where(active, scale * elasticity, 0.0)
+    exponent = 1.0 / (1.0 - elasticity)
+
+    def spend_at(log_lam: float) -> np.ndarray:
+        # x = (a * b / lambda) ** (1 / (1 - b)), computed in log space to avoid overflow
+        with np.errstate(divide="ignore"):
+            log_x = (np.log(np.where(active, gain, 1.0)) - log_lam) * exponent
+        return np.where(active, np.clip(np.exp(np.minimum(log_x, 700)), lower, upper), lower)
+
+    if not active.any():
+        return lower.copy()
+
+    # Bracket lambda between the marginal revenues at the upper and lower bounds
+    with np.errstate(divide="ignore"):
+        marginal_low = np.log(gain[active]) + (elasticity[active] - 1) * np.log(np.maximum(upper[active], 1e-9))
+        marginal_high = np.log(gain[active]) + (elasticity[active] - 1) * np.log(np.maximum(lower[active], 1e-9))
+    lo, hi = float(marginal_low.min()) - 1.0, float(marginal_high.max()) + 1.0
+
+    floor = 0.0 if objective == "roi" else None  # log(1): marginal return of $1 per $1
+    if spend_at(lo).sum() <= budget:
+        return spend_at(max(lo, floor) if floor is not None else lo)
+
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        if spend_at(mid).sum() > budget:
+            lo = mid
+        else:
+            hi = mid
+    return spend_at(max(hi, floor) if floor is not None else hi)
+
+
+class BudgetPlan:
+    """Result of one optimization run over the portfolio"""
+
+    def __init__(self,
+                 campaign_ids: List[str],
+                 names: List[str],
+                 current_spend: np.ndarray,
+                 current_revenue: np.ndarray,
+                 recommended_spend: np.ndarray,
+                 scale: np.ndarray,
+                 elasticity: np.ndarray,
+                 budget: float,
+                 objective: str):
+        self.campaign_ids = campaign_ids
+        self.names = names
+        self.current_spend = current_spend
+        self.current_revenue = current_revenue
+        self.recommended_spend = recommended_spend
+        self.scale = scale
+        self.elasticity = elasticity
+        self.budget = budget
+        self.objective = objective
+        # Campaigns without a calibrated curve keep their current revenue
+        self.expected_revenue = np.where(
+            scale > 0, scale * recommended_spend ** elasticity, current_revenue
+        )
+        self._index = {campaign_id: i for i, campaign_id in enumerate(campaign_ids)}
+
+    def _row(self, i: int) -> Dict:
+        current, recommended = float(self.current_spend[i]), float(self.recommended_spend[i])
+        expected = float(self.expected_revenue[i])
+        marginal = (
+            float(self.scale[i] * self.elasticity[i] * recommended ** (self.elasticity[i] - 1))
+            if self.scale[i] > 0 and recommended > 0 else None
+        )
+        return {
+            "campaign_id": self.campaign_ids[i],
+            "name": self.names[i],
+            "current_spend": current,
+            "recommended_spend": recommended,
+            "spend_change": recommended - current,
+            "spend_change_pct": (recommended - current) / current * 100 if current else None,
+            "current_revenue": float(self.current_revenue[i]),
+            "expected_revenue": expected,
+            "expected_roi": (expected - recommended) / recommended * 100 if recommended else None,
+            "marginal_revenue_per_dollar": marginal,
+            "elasticity": float(self.elasticity[i]),
+        }
+
+    def allocation_for(self, campaign_id: str) -> Optional[Dict]:
+        i = self._index.get(campaign_id)
+        return self._row(i) if i is not None else None
+
+    def totals(self) -> Dict:
+        current_spend, recommended_spend = float(self.current_spend.sum()), float(self.recommended_spend.sum())
+        current_revenue, expected_revenue = float(self.current_revenue.sum()), float(self.expected_revenue.sum())
+        return {
+            "objective": self.objective,
+            "budget": self.budget,
+            "campaigns": len(self.campaign_ids),
+            "current_spend": current_spend,
+            "recommended_spend": recommended_spend,
+            "current_revenue": current_revenue,
+            "expected_revenue": expected_revenue,
+            "revenue_change": expected_revenue - current_revenue,
+            "current_roi": (current_revenue - current_spend) / current_spend * 100 if current_spend else None,
+            "expected_roi": (
+                (expected_revenue - recommended_spend) / recommended_spend * 100 if recommended_spend else None
+            ),
+        }
+
+    def to_dict(self, top_n: int = 10) -> Dict:
+        """Portfolio totals plus the largest spend moves"""
+        change = np.abs(self.recommended_spend - self.current_spend)
+        top = np.argsort(-change, kind="stable")[:top_n]
+        return {**self.totals(), "largest_moves": [self._row(int(i)) for i in top if change[i] > 0.005]}
+
+
+class BudgetOptimizer:
+    """
+    Reallocates spend across every campaign in the store. Elasticities come
+    from each campaign's daily history, and each curve is anchored at the
+    campaign's current spend and revenue. Plans are cached for a short TTL.
+    """
+
+    def __init__(self,
+                 campaign_store: CampaignStore,
+                 timeseries_store: Optional[TimeSeriesStore] = None,
+                 max_change: Optional[float] = None,
+                 ttl_seconds: Optional[float] = None):
+        self.campaign_store = campaign_store
+        self.timeseries_store = timeseries_store
+        self.max_change = (
+            max_change if max_change is not None
+            else float(os.getenv("BUDGET_MAX_CHANGE", DEFAULT_MAX_CHANGE))
+        )
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None
+            else float(os.getenv("BUDGET_PLAN_TTL_SECONDS", DEFAULT_PLAN_TTL_SECONDS))
+        )
+        self._lock = threading.Lock()
+        self._plans: Dict[Tuple[Optional[float], str], Tuple[float, BudgetPlan]] = {}
+
+    def _portfolio_arrays(self) -> Tuple[List[str], List[str], Dict[str, np.ndarray]]:
+        campaign_ids, names, columns = [], [], {"spend": [], "revenue": [], "min_spend": [], "max_spend": []}
+        for record in self.campaign_store.iter_campaigns():
+            campaign_ids.append(record["campaign_id"])
+            names.append(record.get("name") or record["campaign_id"])
+            columns["spend"].append(float(record.get("spend") or 0))
+            columns["revenue"].append(float(record.get("revenue") or 0))
+            # Explicit per-campaign bounds on the record take precedence over max_change
+            columns["min_spend"].append(float(record["min_spend"]) if record.get("min_spend") not in (None, "") else np.nan)
+            columns["max_spend"].append(float(record["max_spend"]) if record.get("max_spend") not in (None, "") else np.nan)
+        return campaign_ids, names, {key: np.asarray(values, dtype=float) for key, values in columns.items()}
+
+    def _daily_history(self, campaign_ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        days = self.timeseries_store.capacity if self.timeseries_store else 0
+        spend = np.full((len(campaign_ids), days), np.nan)
+        revenue = np.full((len(campaign_ids), days), np.nan)
+        if self.timeseries_store is None:
+            return spend, revenue
+        for i, campaign_id in enumerate(campaign_ids):
+            series = self.timeseries_store.get(campaign_id)
+            if series is None or not series.length:
+                continue
+            spend_column, revenue_column = series.column("spend"), series.column("revenue")
+            spend[i, :len(spend_column)] = spend_column
+            revenue[i, :len(revenue_column)] = revenue_column
+        return spend, revenue
+
+    def plan(self, budget: Optional[float] = None, objective: str = "revenue", refresh: bool = False) -> BudgetPlan:
+        """
+        Optimal reallocation of budget (default: current total spend). Each
+        campaign may move by at most max_change of its current spend unless
+        its record carries min_spend/max_spend.
+        """
+        key = (budget, objective)
+        with self._lock:
+            cached = self._plans.get(key)
+        if cached and not refresh and time.monotonic() - cached[0] < self.ttl_seconds:
+            return cached[1]
+
+        campaign_ids, names, columns = self._portfolio_arrays()
+        spend, revenue = columns["spend"], columns["revenue"]
+        elasticity = fit_elasticities(*self._daily_history(campaign_ids))
+        scale = calibrate_scale(spend, revenue, elasticity)
+
+        lower = np.where(np.isnan(columns["min_spend"]), spend * (1 - self.max_change), columns["min_spend"])
+        upper = np.where(np.isnan(columns["max_spend"]), spend * (1 + self.max_change), columns["max_spend"])
+        # Campaigns without a curve to optimize hold their current spend
+        lower = np.where(scale > 0, np.maximum(lower, 0.0), spend)
+        upper = np.where(scale > 0, np.maximum(upper, lower), spend)
+
+        total_budget = float(spend.sum()) if budget is None else float(budget)
+        recommended = optimize_allocation(scale, elasticity, total_budget, lower, upper, objective)
+        plan = BudgetPlan(campaign_ids, names, spend, revenue, recommended, scale, elasticity, total_budget, objective)
+        with self._lock:
+            self._plans[key] = (time.monotonic(), plan)
+        return plan
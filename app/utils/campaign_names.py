@@ -0,0 +1,279 @@
+import math
+import os
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.utils.verticals import normalize_text
+
+# Minimum trigram Jaccard similarity for a fuzzy name match
+DEFAULT_MIN_SIMILARITY = 0.5
+# Shorter mentions only match exactly or as an unambiguous prefix
+MIN_FUZZY_CHARS = 5
+MIN_PREFIX_CHARS = 4
+MAX_MENTION_WORDS = 6
+# A fuzzy match must beat the runner-up by this much to identify one campaign
+AMBIGUITY_MARGIN = 0.05
+# Phrases whose rarest trigrams still hit more names than this are too generic to resolve
+MAX_FUZZY_CANDIDATES = 100_000
+
+_EMPTY = np.zeros(0, dtype=np.uint32)
+
+# Words that never start or end a campaign mention in a question
+MENTION_STOPWORDS = frozenset("""
+a an and are as at be but by can compare compared compares comparing did do does doing for from has have how
+in is it its me of on or our perform performance performing show tell than that the their this to versus vs
+was we were what which why with how's what's
+""".split())
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _key(text: str) -> str:
+    return normalize_text(text).strip()
+
+
+def _id_key(text: str) -> str:
+    """IDs match regardless of case and separators, so 'campaign-001' finds CAMPAIGN001"""
+    return _key(text).replace(" ", "")
+
+
+class CampaignNameIndex:
+    """
+    Typo-tolerant lookup of campaigns by name or ID. Names are held in a
+    trigram inverted index of compact, sorted uint32 posting arrays, which
+    serves both prefix and fuzzy matches. Candidates are drawn only from the
+    postings of a query's rarest trigrams, so the posting lists of common
+    trigrams are binary-searched rather than scanned. Renamed campaigns
+    leave dead entries behind until the next rebuild.
+    """
+
+    def __init__(self, min_similarity: Optional[float] = None):
+        self.min_similarity = (
+            min_similarity if min_similarity is not None
+            else float(os.getenv("CAMPAIGN_MATCH_THRESHOLD", DEFAULT_MIN_SIMILARITY))
+        )
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._keys: List[str] = []
+        self._names: List[str] = []
+        self._owners: List[str] = []
+        self._trigram_counts = array("H")
+        self._postings: Dict[str, array] = {}
+        self._exact: Dict[str, List[int]] = {}
+        self._ids: Dict[str, str] = {}
+        self._entries: Dict[str, int] = {}
+        self.max_words = 1
+
+    def rebuild(self, campaigns: Iterable[Dict]):
+        with self._lock:
+            self._reset()
+        self.upsert_many(campaigns)
+
+    def upsert_many(self, campaigns: Iterable[Dict]):
+        """Index campaign names and IDs; a new name for a known campaign replaces the old one"""
+        with self._lock:
+            for campaign in campaigns:
+                campaign_id = campaign["campaign_id"]
+                name = str(campaign.get("name") or campaign_id)
+                self._ids[_id_key(campaign_id)] = campaign_id
+                key = _key(name)
+                entry = self._entries.get(campaign_id)
+                if entry is not None and self._keys[entry] == key:
+                    self._names[entry] = name
+                    continue
+                if not key:
+                    self._entries.pop(campaign_id, None)
+                    continue
+
+                entry = len(self._keys)
+                self._keys.append(key)
+                self._names.append(name)
+                self._owners.append(campaign_id)
+                self._entries[campaign_id] = entry
+                grams = trigrams(key)
+                self._trigram_counts.append(min(len(grams), 0xFFFF))
+                for gram in grams:
+                    postings = self._postings.get(gram)
+                    if postings is None:
+                        postings = self._postings[gram] = array("I")
+                    postings.append(entry)
+                self._exact.setdefault(key, []).append(entry)
+                self.max_words = min(max(self.max_words, key.count(" ") + 1), MAX_MENTION_WORDS)
+
+    def _live(self, entry: int) -> bool:
+        return self._entries.get(self._owners[entry]) == entry
+
+    def _match(self, entry: int, score: float, kind: str) -> Dict:
+        return {"campaign_id": self._owners[entry], "name": self._names[entry], "score": score, "match": kind}
+
+    def lookup_id(self, text: str) -> Optional[str]:
+        return self._ids.get(_id_key(text))
+
+    def exact(self, key: str) -> List[int]:
+        return [entry for entry in self._exact.get(key, ()) if self._live(entry)]
+
+    def _postings_of(self, gram: str) -> np.ndarray:
+        postings = self._postings.get(gram)
+        return np.frombuffer(postings, dtype=np.uint32) if postings else _EMPTY
+
+    def _overlaps(self,
+                  grams: Set[str],
+                  required: int,
+                  max_candidates: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Entries sharing at least `required` of grams, with how many they share.
+        Candidates come only from the postings of the rarest grams - an entry
+        missing all of them cannot reach `required` - and the remaining, more
+        common grams are checked by binary search, as postings are sorted.
+        Nothing is returned when the candidates would exceed max_candidates.
+        """
+        rarest = sorted((self._postings_of(gram) for gram in grams), key=len)
+        seed = rarest[:len(rarest) - required + 1]
+        seed_size = sum(len(postings) for postings in seed)
+        if not seed_size or (max_candidates is not None and seed_size > max_candidates):
+            return _EMPTY, _EMPTY
+        candidates, counts = np.unique(np.concatenate(seed), return_counts=True)
+        for postings in rarest[len(seed):]:
+            if len(postings):
+                positions = np.minimum(np.searchsorted(postings, candidates), len(postings) - 1)
+                counts += postings[positions] == candidates
+        keep = counts >= required
+        return candidates[keep], counts[keep]
+
+    def prefixed(self, key: str, limit: int = 2) -> List[int]:
+        """Up to limit live entries whose name starts with key"""
+        # A name starting with key contains every trigram of " key"
+        padded = f" {key}"
+        grams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+        candidates, _ = self._overlaps(grams, len(grams))
+        found = []
+        for entry in candidates.tolist():
+            if self._keys[entry].startswith(key) and self._live(entry):
+                found.append(entry)
+                if len(found) == limit:
+                    break
+        return found
+
+    def fuzzy(self, key: str, limit: int = 5) -> List[Tuple[int, float]]:
+        """(entry, Jaccard similarity) of names at or above min_similarity, best first"""
+        query = trigrams(key)
+        threshold = self.min_similarity
+        # Jaccard >= threshold needs an overlap of at least threshold * len(query)
+        candidates, overlap = self._overlaps(
+            query, max(1, math.ceil(threshold * len(query))), MAX_FUZZY_CANDIDATES
+        )
+        if not len(candidates):
+            return []
+        sizes = np.frombuffer(self._trigram_counts, dtype=np.uint16)[candidates]
+        similarity = overlap / (len(query) + sizes.astype(np.float64) - overlap)
+        order = np.flatnonzero(similarity >= threshold)
+        order = order[np.argsort(-similarity[order], kind="stable")]
+        scored = []
+        for position in order.tolist():
+            entry = int(candidates[position])
+            if self._live(entry):
+                scored.append((entry, float(similarity[position])))
+                if len(scored) == limit:
+                    break
+        return scored
+
+    def search(self, text: str, limit: int = 5) -> List[Dict]:
+        """Best matches for a typed name or ID: exact, then prefix, then fuzzy"""
+        key = _key(text)
+        if not key:
+            return []
+        with self._lock:
+            matches, seen = [], set()
+
+            def add(entry: int, score: float, kind: str):
+                if entry not in seen and len(matches) < limit:
+                    seen.add(entry)
+                    matches.append(self._match(entry, score, kind))
+
+            campaign_id = self._ids.get(key.replace(" ", ""))
+            if campaign_id is not None and campaign_id in self._entries:
+                add(self._entries[campaign_id], 1.0, "id")
+            for entry in self.exact(key):
+                add(entry, 1.0, "exact")
+            for entry in self.prefixed(key, limit):
+                add(entry, len(key) / len(self._keys[entry]), "prefix")
+            for entry, similarity in self.fuzzy(key, limit):
+                add(entry, similarity, "fuzzy")
+            return matches
+
+    def _exact_for_phrase(self, phrase: str) -> List[Tuple[int, float, str]]:
+        campaign_id = self._ids.get(phrase.replace(" ", ""))
+        if campaign_id is not None and campaign_id in self._entries:
+            return [(self._entries[campaign_id], 1.0, "id")]
+        return [(entry, 1.0, "exact") for entry in self.exact(phrase)]
+
+    def _approximate_for_phrase(self, phrase: str) -> List[Tuple[int, float, str]]:
+        if len(phrase) >= MIN_PREFIX_CHARS:
+            prefixed = self.prefixed(phrase, limit=2)
+            # Only an unambiguous prefix identifies a campaign; a shared one
+            # (e.g. "fintech" for two fintech campaigns) is not a typo either
+            if len(prefixed) > 1:
+                return []
+            if prefixed:
+                coverage = len(phrase) / len(self._keys[prefixed[0]])
+                if coverage >= self.min_similarity:
+                    return [(prefixed[0], coverage, "prefix")]
+        if len(phrase) >= MIN_FUZZY_CHARS:
+            best = self.fuzzy(phrase, limit=2)
+            if len(best) > 1 and best[0][1] - best[1][1] < AMBIGUITY_MARGIN:
+                return []
+            if best:
+                return [(best[0][0], best[0][1], "fuzzy")]
+        return []
+
+    def _spans(self, words: List[str], covered: Set[int]) -> Iterable[Tuple[int, int]]:
+        """Word ranges that could be a mention: no stopword at either end and no covered word"""
+        for start in range(len(words)):
+            if words[start] in MENTION_STOPWORDS:
+                continue
+            for end in range(start + 1, min(start + self.max_words, len(words)) + 1):
+                if end - 1 in covered:
+                    break
+                if words[end - 1] not in MENTION_STOPWORDS:
+                    yield start, end
+
+    def resolve(self, text: str, limit: int = 5) -> List[Dict]:
+        """
+        Campaigns mentioned in free text, in the order they are mentioned.
+        Every run of up to max_words words is looked up, exact names and IDs
+        first; words they cover are not searched again approximately. The
+        best-scoring non-overlapping mentions win, longer mentions breaking ties.
+        """
+        words = _key(text).split()
+        chosen, taken, campaigns = [], set(), set()
+
+        def choose(found):
+            found.sort(key=lambda item: (item[0], item[1]), reverse=True)
+            for score, _, start, end, entry, kind in found:
+                if taken.intersection(range(start, end)) or self._owners[entry] in campaigns:
+                    continue
+                taken.update(range(start, end))
+                campaigns.add(self._owners[entry])
+                chosen.append((start, {**self._match(entry, round(score, 3), kind),
+                                       "mention": " ".join(words[start:end])}))
+
+        with self._lock:
+            for lookup in (self._exact_for_phrase, self._approximate_for_phrase):
+                choose([
+                    (score, end - start, start, end, entry, kind)
+                    for start, end in self._spans(words, taken)
+                    for entry, score, kind in lookup(" ".join(words[start:end]))
+                ])
+        chosen.sort(key=lambda item: item[0])
+        return [match for _, match in chosen[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
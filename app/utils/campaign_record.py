@@ -0,0 +1,244 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from app.utils.anomaly_detector import TRACKED_METRICS
+
+# Field -> (type, required); the same rules apply at upload and when a campaign enters the workflow
+FIELD_TYPES = {
+    "impressions": (int, True),
+    "clicks": (int, True),
+    "conversions": (int, True),
+    "spend": (float, True),
+    "revenue": (float, True),
+    "target_ctr": (float, False),
+    "target_roi": (float, False),
+}
+
+
+class InvalidCampaignError(ValueError):
+    """A campaign failed validation; errors maps each offending field to the problem"""
+
+    def __init__(self, errors: Dict[str, str]):
+        self.errors = errors
+        super().__init__("Invalid campaign: " + "; ".join(f"{field} {problem}" for field, problem in errors.items()))
+
+
+def parse_number(value, kind):
+    if isinstance(value, str):
+        value = value.strip().replace(",", "")
+    number = float(value)
+    if number != number or number in (float("inf"), float("-inf")):
+        raise ValueError("not a finite number")
+    if number < 0:
+        raise ValueError("must not be negative")
+    if kind is int:
+        if not number.is_integer():
+            raise ValueError("must be a whole number")
+        return int(number)
+    return number
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict for the nested values of a CampaignRecord (trends,
+    benchmarks, market context, ...). It stays a dict, so JSON encoders and
+    isinstance checks treat it as one; copy it with dict() to modify it.
+    """
+
+    __slots__ = ()
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("CampaignRecord values are immutable; copy with dict() to modify")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self) -> "FrozenDict":
+        return self
+
+    def __deepcopy__(self, memo) -> "FrozenDict":
+        return self
+
+    def __reduce__(self) -> Tuple:
+        return FrozenDict, (dict(self),)
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert mappings to FrozenDicts and lists/sets to tuples/frozensets"""
+    if isinstance(value, (FrozenDict, CampaignRecord)):
+        return value
+    if isinstance(value, Mapping):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(item) for item in value)
+    return value
+
+
+def _ratio(numerator: float, denominator: float, scale: float = 1.0) -> Optional[float]:
+    return numerator / denominator * scale if denominator > 0 else None
+
+
+class CampaignRecord(Mapping):
+    """
+    Immutable campaign as it moves through the workflow. The typed metric
+    fields are validated once, when the record is built, and held in slots;
+    every other field (trends, benchmarks, market context, ...) is frozen
+    with freeze() and carried alongside, so the record still reads like the
+    dict it replaces. Derived metrics are computed on first use and
+    memoized, and since nothing can change underneath them, nodes share one
+    record by reference instead of copying it. Use with_fields() to enrich
+    a record.
+    """
+
+    __slots__ = (
+        "campaign_id", "name", "impressions", "clicks", "conversions", "spend", "revenue",
+        "target_ctr", "target_roi", "_fields", "_metrics",
+    )
+
+    campaign_id: str
+    name: str
+    impressions: int
+    clicks: int
+    conversions: int
+    spend: float
+    revenue: float
+    target_ctr: Optional[float]
+    target_roi: Optional[float]
+
+    @classmethod
+    def from_dict(cls, data: Mapping) -> "CampaignRecord":
+        """Validate and type-convert a campaign dict; raises InvalidCampaignError"""
+        fields = {key: freeze(value) for key, value in data.items()}
+        errors = {}
+        if fields.get("campaign_id") in (None, ""):
+            errors["campaign_id"] = "missing"
+        else:
+            fields["campaign_id"] = str(fields["campaign_id"])
+
+        for field, (kind, required) in FIELD_TYPES.items():
+            value = fields.get(field)
+            if value in (None, ""):
+                if required:
+                    errors[field] = "missing"
+                fields.pop(field, None)
+                continue
+            try:
+                fields[field] = parse_number(value, kind)
+            except (TypeError, ValueError) as e:
+                errors[field] = f"invalid value {value!r}: {str(e)}"
+
+        if not errors and fields["clicks"] > fields["impressions"]:
+            errors["clicks"] = "exceeds impressions"
+        if errors:
+            raise InvalidCampaignError(errors)
+        fields["name"] = str(fields.get("name") or fields["campaign_id"])
+        return cls._build(fields)
+
+    @classmethod
+    def _build(cls, fields: Dict, metrics: Optional[Dict] = None) -> "CampaignRecord":
+        """Wrap already-validated fields, taking ownership of the dict"""
+        record = object.__new__(cls)
+        set_slot = object.__setattr__
+        for field in ("campaign_id", "name", *FIELD_TYPES):
+            set_slot(record, field, fields.get(field))
+        set_slot(record, "_fields", fields)
+        set_slot(record, "_metrics", metrics)
+        return record
+
+    def __init__(self, *args, **kwargs):
+        raise TypeError("Build records with CampaignRecord.from_dict()")
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"CampaignRecord is immutable; use with_fields() to set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError("CampaignRecord is immutable")
+
+    def with_fields(self, **updates) -> "CampaignRecord":
+        """A new record with fields added or replaced; metric fields are re-validated"""
+        merged = {**self._fields, **{field: freeze(value) for field, value in updates.items()}}
+        if updates.keys() & {"campaign_id", "name", *FIELD_TYPES}:
+            return CampaignRecord.from_dict(merged)
+        return CampaignRecord._build(merged, self._metrics)
+
+    def _derived(self) -> Dict[str, Optional[float]]:
+        """Derived metrics in the units the agents report (rates in percent), None where undefined"""
+        metrics = self._metrics
+        if metrics is None:
+            metrics = {
+                "ctr": _ratio(self.clicks, self.impressions, 100),
+                "conversion_rate": _ratio(self.conversions, self.clicks, 100),
+                "cost_per_click": _ratio(self.spend, self.clicks),
+                "cost_per_conversion": _ratio(self.spend, self.conversions),
+                "roi": _ratio(self.revenue - self.spend, self.spend, 100),
+            }
+            if metrics["ctr"] is not None and self.target_ctr is not None:
+                metrics["ctr_vs_target"] = metrics["ctr"] - self.target_ctr * 100
+            if metrics["roi"] is not None and self.target_roi is not None:
+                metrics["roi_vs_target"] = metrics["roi"] - self.target_roi * 100
+            object.__setattr__(self, "_metrics", metrics)
+        return metrics
+
+    @property
+    def metrics(self) -> Dict[str, float]:
+        """Derived metrics and target gaps, leaving out any with a zero denominator"""
+        return {metric: value for metric, value in self._derived().items() if value is not None}
+
+    @property
+    def rates(self) -> Dict[str, float]:
+        """The benchmarked rate metrics that are defined for this campaign, as period_rates() returns them"""
+        derived = self._derived()
+        return {metric: derived[metric] for metric in TRACKED_METRICS if derived[metric] is not None}
+
+    @property
+    def ctr(self) -> Optional[float]:
+        return self._derived()["ctr"]
+
+    @property
+    def conversion_rate(self) -> Optional[float]:
+        return self._derived()["conversion_rate"]
+
+    @property
+    def cost_per_click(self) -> Optional[float]:
+        return self._derived()["cost_per_click"]
+
+    @property
+    def cost_per_conversion(self) -> Optional[float]:
+        return self._derived()["cost_per_conversion"]
+
+    @property
+    def roi(self) -> Optional[float]:
+        return self._derived()["roi"]
+
+    def to_dict(self) -> Dict:
+        """Shallow dict copy, for JSON responses and caches; nested values stay frozen"""
+        return dict(self._fields)
+
+    def __getitem__(self, key: str):
+        return self._fields[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def __repr__(self) -> str:
+        return f"CampaignRecord(campaign_id={self.campaign_id!r}, name={self.name!r})"
+
+    # Immutable, so copies can share the record
+    def __copy__(self) -> "CampaignRecord":
+        return self
+
+    def __deepcopy__(self, memo) -> "CampaignRecord":
+        return self
+
+    def __reduce__(self) -> Tuple:
+        return CampaignRecord._build, (dict(self._fields),)
+
+
+def as_record(data: Mapping) -> CampaignRecord:
+    """The record itself, or a validated record built from a campaign dict"""
+    return data if isinstance(data, CampaignRecord) else CampaignRecord.from_dict(data)
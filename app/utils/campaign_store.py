@@ -0,0 +1,256 @@
+import csv
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from app.utils.benchmarks import PortfolioBenchmarks
+from app.utils.campaign_names import CampaignNameIndex
+from app.utils.similarity_index import SimilarCampaignIndex
+from app.utils.verticals import TAXONOMY_PATH
+
+# APP_DATA_DIR moves the campaign data and everything written next to it, e.g. to keep test runs out of the tree
+DATA_DIR = Path(os.getenv("APP_DATA_DIR") or Path(__file__).parent.parent / "data")
+
+# Lifetime totals every campaign record is expected to carry
+METRIC_FIELDS = ("impressions", "clicks", "conversions", "spend", "revenue")
+
+INT_FIELDS = ("impressions", "clicks", "conversions")
+FLOAT_FIELDS = ("spend", "revenue", "target_ctr", "target_roi")
+
+
+def parse_date(value) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+class CampaignStore:
+    """
+    View over every campaign in the data directory. Bundled campaigns are held
+    in memory; uploaded campaigns live in an append-only NDJSON log and only
+    their byte offsets are kept in memory. Every write is also fed to the
+    portfolio benchmarks, the similar-campaign index and the name index;
+    appends made within bulk() rebuild the benchmarks and save the
+    similar-campaign index at most once, at the end.
+    """
+
+    def __init__(self,
+                 data_dir: Optional[Path] = None,
+                 benchmarks: Optional[PortfolioBenchmarks] = None,
+                 similar_campaigns: Optional[SimilarCampaignIndex] = None):
+        self.data_dir = Path(data_dir) if data_dir else DATA_DIR
+        self.benchmarks = benchmarks or PortfolioBenchmarks()
+        self.similar_campaigns = similar_campaigns or SimilarCampaignIndex(
+            self.data_dir / "index" / "similar_campaigns.npz"
+        )
+        self.names = CampaignNameIndex()
+        self.upload_log_path = self.data_dir / "uploads" / "campaigns.ndjson"
+        self.default_campaign_id: Optional[str] = None
+        self._campaigns: Dict[str, Dict] = {}
+        self._offsets: Dict[str, int] = {}
+        # Bytes of the upload log whose lines are complete and have their offsets published
+        self._log_size = 0
+        # Reentrant, since indexes are rebuilt from iter_campaigns() with it held
+        self._lock = threading.RLock()
+        self._bulk_depth = 0
+        self._benchmarks_stale = False
+        self._similar_unsaved = False
+        self.reload()
+
+    def reload(self):
+        """Load campaigns from campaign_data.json, campaigns.csv and the upload log"""
+        campaigns = {}
+        csv_path = self.data_dir / "campaigns.csv"
+        if csv_path.exists():
+            with open(csv_path, newline='') as f:
+                for row in csv.DictReader(f):
+                    record = self._convert_types(row)
+                    campaigns[record["campaign_id"]] = record
+
+        # The JSON file is the richer source, so it wins on conflicts
+        default_campaign_id = None
+        json_path = self.data_dir / "campaign_data.json"
+        if json_path.exists():
+            with open(json_path, 'r') as f:
+                data = json.load(f)
+            for record in (data if isinstance(data, list) else [data]):
+                campaigns[record["campaign_id"]] = self._convert_types(record)
+                default_campaign_id = default_campaign_id or record["campaign_id"]
+
+        # Later lines in the upload log supersede earlier ones
+        offsets = {}
+        offset = 0
+        if self.upload_log_path.exists():
+            with open(self.upload_log_path, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        offsets[json.loads(line)["campaign_id"]] = offset
+                    offset += len(line)
+
+        with self._lock:
+            self._campaigns = campaigns
+            self._offsets = offsets
+            self._log_size = offset
+            self.default_campaign_id = default_campaign_id
+        self.benchmarks.rebuild(self.iter_campaigns())
+        self.names.rebuild(self.iter_campaigns())
+
+        # The persisted index is reused as long as the source files are unchanged
+        signature = self._source_signature()
+        if not self.similar_campaigns.load(signature):
+            self.similar_campaigns.rebuild(self.iter_campaigns())
+            self.similar_campaigns.save(signature)
+
+    def _source_signature(self) -> str:
+        """Size and mtime of every file campaigns (and their verticals) are derived from"""
+        parts = []
+        for path in (self.data_dir / "campaigns.csv", self.data_dir / "campaign_data.json",
+                     self.upload_log_path, TAXONOMY_PATH):
+            if path.exists():
+                stat = path.stat()
+                parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+        return "|".join(parts)
+
+    @staticmethod
+    def _convert_types(record: Dict) -> Dict:
+        converted = dict(record)
+        for field in INT_FIELDS:
+            if converted.get(field) not in (None, ""):
+                converted[field] = int(float(converted[field]))
+        for field in FLOAT_FIELDS:
+            if converted.get(field) not in (None, ""):
+                converted[field] = float(converted[field])
+        return converted
+
+    def _read_logged(self, offset: int) -> Dict:
+        with open(self.upload_log_path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def get(self, campaign_id: str) -> Optional[Dict]:
+        """Return a copy of a campaign record, or None if it is unknown"""
+        offset = self._offsets.get(campaign_id)
+        if offset is not None:
+            return self._read_logged(offset)
+        record = self._campaigns.get(campaign_id)
+        return dict(record) if record is not None else None
+
+    def append_many(self, records: List[Dict]):
+        """Append validated campaign records to the upload log"""
+        if not records:
+            return
+        with self._lock:
+            campaign_ids = [record["campaign_id"] for record in records]
+            replaces_existing = (
+                len(set(campaign_ids)) < len(campaign_ids)
+                or any(campaign_id in self for campaign_id in campaign_ids)
+            )
+            self.upload_log_path.parent.mkdir(parents=True, exist_ok=True)
+            offsets = {}
+            with open(self.upload_log_path, 'ab') as f:
+                offset = f.tell()
+                for record in records:
+                    line = json.dumps(record, default=str).encode() + b"\n"
+                    f.write(line)
+                    offsets[record["campaign_id"]] = offset
+                    offset += len(line)
+            # Readers don't take the lock, so offsets are published only once their lines are on disk
+            self._offsets.update(offsets)
+            self._log_size = offset
+
+            # Indexes are updated under the same lock, so concurrent appends reach them in log order.
+            # Sketches can't forget a value, so overwrites mean rebuilding them, once the load is done
+            if replaces_existing or self._benchmarks_stale:
+                self._benchmarks_stale = True
+            else:
+                self.benchmarks.add_many(records)
+            self.names.upsert_many(records)
+            self.similar_campaigns.upsert_many(records)
+            # Saving rewrites the whole index, so a bulk load saves it once at the end
+            self._similar_unsaved = True
+            if not self._bulk_depth:
+                self._flush_indexes()
+
+    @contextmanager
+    def bulk(self) -> Iterator["CampaignStore"]:
+        """
+        Group the append_many calls of one load, e.g. the batches of an upload:
+        benchmark rebuilds and index saves they need happen once, at the end
+        """
+        with self._lock:
+            self._bulk_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._bulk_depth -= 1
+                if not self._bulk_depth:
+                    self._flush_indexes()
+
+    def _flush_indexes(self):
+        # Called with self._lock held
+        if self._benchmarks_stale:
+            self.benchmarks.rebuild(self.iter_campaigns())
+            self._benchmarks_stale = False
+        if self._similar_unsaved:
+            self.similar_campaigns.save(self._source_signature())
+            self._similar_unsaved = False
+
+    def iter_campaigns(self) -> Iterator[Dict]:
+        """
+        Yield every campaign as of the call, without loading the log into
+        memory; appends made meanwhile are not seen
+        """
+        with self._lock:
+            campaigns, offsets, log_size = self._campaigns, dict(self._offsets), self._log_size
+        for campaign_id, record in campaigns.items():
+            if campaign_id not in offsets:
+                yield dict(record)
+
+        if not offsets:
+            return
+        with open(self.upload_log_path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if offset >= log_size:
+                    break
+                if line.strip():
+                    record = json.loads(line)
+                    if offsets.get(record["campaign_id"]) == offset:
+                        yield record
+                offset += len(line)
+
+    def list_campaigns(self) -> List[Dict]:
+        return list(self.iter_campaigns())
+
+    def list_active_campaigns(self,
+                              today: Optional[date] = None,
+                              active_within_days: int = 0) -> List[Dict]:
+        """
+        Campaigns that have started and have not ended more than
+        active_within_days ago. Campaigns without dates count as active.
+        """
+        today = today or date.today()
+        active = []
+        for record in self.iter_campaigns():
+            start = parse_date(record.get("start_date"))
+            end = parse_date(record.get("end_date"))
+            if start and start > today:
+                continue
+            if end and (today - end).days > active_within_days:
+                continue
+            active.append(record)
+        return active
+
+    def __contains__(self, campaign_id: str) -> bool:
+        return campaign_id in self._offsets or campaign_id in self._campaigns
+
+    def __len__(self) -> int:
+        return len(self._offsets) + sum(1 for campaign_id in self._campaigns if campaign_id not in self._offsets)
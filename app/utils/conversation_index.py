@@ -0,0 +1,348 @@
+import json
+import math
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.utils.knowledge_index import BM25_B, BM25_K1, tokenize
+
+# Tombstoned messages are compacted away once there are more of them than
+# live ones, and at least this many
+COMPACT_MIN_DELETED = 10_000
+
+
+class _Postings:
+    """
+    A term's postings: message numbers in ascending order and their term
+    frequencies, plus the largest frequency and shortest message seen, which
+    bound the term's score. Entries below size are never written again, and
+    growing copies into new arrays, so a search can read a snapshot without
+    the lock while add() carries on.
+    """
+    __slots__ = ("docs", "freqs", "size", "max_tf", "min_length")
+
+    def __init__(self, docs: np.ndarray, freqs: np.ndarray, min_length: int):
+        self.docs = docs
+        self.freqs = freqs
+        self.size = len(docs)
+        self.max_tf = int(freqs.max()) if len(freqs) else 0
+        self.min_length = min_length
+
+    @classmethod
+    def empty(cls) -> "_Postings":
+        postings = cls(np.zeros(4, dtype=np.uint32), np.zeros(4, dtype=np.uint16), np.iinfo(np.uint32).max)
+        postings.size = 0
+        return postings
+
+    def append(self, doc: int, tf: int, length: int):
+        if self.size == len(self.docs):
+            for name in ("docs", "freqs"):
+                old = getattr(self, name)
+                new = np.zeros(len(old) * 2, dtype=old.dtype)
+                new[:self.size] = old
+                setattr(self, name, new)
+        self.docs[self.size] = doc
+        self.freqs[self.size] = tf
+        self.size += 1
+        self.max_tf = max(self.max_tf, tf)
+        self.min_length = min(self.min_length, length)
+
+
+class ConversationIndex:
+    """
+    Inverted index over conversation messages, ranked by BM25. Messages are
+    added as they are recorded; each term keeps its postings (message number,
+    term frequency) in append-only arrays, so adding a message touches only
+    its own terms. Removed messages are tombstoned and compacted away in bulk.
+    Searches score outside the lock, and skip the postings of common terms
+    that cannot change the top k. save() writes the same flat binary layout
+    as the knowledge index.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, _Postings] = {}
+        # Per message: session, position within the session, type code, token count, live flag
+        self._sessions: List[str] = []
+        self._session_codes: Dict[str, int] = {}
+        self._doc_session = np.zeros(1024, dtype=np.uint32)
+        self._doc_position = np.zeros(1024, dtype=np.uint32)
+        self._doc_type = np.zeros(1024, dtype=np.uint8)
+        self._lengths = np.zeros(1024, dtype=np.uint32)
+        self._live = np.zeros(1024, dtype=bool)
+        self._types: List[str] = []
+        self._count = 0
+        self._deleted = 0
+        self._total_length = 0
+        # Message numbers of each session, in session order
+        self._session_docs: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return self._count - self._deleted
+
+    def _grow(self):
+        capacity = len(self._lengths) * 2
+        for name in ("_doc_session", "_doc_position", "_doc_type", "_lengths", "_live"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _code(self, codes: Dict[str, int], values: List[str], value: str) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def add(self, session_id: str, position: int, msg_type: str, content: str):
+        """Index the message at position in session_id"""
+        counts: Dict[str, int] = {}
+        for token in tokenize(content):
+            counts[token] = counts.get(token, 0) + 1
+        with self._lock:
+            if self._count == len(self._lengths):
+                self._grow()
+            doc = self._count
+            self._doc_session[doc] = self._code(self._session_codes, self._sessions, session_id)
+            self._doc_position[doc] = position
+            if msg_type not in self._types:
+                self._types.append(msg_type)
+            self._doc_type[doc] = self._types.index(msg_type)
+            length = sum(counts.values())
+            self._lengths[doc] = length
+            self._live[doc] = True
+            self._count += 1
+            self._total_length += length
+            self._session_docs.setdefault(session_id, []).append(doc)
+            for token, count in counts.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = _Postings.empty()
+                postings.append(doc, min(count, 65535), length)
+
+    def remove_message(self, session_id: str, position: int):
+        """Drop one message, moving the session's later messages up a position"""
+        with self._lock:
+            docs = self._session_docs.get(session_id) or []
+            if position >= len(docs):
+                return
+            self._tombstone(docs.pop(position))
+            for doc in docs[position:]:
+                self._doc_position[doc] -= 1
+            self._maybe_compact()
+
+    def remove_session(self, session_id: str):
+        with self._lock:
+            for doc in self._session_docs.pop(session_id, []):
+                self._tombstone(doc)
+            self._maybe_compact()
+
+    def _tombstone(self, doc: int):
+        self._live[doc] = False
+        self._deleted += 1
+        self._total_length -= int(self._lengths[doc])
+
+    def _maybe_compact(self):
+        if self._deleted >= max(COMPACT_MIN_DELETED, self._count - self._deleted):
+            self._compact()
+
+    def _compact(self):
+        """Renumber the live messages and drop the postings of removed ones"""
+        live = self._live[:self._count]
+        renumber = np.cumsum(live, dtype=np.int64) - 1
+        for token in list(self._postings):
+            postings = self._postings[token]
+            docs = postings.docs[:postings.size]
+            keep = live[docs]
+            if not keep.any():
+                del self._postings[token]
+                continue
+            docs = docs[keep]
+            # Replaced rather than rewritten, as searches may still be reading the old arrays
+            self._postings[token] = _Postings(
+                renumber[docs].astype(np.uint32), postings.freqs[:postings.size][keep], int(self._lengths[docs].min())
+            )
+        for name in ("_doc_session", "_doc_position", "_doc_type", "_lengths"):
+            values = getattr(self, name)[:self._count][live]
+            resized = np.zeros(max(len(values) * 2, 1024), dtype=values.dtype)
+            resized[:len(values)] = values
+            setattr(self, name, resized)
+        self._live = np.zeros(len(self._lengths), dtype=bool)
+        self._live[:int(live.sum())] = True
+        self._session_docs = {
+            session_id: [int(renumber[doc]) for doc in docs] for session_id, docs in self._session_docs.items()
+        }
+        self._count -= self._deleted
+        self._deleted = 0
+
+    def search(self,
+               query: str,
+               k: int = 10,
+               session_id: Optional[str] = None,
+               msg_type: Optional[str] = None) -> List[Dict]:
+        """Top-k messages by BM25 score as session_id, position, type and score, optionally within a session or type"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        # Only references are taken under the lock; add() goes on while the postings are scored
+        with self._lock:
+            live_count = self._count - self._deleted
+            if not live_count:
+                return []
+            average_length = self._total_length / live_count or 1.0
+            snapshot = [
+                (postings.docs[:postings.size], postings.freqs[:postings.size], postings.max_tf, postings.min_length)
+                for postings in (self._postings.get(term) for term in terms) if postings is not None and postings.size
+            ]
+            live, lengths = self._live, self._lengths
+            doc_session, doc_position, doc_type = self._doc_session, self._doc_position, self._doc_type
+            sessions, types = self._sessions, list(self._types)
+            session_code = self._session_codes.get(session_id, -1) if session_id is not None else None
+            type_code = (types.index(msg_type) if msg_type in types else -1) if msg_type is not None else None
+        if not snapshot:
+            return []
+
+        def wanted(docs: np.ndarray) -> np.ndarray:
+            keep = live[docs]
+            if session_code is not None:
+                keep &= doc_session[docs] == session_code
+            if type_code is not None:
+                keep &= doc_type[docs] == type_code
+            return keep
+
+        def term_scores(idf: float, docs: np.ndarray, tf: np.ndarray) -> np.ndarray:
+            tf = tf.astype(np.float64)
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / average_length)
+            return idf * tf * (BM25_K1 + 1) / (tf + length_norm)
+
+        # Highest possible score of each term; df counts removed messages until they are compacted away
+        scored_terms = []
+        for docs, freqs, max_tf, min_length in snapshot:
+            df = len(docs)
+            idf = math.log(1 + max(live_count - df + 0.5, 0.0) / (df + 0.5))
+            bound = idf * max_tf * (BM25_K1 + 1) / (max_tf + BM25_K1 * (1 - BM25_B + BM25_B * min_length / average_length))
+            scored_terms.append((bound, idf, docs, freqs))
+        scored_terms.sort(key=lambda term: term[0], reverse=True)
+        bounds_left = np.cumsum([term[0] for term in scored_terms][::-1])[::-1]
+
+        # Max-score pruning: full postings are merged only while a message matching none of them so far
+        # could still reach the top k; the remaining terms are only looked up for the messages already matched
+        matched, scores = np.zeros(0, dtype=np.int64), np.zeros(0)
+        merged_terms = len(scored_terms)
+        for i, (_, idf, docs, freqs) in enumerate(scored_terms):
+            if len(matched) >= k and np.partition(scores, len(scores) - k)[len(scores) - k] > bounds_left[i]:
+                merged_terms = i
+                break
+            docs = docs.astype(np.int64)
+            keep = wanted(docs)
+            docs, freqs = docs[keep], freqs[keep]
+            matched, inverse = np.unique(np.concatenate([matched, docs]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores, term_scores(idf, docs, freqs)]),
+                                 minlength=len(matched))
+        for _, idf, docs, freqs in scored_terms[merged_terms:]:
+            found_at = np.minimum(np.searchsorted(docs, matched), len(docs) - 1)
+            found = docs[found_at] == matched
+            scores[found] += term_scores(idf, matched[found], freqs[found_at[found]])
+        if not len(matched):
+            return []
+
+        if len(matched) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(matched))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            {
+                "session_id": sessions[doc_session[matched[i]]],
+                "position": int(doc_position[matched[i]]),
+                "type": types[doc_type[matched[i]]],
+                "score": float(scores[i])
+            }
+            for i in top
+        ]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "messages": self._count - self._deleted,
+                "removed": self._deleted,
+                "sessions": len(self._session_docs),
+                "terms": len(self._postings),
+                "postings": sum(postings.size for postings in self._postings.values())
+            }
+
+    def save(self, index_dir: Path):
+        """
+        Write the index as flat binary arrays, live messages only. Written into
+        the caller's directory, which swaps it in along with the sessions.
+        """
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if self._deleted:
+                self._compact()
+            vocabulary, doc_ids, term_freqs = {}, [], []
+            offset = 0
+            for term in sorted(self._postings):
+                postings = self._postings[term]
+                vocabulary[term] = [offset, postings.size]
+                doc_ids.append(postings.docs[:postings.size])
+                term_freqs.append(postings.freqs[:postings.size])
+                offset += postings.size
+            count = self._count
+            np.concatenate(doc_ids or [np.zeros(0, np.uint32)]).tofile(index_dir / "doc_ids.u32")
+            np.concatenate(term_freqs or [np.zeros(0, np.uint16)]).tofile(index_dir / "term_freqs.u16")
+            self._doc_session[:count].tofile(index_dir / "doc_sessions.u32")
+            self._doc_position[:count].tofile(index_dir / "doc_positions.u32")
+            self._doc_type[:count].tofile(index_dir / "doc_types.u8")
+            self._lengths[:count].tofile(index_dir / "lengths.u32")
+            meta = {
+                "messages": count,
+                "postings": offset,
+                "sessions": self._sessions,
+                "types": self._types,
+                "vocabulary": vocabulary,
+            }
+        (index_dir / "meta.json").write_text(json.dumps(meta))
+
+    @classmethod
+    def load(cls, index_dir: Path) -> "ConversationIndex":
+        index_dir = Path(index_dir)
+        meta = json.loads((index_dir / "meta.json").read_text())
+        index = cls()
+        count = meta["messages"]
+        index._sessions = meta["sessions"]
+        index._session_codes = {session_id: code for code, session_id in enumerate(index._sessions)}
+        index._types = meta["types"]
+        capacity = max(count * 2, 1024)
+        for name, filename, dtype in (("_doc_session", "doc_sessions.u32", np.uint32),
+                                      ("_doc_position", "doc_positions.u32", np.uint32),
+                                      ("_doc_type", "doc_types.u8", np.uint8),
+                                      ("_lengths", "lengths.u32", np.uint32)):
+            values = np.zeros(capacity, dtype=dtype)
+            values[:count] = np.fromfile(index_dir / filename, dtype=dtype)
+            setattr(index, name, values)
+        index._live = np.zeros(capacity, dtype=bool)
+        index._live[:count] = True
+        index._count = count
+        index._total_length = int(index._lengths[:count].sum())
+
+        doc_ids = np.fromfile(index_dir / "doc_ids.u32", dtype=np.uint32)
+        term_freqs = np.fromfile(index_dir / "term_freqs.u16", dtype=np.uint16)
+        vocabulary = meta["vocabulary"]
+        if vocabulary:
+            starts = np.array([offset for offset, _ in vocabulary.values()], dtype=np.int64)
+            min_lengths = np.minimum.reduceat(index._lengths[doc_ids], starts)
+            for (term, (offset, df)), min_length in zip(vocabulary.items(), min_lengths):
+                index._postings[term] = _Postings(
+                    doc_ids[offset:offset + df].copy(), term_freqs[offset:offset + df].copy(), int(min_length)
+                )
+        # Messages were saved in order, so each session's list comes out in position order
+        order = np.lexsort((index._doc_position[:count], index._doc_session[:count]))
+        for doc in order:
+            index._session_docs.setdefault(index._sessions[index._doc_session[doc]], []).append(int(doc))
+        return index
+
@@ -1,7 +1,18 @@
+import json
+import os
+import shutil
+import threading
 from typing import Dict, List, Optional
 from datetime import datetime
+from pathlib import Path
 from pydantic import BaseModel
+from pydantic_core import to_jsonable_python
 from enum import Enum
+from app.utils.campaign_store import DATA_DIR
+from app.utils.conversation_index import ConversationIndex
+
+DEFAULT_STORE_DIR = DATA_DIR / "conversations"
+SNIPPET_CHARS = 160
 
 class MessageType(Enum):
     USER_INPUT = "USER_INPUT"
@@ -23,15 +34,29 @@ class ConversationSession(BaseModel):
     active: bool = True
 
 class ConversationManager:
-    def __init__(self):
+    def __init__(self, store_dir: Optional[Path] = None):
         self.sessions: Dict[str, ConversationSession] = {}
+        # Every recorded message, searchable by content across sessions
+        self.index = ConversationIndex()
+        self.store_dir = Path(store_dir or os.getenv("CONVERSATION_STORE_DIR", DEFAULT_STORE_DIR))
+        # A message's index position is its place in the history, so they change together
+        self._lock = threading.RLock()
 
     def create_session(self, session_id: str) -> ConversationSession:
-        """Create a new conversation session"""
+        """Create a new conversation session, replacing any with the same id"""
         session = ConversationSession(session_id=session_id)
-        self.sessions[session_id] = session
+        with self._lock:
+            # Postings of a replaced session would point at the new one's messages
+            self.index.remove_session(session_id)
+            self.sessions[session_id] = session
         return session
 
+    def end_session(self, session_id: str) -> Optional[ConversationSession]:
+        """Drop a finished session, returning it if it existed"""
+        with self._lock:
+            self.index.remove_session(session_id)
+            return self.sessions.pop(session_id, None)
+
     def add_message(self,
                    session_id: str,
                    content: str,
@@ -40,18 +65,28 @@ class ConversationManager:
         """Add a message to the conversation history"""
         if metadata is None:
             metadata = {}
-        if session_id not in self.sessions:
-            self.create_session(session_id)
-
         message = Message(
             content=content,
             type=msg_type,
             metadata=metadata
         )
 
-        self.sessions[session_id].messages.append(message)
+        with self._lock:
+            if session_id not in self.sessions:
+                self.create_session(session_id)
+            messages = self.sessions[session_id].messages
+            self.index.add(session_id, len(messages), msg_type.value, content)
+            messages.append(message)
         return message
 
+    def remove_message(self, session_id: str, message: Message):
+        """Take a message back out of the history, e.g. a query that was never accepted"""
+        with self._lock:
+            messages = self.sessions[session_id].messages
+            position = next(i for i, m in enumerate(messages) if m is message)
+            del messages[position]
+            self.index.remove_message(session_id, position)
+
     def get_conversation_history(self,
                                session_id: str,
                                limit: int = None) -> List[Message]:
@@ -62,4 +97,62 @@ class ConversationManager:
         messages = self.sessions[session_id].messages
         if limit:
             return messages[-limit:]
-        return messages
\ No newline at end of file
+        return messages
+
+    def search(self,
+               query: str,
+               limit: int = 10,
+               session_id: Optional[str] = None,
+               msg_type: Optional[MessageType] = None) -> List[Dict]:
+        """Messages across all sessions ranked by relevance to query, with a snippet of each"""
+        hits = []
+        for hit in self.index.search(query, limit, session_id, msg_type.value if msg_type else None):
+            session = self.sessions.get(hit["session_id"])
+            # A message indexed while its session was being dropped or saved
+            if session is None or hit["position"] >= len(session.messages):
+                continue
+            message = session.messages[hit["position"]]
+            hit["timestamp"] = message.timestamp
+            hit["snippet"] = message.content[:SNIPPET_CHARS]
+            hits.append(hit)
+        return hits
+
+    def save(self):
+        """Write the sessions and their search index to the store directory"""
+        tmp_dir = self.store_dir.with_name(self.store_dir.name + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        # Both under the lock, so the saved index positions match the saved messages
+        with self._lock:
+            with open(tmp_dir / "sessions.jsonl", "w") as f:
+                for session in self.sessions.values():
+                    # Metadata carries agent output, which need not be plain JSON
+                    f.write(json.dumps(to_jsonable_python(session, fallback=str)) + "\n")
+            self.index.save(tmp_dir / "index")
+        # The previous save is moved aside, not deleted, until the new one is in place
+        old_dir = self._previous_dir()
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if self.store_dir.exists():
+            os.replace(self.store_dir, old_dir)
+        os.replace(tmp_dir, self.store_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def _previous_dir(self) -> Path:
+        return self.store_dir.with_name(self.store_dir.name + ".old")
+
+    def load(self) -> int:
+        """Restore the sessions saved by save(), returning how many there were"""
+        old_dir = self._previous_dir()
+        if not self.store_dir.exists() and old_dir.exists():
+            # A save stopped between moving the previous one aside and putting the new one in place
+            os.replace(old_dir, self.store_dir)
+        sessions_path = self.store_dir / "sessions.jsonl"
+        if not sessions_path.exists():
+            return 0
+        with open(sessions_path) as f:
+            sessions = [ConversationSession.model_validate_json(line) for line in f if line.strip()]
+        index = ConversationIndex.load(self.store_dir / "index")
+        with self._lock:
+            self.sessions = {session.session_id: session for session in sessions}
+            self.index = index
+        return len(sessions)
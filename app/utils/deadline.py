@@ -0,0 +1,199 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.utils.profiling import profiled_call
+
+DEFAULT_REQUEST_DEADLINE_SECONDS = 30.0
+# Remaining time below which optional enrichment (live background research, what-if simulation) is skipped
+DEFAULT_ENRICHMENT_MIN_SECONDS = 10.0
+# Time analysis leaves for the recommendation or summary step after it
+DEFAULT_STAGE_RESERVE_SECONDS = 8.0
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """
+    Time budget of one request. Nodes check what is left and take cheaper
+    paths when it runs short, recording each part they degraded. Children
+    made with leaving() expire earlier but share the degraded record.
+    """
+
+    def __init__(self, budget_seconds: float, _parent: Optional["Deadline"] = None):
+        self.expires_at = time.monotonic() + budget_seconds
+        self.degraded: Dict[str, str] = _parent.degraded if _parent else {}
+        self._lock = _parent._lock if _parent else threading.Lock()
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def allows(self, seconds: float) -> bool:
+        return self.remaining() >= seconds
+
+    def leaving(self, seconds: float) -> "Deadline":
+        """A deadline that expires `seconds` earlier, keeping that time for later steps"""
+        return Deadline(self.remaining() - seconds, _parent=self)
+
+    def degrade(self, part: str, reason: str):
+        with self._lock:
+            if part not in self.degraded:
+                print(f"⏱️ Degraded {part}: {reason}")
+                self.degraded[part] = reason
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Make deadline the current one for the block and the threads LangGraph starts for it"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def request_deadline(budget_seconds: Optional[float] = None) -> Optional[Deadline]:
+    """A deadline for a new request, defaulting to REQUEST_DEADLINE_SECONDS; None when the budget is 0"""
+    if budget_seconds is None:
+        budget_seconds = float(os.getenv("REQUEST_DEADLINE_SECONDS", DEFAULT_REQUEST_DEADLINE_SECONDS))
+    return Deadline(budget_seconds) if budget_seconds > 0 else None
+
+
+def note_degraded(part: str, reason: str):
+    """Record a degraded part of the current request's response, if it has a deadline"""
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.degrade(part, reason)
+
+
+def enrichment_min_seconds() -> float:
+    return float(os.getenv("DEADLINE_ENRICHMENT_MIN_SECONDS", DEFAULT_ENRICHMENT_MIN_SECONDS))
+
+
+def enrichment_allowed() -> bool:
+    deadline = current_deadline()
+    return deadline is None or deadline.allows(enrichment_min_seconds())
+
+
+def stage_deadline() -> Optional[Deadline]:
+    """The current deadline less the time reserved for the steps after this one"""
+    deadline = current_deadline()
+    if deadline is None:
+        return None
+    return deadline.leaving(float(os.getenv("DEADLINE_STAGE_RESERVE_SECONDS", DEFAULT_STAGE_RESERVE_SECONDS)))
+
+
+class _Abandonment:
+    """Callbacks to run if the caller of a call_with_deadline call stops waiting for it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.abandoned = False
+        self._callbacks: List[Callable[[], None]] = []
+
+    def add(self, callback: Callable[[], None]):
+        with self._lock:
+            if not self.abandoned:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def abandon(self):
+        with self._lock:
+            self.abandoned = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+_current_abandonment: ContextVar[Optional[_Abandonment]] = ContextVar("deadline_abandonment", default=None)
+
+
+@contextmanager
+def on_abandoned(callback: Callable[[], None]) -> Iterator[None]:
+    """
+    Run callback if the caller gives up on the call_with_deadline call this
+    block runs in, e.g. to hand back a slot the abandoned call still holds
+    """
+    abandonment = _current_abandonment.get()
+    if abandonment is None:
+        yield
+        return
+    abandonment.add(callback)
+    try:
+        yield
+    finally:
+        abandonment.remove(callback)
+
+
+def _start_daemon(fn: Callable, *args, **kwargs) -> Future:
+    # Abandoned calls finish in the background, so they must not keep the interpreter from exiting
+    future: Future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="deadline-call", daemon=True).start()
+    return future
+
+
+def call_with_deadline(fn: Callable, *args, reserve: float = 0.0, **kwargs) -> Any:
+    """
+    Call fn, giving up with DeadlineExceeded once the current deadline, less
+    reserve seconds, has passed. The call itself cannot be interrupted and
+    finishes on a daemon thread; on_abandoned() callbacks it registered run
+    when the caller gives up. Without a deadline fn is called directly.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return fn(*args, **kwargs)
+    timeout = deadline.remaining() - reserve
+    if timeout <= 0:
+        raise DeadlineExceeded("No time left in the request deadline")
+    abandonment = _Abandonment()
+    # A call abandoned by its own caller abandons the calls it is waiting on
+    parent = _current_abandonment.get()
+    if parent is not None:
+        parent.add(abandonment.abandon)
+    context = contextvars.copy_context()
+    context.run(_current_abandonment.set, abandonment)
+    future = _start_daemon(context.run, profiled_call(fn), *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        abandonment.abandon()
+        raise DeadlineExceeded(f"Gave up after {timeout:.1f}s to meet the request deadline")
+    finally:
+        if parent is not None:
+            parent.remove(abandonment.abandon)
+
+
+def map_in_context(pool: ThreadPoolExecutor, fn: Callable, items) -> list:
+    """pool.map that runs each call in a copy of the caller's context, so deadlines, tenants and profiles carry over"""
+    contexts = [(contextvars.copy_context(), item) for item in items]
+    fn = profiled_call(fn)
+    return list(pool.map(lambda pair: pair[0].run(fn, pair[1]), contexts))
@@ -0,0 +1,267 @@
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.campaign_store import DATA_DIR
+
+CORPUS_DIR = DATA_DIR / "knowledge"
+INDEX_DIR = CORPUS_DIR / "index"
+CORPUS_EXTENSIONS = (".md", ".txt")
+PASSAGE_WORDS = 120
+DEFAULT_TOKEN_BUDGET = 300
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Bumped whenever the on-disk layout changes, so stale indexes are rebuilt
+INDEX_FORMAT = 2
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be been but by can for from has have how in into is it its more most not of on or
+so such than that the their them then there these they this to was were what when which while who will
+with would you your our we also about over after before other some any all each
+""".split())
+
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in _TOKEN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def _split_passages(text: str, max_words: int = PASSAGE_WORDS) -> List[str]:
+    """Paragraphs, with long paragraphs split into chunks of at most max_words"""
+    passages = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        for start in range(0, len(words), max_words):
+            passages.append(" ".join(words[start:start + max_words]))
+    return [passage for passage in passages if passage]
+
+
+def build_index(corpus_dir: Path = CORPUS_DIR, index_dir: Path = INDEX_DIR) -> Dict:
+    """
+    Index every .md/.txt document under corpus_dir. A document's first '# '
+    line is its title and is indexed with each of its passages. The sorted
+    term table, postings, term frequencies, passage lengths and passage text
+    are written as flat binary arrays that are memory-mapped at query time.
+    """
+    titles, passages = [], []
+    for path in sorted(corpus_dir.rglob("*")):
+        if path.suffix not in CORPUS_EXTENSIONS or index_dir in path.parents:
+            continue
+        text = path.read_text(encoding="utf-8")
+        title = path.stem.replace("_", " ")
+        if text.startswith("# "):
+            title, _, text = text.partition("\n")
+            title = title[2:].strip()
+        for passage in _split_passages(text):
+            titles.append(title)
+            passages.append(passage)
+    if not passages:
+        raise ValueError(f"No documents found in {corpus_dir}")
+
+    postings: Dict[str, Dict[int, int]] = {}
+    lengths = np.zeros(len(passages), dtype=np.uint32)
+    for passage_id, (title, passage) in enumerate(zip(titles, passages)):
+        tokens = tokenize(f"{title} {passage}")
+        lengths[passage_id] = len(tokens)
+        for token in tokens:
+            counts = postings.setdefault(token, {})
+            counts[passage_id] = counts.get(passage_id, 0) + 1
+
+    # Terms are fixed-width byte strings in sorted order, so a lookup is a binary search
+    terms = sorted(postings)
+    term_table = np.array([term.encode("utf-8") for term in terms], dtype=np.bytes_)
+    term_postings = np.zeros(len(terms) + 1, dtype=np.uint64)
+    doc_ids, term_freqs = [], []
+    for i, term in enumerate(terms):
+        counts = postings[term]
+        doc_ids.extend(counts.keys())
+        term_freqs.extend(counts.values())
+        term_postings[i + 1] = len(doc_ids)
+
+    encoded = [f"{title}\n{passage}".encode("utf-8") for title, passage in zip(titles, passages)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum([len(chunk) for chunk in encoded])
+
+    # Write to a sibling directory and swap it in, so readers never see a partial index
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    term_table.tofile(tmp_dir / "terms.bin")
+    term_postings.tofile(tmp_dir / "term_postings.u64")
+    np.asarray(doc_ids, dtype=np.uint32).tofile(tmp_dir / "doc_ids.u32")
+    np.asarray(term_freqs, dtype=np.uint16).tofile(tmp_dir / "term_freqs.u16")
+    lengths.tofile(tmp_dir / "lengths.u32")
+    offsets.tofile(tmp_dir / "offsets.u64")
+    (tmp_dir / "passages.bin").write_bytes(b"".join(encoded))
+    meta = {
+        "format": INDEX_FORMAT,
+        "passages": len(passages),
+        "postings": len(doc_ids),
+        "terms": len(terms),
+        "term_width": term_table.dtype.itemsize,
+        "average_length": float(lengths.mean()),
+        "corpus_signature": corpus_signature(corpus_dir, index_dir),
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta))
+    shutil.rmtree(index_dir, ignore_errors=True)
+    os.replace(tmp_dir, index_dir)
+    return {key: meta[key] for key in ("passages", "postings", "terms")}
+
+
+def corpus_signature(corpus_dir: Path = CORPUS_DIR, index_dir: Path = INDEX_DIR) -> str:
+    parts = []
+    for path in sorted(corpus_dir.rglob("*")):
+        if path.suffix in CORPUS_EXTENSIONS and index_dir not in path.parents:
+            stat = path.stat()
+            parts.append(f"{path.relative_to(corpus_dir)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+class KnowledgeIndex:
+    """
+    BM25 search over the offline knowledge corpus. The term table, postings
+    and passage text are all memory-mapped, so opening the index reads only
+    its meta file and a query touches just the table pages and postings of
+    its own terms.
+    """
+
+    def __init__(self, index_dir: Path = INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        meta = json.loads((self.index_dir / "meta.json").read_text())
+        if meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Knowledge index in {self.index_dir} is an older format, rebuild it")
+        self.passage_count: int = meta["passages"]
+        self.term_count: int = meta["terms"]
+        self.average_length: float = meta["average_length"] or 1.0
+        self.corpus_signature: str = meta["corpus_signature"]
+        self._terms = np.memmap(
+            self.index_dir / "terms.bin", dtype=f"S{meta['term_width']}", mode="r", shape=(self.term_count,)
+        )
+        self._term_postings = np.memmap(self.index_dir / "term_postings.u64", dtype=np.uint64, mode="r")
+        self._doc_ids = np.memmap(self.index_dir / "doc_ids.u32", dtype=np.uint32, mode="r")
+        self._term_freqs = np.memmap(self.index_dir / "term_freqs.u16", dtype=np.uint16, mode="r")
+        self._lengths = np.memmap(self.index_dir / "lengths.u32", dtype=np.uint32, mode="r")
+        self._offsets = np.memmap(self.index_dir / "offsets.u64", dtype=np.uint64, mode="r")
+        self._text = np.memmap(self.index_dir / "passages.bin", dtype=np.uint8, mode="r")
+
+    def passage(self, passage_id: int) -> Dict:
+        start, end = int(self._offsets[passage_id]), int(self._offsets[passage_id + 1])
+        title, _, text = bytes(self._text[start:end]).decode("utf-8").partition("\n")
+        return {"id": passage_id, "title": title, "text": text}
+
+    def _term_ranges(self, terms: List[str]) -> List[Tuple[int, int]]:
+        """Postings [start, end) of each term present in the table"""
+        width = self._terms.dtype.itemsize
+        # A longer term cannot be in the table, and casting would truncate it into a false match
+        encoded = [key for key in (term.encode("utf-8") for term in terms) if len(key) <= width]
+        if not encoded or not self.term_count:
+            return []
+        keys = np.array(encoded, dtype=self._terms.dtype)
+        rows = np.minimum(np.searchsorted(self._terms, keys), self.term_count - 1)
+        found = rows[self._terms[rows] == keys]
+        starts, ends = self._term_postings[found], self._term_postings[found + 1]
+        return [(int(start), int(end)) for start, end in zip(starts, ends)]
+
+    def term_postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Passage ids and term frequencies of a term, or None if it is not indexed"""
+        ranges = self._term_ranges([term])
+        if not ranges:
+            return None
+        start, end = ranges[0]
+        return self._doc_ids[start:end], self._term_freqs[start:end]
+
+    def search(self, query: str, k: int = 3) -> List[Dict]:
+        """Top-k passages by BM25 score"""
+        # Per-term contributions are concatenated and summed per passage, so the
+        # work scales with the matched postings rather than the corpus
+        doc_parts, score_parts = [], []
+        for start, end in self._term_ranges(sorted(set(tokenize(query)))):
+            df = end - start
+            docs = self._doc_ids[start:end]
+            tf = self._term_freqs[start:end].astype(np.float64)
+            idf = math.log(1 + (self.passage_count - df + 0.5) / (df + 0.5))
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[docs] / self.average_length)
+            doc_parts.append(docs)
+            score_parts.append(idf * tf * (BM25_K1 + 1) / (tf + length_norm))
+        if not doc_parts:
+            return []
+
+        matched, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts), minlength=len(matched))
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [{**self.passage(int(matched[i])), "score": float(scores[i])} for i in top]
+
+    def lookup(self, query: str, token_budget: int = DEFAULT_TOKEN_BUDGET, k: int = 3) -> Optional[str]:
+        """Best passages joined and trimmed to roughly token_budget words, or None if nothing matched"""
+        results = self.search(query, k)
+        if not results:
+            return None
+        chunks, used = [], 0
+        for result in results:
+            remaining = token_budget - used
+            if remaining <= 0:
+                break
+            words = result["text"].split()[:remaining]
+            chunks.append(" ".join(words))
+            used += len(words)
+        return "\n\n".join(chunks)
+
+
+_build_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def default_knowledge_index() -> Optional[KnowledgeIndex]:
+    """The bundled index, (re)built first if the corpus changed; None when there is no corpus"""
+    with _build_lock:
+        try:
+            signature = corpus_signature()
+            meta_path = INDEX_DIR / "meta.json"
+            meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+            if meta.get("format") != INDEX_FORMAT or meta.get("corpus_signature") != signature:
+                print("📚 Building knowledge index...")
+                build_index()
+            return KnowledgeIndex(INDEX_DIR)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Knowledge index unavailable: {str(e)}")
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline knowledge index")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build = subcommands.add_parser("build", help="Index the knowledge corpus")
+    build.add_argument("--corpus", type=Path, default=CORPUS_DIR, help="Directory of .md/.txt documents")
+    build.add_argument("--out", type=Path, default=INDEX_DIR, help="Index output directory")
+    search = subcommands.add_parser("search", help="Query a built index")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=3)
+    search.add_argument("--index", type=Path, default=INDEX_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(build_index(args.corpus, args.out))
+    else:
+        for result in KnowledgeIndex(args.index).search(args.query, args.k):
+            print(f"[{result['score']:.2f}] {result['title']}: {result['text'][:200]}")
+
+
+if __name__ == "__main__":
+    main()
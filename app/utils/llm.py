@@ -3,21 +3,36 @@
 import os
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
+from app.utils.llm_scheduler import ScheduledLLM, default_llm_scheduler
+from app.utils.traffic_recording import replay_llm
 
 class LLMInitializer:
     def __init__(self, model: str = "gemini-2.0-flash", temperature: float = 0.3):
         load_dotenv()
         self.model = model
         self.temperature = temperature
-        self.llm = self.get_llm()
+        # Every call waits its turn in the shared per-tenant scheduler (LLM_SCHEDULER=0 skips it)
+        # and within the request deadline, switching to the smaller model when time runs short
+        fallback_model = os.getenv("LLM_FALLBACK_MODEL", "gemini-2.0-flash-lite")
+        scheduler = default_llm_scheduler() if os.getenv("LLM_SCHEDULER", "1") != "0" else None
+        replay_file = os.getenv("LLM_REPLAY_FILE")
+        if replay_file:
+            # Load tests answer from recorded traffic instead of calling the model
+            self.llm = ScheduledLLM(replay_llm(replay_file), scheduler)
+        else:
+            self.llm = ScheduledLLM(
+                self.get_llm(),
+                scheduler,
+                self.get_llm(fallback_model) if fallback_model and fallback_model != model else None
+            )
 
-    def get_llm(self):
+    def get_llm(self, model: str = None):
         api_key = os.getenv("GOOGLE_API_KEY")
 
         if not api_key:
             raise ValueError("❌ GOOGLE_API_KEY not found in environment variables.")
 
         return ChatGoogleGenerativeAI(
-            model=self.model,
+            model=model or self.model,
             temperature=self.temperature
         )
@@ -0,0 +1,389 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from functools import lru_cache
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.deadline import DeadlineExceeded, call_with_deadline, current_deadline, on_abandoned
+from app.utils.quantile_sketch import TDigest
+from app.utils.traffic_recording import record_llm_call
+
+DEFAULT_TENANT = "default"
+# Rough prompt size to token conversion, and the reply size assumed before usage is known
+CHARS_PER_TOKEN = 4
+DEFAULT_EXPECTED_OUTPUT_TOKENS = 400
+# Attempts a model call makes within a request deadline; retries would run past it
+DEADLINE_MAX_RETRIES = 1
+# Remaining request time below which calls are not made at all, or go to the fallback model
+DEFAULT_LLM_MIN_SECONDS = 1.0
+DEFAULT_FULL_MODEL_MIN_SECONDS = 8.0
+# Seconds a tenant with nothing queued or in flight and a full bucket is kept before it is forgotten
+DEFAULT_TENANT_IDLE_SECONDS = 600.0
+
+
+class Priority(IntEnum):
+    """Scheduling lanes, served strictly in this order"""
+    INTERACTIVE = 0
+    BATCH = 1
+    PREFETCH = 2
+
+
+class LLMQueueTimeout(TimeoutError):
+    pass
+
+
+_request_context: ContextVar[Tuple[str, Priority]] = ContextVar(
+    "llm_request_context", default=(DEFAULT_TENANT, Priority.INTERACTIVE)
+)
+
+
+@contextmanager
+def llm_request_context(tenant: Optional[str] = None, priority: Priority = Priority.INTERACTIVE) -> Iterator[None]:
+    """Attribute LLM calls made inside the block (and the threads LangGraph starts for it) to a tenant and lane"""
+    token = _request_context.set((tenant or DEFAULT_TENANT, priority))
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+
+def current_llm_context() -> Tuple[str, Priority]:
+    return _request_context.get()
+
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    weights = {}
+    for item in value.split(","):
+        if "=" in item:
+            tenant, weight = item.split("=", 1)
+            weights[tenant.strip()] = float(weight)
+    return weights
+
+
+def estimate_tokens(messages) -> int:
+    """Prompt tokens from message length, plus the expected reply"""
+    if isinstance(messages, str):
+        text_length = len(messages)
+    else:
+        text_length = sum(len(str(getattr(message, "content", message))) for message in messages)
+    return text_length // CHARS_PER_TOKEN + int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", DEFAULT_EXPECTED_OUTPUT_TOKENS))
+
+
+class _Waiter:
+    __slots__ = ("tenant", "priority", "cost", "enqueued_at", "granted", "released")
+
+    def __init__(self, tenant: str, priority: Priority, cost: int):
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.released = False
+
+
+class _Tenant:
+    def __init__(self, weight: float, tokens_per_minute: float):
+        self.weight = weight
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens = tokens_per_minute
+        self.refilled_at = time.monotonic()
+        self.active_at = self.refilled_at
+        self.in_flight = 0
+        # Virtual finish tag of the tenant's last granted call, per lane
+        self.finish_tags = [0.0] * len(Priority)
+        self.queues: List[Deque[_Waiter]] = [deque() for _ in Priority]
+        self.granted = 0
+        self.tokens_used = 0
+        self.wait = TDigest()
+
+    def refill(self, now: float):
+        if self.tokens_per_minute:
+            elapsed = now - self.refilled_at
+            self.tokens = min(self.tokens_per_minute, self.tokens + elapsed * self.tokens_per_minute / 60)
+        self.refilled_at = now
+
+    def has_budget(self, cost: int) -> bool:
+        # A call larger than the whole quota still runs once the bucket is full
+        return not self.tokens_per_minute or self.tokens >= min(cost, self.tokens_per_minute)
+
+    def is_idle(self, now: float, idle_seconds: float) -> bool:
+        # With a full bucket, forgetting the tenant hands it no quota it did not already have
+        return (not self.in_flight and not any(self.queues)
+                and (not self.tokens_per_minute or self.tokens >= self.tokens_per_minute)
+                and now - self.active_at >= idle_seconds)
+
+
+class LLMScheduler:
+    """
+    Admission control between the agents and the model client. Calls wait in
+    one of three priority lanes; within a lane, tenants are served by start-
+    time fair queuing on estimated tokens, scaled by each tenant's weight, so
+    a tenant sending many calls only delays its own. Each tenant is also held
+    to a concurrency limit and an optional tokens-per-minute quota, and part
+    of the global concurrency is kept free for interactive calls. Tenants
+    idle for tenant_idle_seconds are dropped, along with their stats.
+    """
+
+    def __init__(self,
+                 max_concurrent: Optional[int] = None,
+                 tenant_max_concurrent: Optional[int] = None,
+                 interactive_reserved: Optional[int] = None,
+                 tenant_tokens_per_minute: Optional[float] = None,
+                 tenant_weights: Optional[Dict[str, float]] = None,
+                 queue_timeout_seconds: Optional[float] = None,
+                 tenant_idle_seconds: Optional[float] = None):
+        self.max_concurrent = max_concurrent or int(os.getenv("LLM_MAX_CONCURRENT", "16"))
+        self.tenant_max_concurrent = tenant_max_concurrent or int(os.getenv("LLM_TENANT_MAX_CONCURRENT", "8"))
+        self.interactive_reserved = min(
+            interactive_reserved if interactive_reserved is not None
+            else int(os.getenv("LLM_INTERACTIVE_RESERVED", "2")),
+            self.max_concurrent - 1
+        )
+        self.tenant_tokens_per_minute = (
+            tenant_tokens_per_minute if tenant_tokens_per_minute is not None
+            else float(os.getenv("LLM_TENANT_TOKENS_PER_MINUTE", "0"))
+        )
+        self.tenant_weights = (
+            tenant_weights if tenant_weights is not None
+            else _parse_weights(os.getenv("LLM_TENANT_WEIGHTS", ""))
+        )
+        self.queue_timeout_seconds = queue_timeout_seconds or float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "120"))
+        self.tenant_idle_seconds = (
+            tenant_idle_seconds if tenant_idle_seconds is not None
+            else float(os.getenv("LLM_TENANT_IDLE_SECONDS", DEFAULT_TENANT_IDLE_SECONDS))
+        )
+        self._condition = threading.Condition()
+        self._tenants: Dict[str, _Tenant] = {}
+        self._virtual_time = [0.0] * len(Priority)
+        self._in_flight = 0
+        self._lane_waits = [TDigest() for _ in Priority]
+        self.timeouts = 0
+
+    def _tenant(self, name: str) -> _Tenant:
+        tenant = self._tenants.get(name)
+        if tenant is None:
+            tenant = self._tenants[name] = _Tenant(self.tenant_weights.get(name, 1.0), self.tenant_tokens_per_minute)
+        return tenant
+
+    def acquire(self, tenant: str, priority: Priority, cost: int, timeout: Optional[float] = None) -> _Waiter:
+        """
+        Block until the call may run; raises LLMQueueTimeout after
+        queue_timeout_seconds, or DeadlineExceeded after a shorter timeout
+        """
+        waiter = _Waiter(tenant, priority, cost)
+        limited_by_request = timeout is not None and timeout < self.queue_timeout_seconds
+        deadline = waiter.enqueued_at + (timeout if limited_by_request else self.queue_timeout_seconds)
+        with self._condition:
+            tenant_state = self._tenant(tenant)
+            tenant_state.queues[priority].append(waiter)
+            tenant_state.active_at = waiter.enqueued_at
+            while True:
+                self._dispatch()
+                if waiter.granted:
+                    return waiter
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._tenants[tenant].queues[priority].remove(waiter)
+                    self.timeouts += 1
+                    if limited_by_request:
+                        raise DeadlineExceeded(f"LLM call for tenant {tenant} queued past the request deadline")
+                    raise LLMQueueTimeout(f"LLM call for tenant {tenant} waited over {self.queue_timeout_seconds:g}s")
+                # Wake periodically as well, since token buckets refill without a release
+                self._condition.wait(min(remaining, 1.0))
+
+    def release(self, waiter: _Waiter, tokens_used: Optional[int] = None):
+        """Return the slot and settle the quota with the tokens the call actually used; later releases are no-ops"""
+        with self._condition:
+            if waiter.released:
+                return
+            waiter.released = True
+            tenant = self._tenants[waiter.tenant]
+            tenant.in_flight -= 1
+            tenant.active_at = time.monotonic()
+            self._in_flight -= 1
+            if tokens_used is not None:
+                tenant.tokens -= tokens_used - waiter.cost
+                tenant.tokens_used += tokens_used
+            else:
+                tenant.tokens_used += waiter.cost
+            self._condition.notify_all()
+
+    def _dispatch(self):
+        """Grant queued calls, highest lane first, while slots are free"""
+        now = time.monotonic()
+        idle = []
+        for name, tenant in self._tenants.items():
+            tenant.refill(now)
+            if tenant.is_idle(now, self.tenant_idle_seconds):
+                idle.append(name)
+        # Otherwise every tenant ever seen would be kept, and scanned on every dispatch
+        for name in idle:
+            del self._tenants[name]
+        granted_any = False
+        while self._in_flight < self.max_concurrent:
+            waiter = self._next_waiter(now)
+            if waiter is None:
+                break
+            self._grant(waiter, now)
+            granted_any = True
+        if granted_any:
+            self._condition.notify_all()
+
+    def _next_waiter(self, now: float) -> Optional[_Waiter]:
+        for priority in Priority:
+            if priority != Priority.INTERACTIVE and self._in_flight >= self.max_concurrent - self.interactive_reserved:
+                return None
+            virtual_time = self._virtual_time[priority]
+            best, best_start = None, None
+            for tenant in self._tenants.values():
+                queue = tenant.queues[priority]
+                if not queue or tenant.in_flight >= self.tenant_max_concurrent or not tenant.has_budget(queue[0].cost):
+                    continue
+                start = max(tenant.finish_tags[priority], virtual_time)
+                if best_start is None or start < best_start:
+                    best, best_start = tenant, start
+            if best is not None:
+                waiter = best.queues[priority][0]
+                self._virtual_time[priority] = best_start
+                best.finish_tags[priority] = best_start + waiter.cost / best.weight
+                return waiter
+        return None
+
+    def _grant(self, waiter: _Waiter, now: float):
+        tenant = self._tenants[waiter.tenant]
+        tenant.queues[waiter.priority].popleft()
+        tenant.in_flight += 1
+        tenant.granted += 1
+        if tenant.tokens_per_minute:
+            tenant.tokens -= waiter.cost
+        self._in_flight += 1
+        waited = now - waiter.enqueued_at
+        tenant.wait.add(waited)
+        self._lane_waits[waiter.priority].add(waited)
+        waiter.granted = True
+
+    @contextmanager
+    def slot(self,
+             cost: int,
+             tenant: Optional[str] = None,
+             priority: Optional[Priority] = None,
+             timeout: Optional[float] = None) -> Iterator[Dict]:
+        """
+        Hold a slot for one call, attributed to the current request context
+        unless tenant/priority are given. Set "tokens" in the yielded dict to
+        settle the quota with actual usage.
+        """
+        context_tenant, context_priority = current_llm_context()
+        waiter = self.acquire(
+            tenant or context_tenant, context_priority if priority is None else priority, cost, timeout
+        )
+        usage: Dict = {}
+        try:
+            # A call its caller gave up on hands its slot back at once, settled at the estimate
+            with on_abandoned(lambda: self.release(waiter)):
+                yield usage
+        finally:
+            self.release(waiter, usage.get("tokens"))
+
+    def stats(self) -> Dict:
+        """Queue depth, in-flight calls and queue-wait percentiles (seconds) per lane and tenant"""
+        def waits(digest: TDigest) -> Dict:
+            return {
+                "count": len(digest),
+                "p50": digest.quantile(0.5),
+                "p99": digest.quantile(0.99)
+            }
+
+        with self._condition:
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrent": self.max_concurrent,
+                "timeouts": self.timeouts,
+                "lanes": {
+                    priority.name.lower(): {
+                        "queued": sum(len(tenant.queues[priority]) for tenant in self._tenants.values()),
+                        "wait_seconds": waits(self._lane_waits[priority])
+                    }
+                    for priority in Priority
+                },
+                "tenants": {
+                    name: {
+                        "weight": tenant.weight,
+                        "in_flight": tenant.in_flight,
+                        "queued": sum(len(queue) for queue in tenant.queues),
+                        "granted": tenant.granted,
+                        "tokens_used": tenant.tokens_used,
+                        "tokens_available": tenant.tokens if tenant.tokens_per_minute else None,
+                        "wait_seconds": waits(tenant.wait)
+                    }
+                    for name, tenant in self._tenants.items()
+                }
+            }
+
+
+class ScheduledLLM:
+    """
+    Chat model wrapper every agent call goes through. Calls wait for a slot
+    from the scheduler, when there is one, and are bounded by the request
+    deadline; with too little time left for the full model they go to the
+    smaller fallback model instead.
+    """
+
+    def __init__(self, llm, scheduler: Optional[LLMScheduler] = None, fallback_llm=None):
+        self.llm = llm
+        self.scheduler = scheduler
+        self.fallback_llm = fallback_llm
+
+    def invoke(self, messages, *args, **kwargs):
+        llm = self.llm
+        deadline = current_deadline()
+        if deadline is not None:
+            if not deadline.allows(float(os.getenv("LLM_MIN_SECONDS", DEFAULT_LLM_MIN_SECONDS))):
+                raise DeadlineExceeded("Too little time left in the request deadline for an LLM call")
+            if self.fallback_llm is not None and not deadline.allows(
+                    float(os.getenv("LLM_FULL_MODEL_MIN_SECONDS", DEFAULT_FULL_MODEL_MIN_SECONDS))):
+                deadline.degrade("model", f"answered by {getattr(self.fallback_llm, 'model', 'the fallback model')} to meet the deadline")
+                llm = self.fallback_llm
+        return call_with_deadline(self._invoke, llm, messages, *args, **kwargs)
+
+    def _invoke(self, llm, messages, *args, **kwargs):
+        if self.scheduler is None:
+            return self._call(llm, messages, *args, **kwargs)
+        deadline = current_deadline()
+        with self.scheduler.slot(estimate_tokens(messages), timeout=deadline.remaining() if deadline else None) as usage:
+            response = self._call(llm, messages, *args, **kwargs)
+            usage_metadata = getattr(response, "usage_metadata", None)
+            if usage_metadata:
+                usage["tokens"] = usage_metadata.get("total_tokens")
+            return response
+
+    @staticmethod
+    def _call(llm, messages, *args, **kwargs):
+        deadline = current_deadline()
+        if deadline is not None:
+            # The client stops at the deadline too, rather than running on after the caller gave up
+            kwargs.setdefault("timeout", max(deadline.remaining(), 0.001))
+            kwargs.setdefault("max_retries", DEADLINE_MAX_RETRIES)
+        started = time.perf_counter()
+        response = llm.invoke(messages, *args, **kwargs)
+        # Model time only: a replay waits for its scheduler slot again
+        record_llm_call(llm, messages, response, time.perf_counter() - started)
+        return response
+
+    async def ainvoke(self, messages, *args, **kwargs):
+        # Waiting blocks, so it happens on a worker thread; to_thread carries the request context over
+        return await asyncio.to_thread(self.invoke, messages, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+@lru_cache(maxsize=1)
+def default_llm_scheduler() -> LLMScheduler:
+    """The process-wide scheduler every LLMInitializer model goes through"""
+    return LLMScheduler()
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.utils.sharded_executor import ShardedExecutor, default_sharded_executor
+from app.utils.what_if import SCENARIO_LEVERS, simulate_portfolio_totals
+
+# Columnar kernels for whole-portfolio computations, run on row shards by the
+# ShardedExecutor. `python -m app.utils.portfolio_kernels` benchmarks how they
+# scale with the number of workers
+PORTFOLIO_FIELDS = ("impressions", "clicks", "conversions", "spend", "revenue", "target_ctr", "target_roi")
+# Derived metrics as CampaignRecord.metrics names them, NaN where undefined
+METRIC_COLUMNS = ("ctr", "conversion_rate", "cost_per_click", "cost_per_conversion", "roi", "ctr_vs_target", "roi_vs_target")
+TARGET_PATTERNS = {"ctr_below_target": "ctr", "roi_below_target": "roi"}
+
+
+def portfolio_columns(campaigns: Iterable[Dict]) -> Dict[str, np.ndarray]:
+    """One float64 column per PORTFOLIO_FIELDS entry; missing totals are 0, missing targets NaN"""
+    rows = [[campaign.get(field) for field in PORTFOLIO_FIELDS] for campaign in campaigns]
+    values = np.array(rows, dtype=np.float64).reshape(len(rows), len(PORTFOLIO_FIELDS))
+    columns = {field: np.ascontiguousarray(values[:, i]) for i, field in enumerate(PORTFOLIO_FIELDS)}
+    for field in ("impressions", "clicks", "conversions", "spend", "revenue"):
+        np.nan_to_num(columns[field], copy=False, nan=0.0)
+    return columns
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray, scale: float = 1.0) -> np.ndarray:
+    return np.divide(numerator * scale, denominator, out=np.full(len(numerator), np.nan), where=denominator > 0)
+
+
+def metrics_kernel(columns: Dict[str, np.ndarray], out: Dict[str, np.ndarray], start: int) -> int:
+    """Fill out["metrics"] (rows, METRIC_COLUMNS) the way CampaignRecord derives them"""
+    impressions, clicks, conversions = columns["impressions"], columns["clicks"], columns["conversions"]
+    spend, revenue = columns["spend"], columns["revenue"]
+    metrics = out["metrics"]
+    metrics[:, 0] = _ratio(clicks, impressions, 100)
+    metrics[:, 1] = _ratio(conversions, clicks, 100)
+    metrics[:, 2] = _ratio(spend, clicks)
+    metrics[:, 3] = _ratio(spend, conversions)
+    metrics[:, 4] = _ratio(revenue - spend, spend, 100)
+    metrics[:, 5] = metrics[:, 0] - columns["target_ctr"] * 100
+    metrics[:, 6] = metrics[:, 4] - columns["target_roi"] * 100
+    return len(impressions)
+
+
+def issues_kernel(columns: Dict[str, np.ndarray],
+                  out: Dict[str, np.ndarray],
+                  start: int,
+                  patterns: Dict[str, Tuple[str, float, int]]) -> np.ndarray:
+    """
+    Fill out["metrics"] and out["severity"] (rows, patterns + TARGET_PATTERNS):
+    the severity of each issue as AnalysisAgent scores it, 0 where not
+    flagged. Returns the number of campaigns flagged per pattern.
+    """
+    metrics_kernel(columns, out, start)
+    metrics, severity = out["metrics"], out["severity"]
+    with np.errstate(invalid="ignore"):
+        for i, (metric, threshold, direction) in enumerate(patterns.values()):
+            value = metrics[:, METRIC_COLUMNS.index(metric)]
+            flagged = (value - threshold) * direction > 0
+            severity[:, i] = np.where(flagged, np.minimum(np.abs(value - threshold) / abs(threshold), 1.0), 0.0)
+        for i, metric in enumerate(TARGET_PATTERNS.values(), start=len(patterns)):
+            gap = metrics[:, METRIC_COLUMNS.index(f"{metric}_vs_target")]
+            target = columns[f"target_{metric}"] * 100
+            relative = np.divide(-gap, target, out=np.ones(len(gap)), where=target != 0)
+            severity[:, i] = np.where(gap < 0, np.minimum(relative, 1.0), 0.0)
+    return (severity > 0).sum(axis=0)
+
+
+def portfolio_metrics(columns: Dict[str, np.ndarray], executor: Optional[ShardedExecutor] = None) -> np.ndarray:
+    """(campaigns, METRIC_COLUMNS) derived metrics"""
+    executor = executor or default_sharded_executor()
+    out, _ = executor.run(metrics_kernel, columns, {"metrics": (np.float64, (len(METRIC_COLUMNS),))})
+    return out["metrics"]
+
+
+def portfolio_issues(columns: Dict[str, np.ndarray],
+                     patterns: Dict[str, Tuple[str, float, int]],
+                     executor: Optional[ShardedExecutor] = None) -> Tuple[np.ndarray, np.ndarray, Dict[str, int]]:
+    """
+    Derived metrics, issue severities and flagged-campaign counts for every
+    campaign. patterns maps names to (metric, threshold, direction); the
+    severity columns are patterns followed by TARGET_PATTERNS.
+    """
+    executor = executor or default_sharded_executor()
+    names = list(patterns) + list(TARGET_PATTERNS)
+    out, counts = executor.run(
+        issues_kernel,
+        columns,
+        {"metrics": (np.float64, (len(METRIC_COLUMNS),)), "severity": (np.float64, (len(names),))},
+        merge=sum,
+        patterns=patterns
+    )
+    return out["metrics"], out["severity"], dict(zip(names, (int(count) for count in counts)))
+
+
+def synthetic_portfolio(campaigns: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    """Random but plausible portfolio columns, for benchmarks"""
+    rng = np.random.default_rng(seed)
+    impressions = rng.integers(1_000, 1_000_000, campaigns).astype(np.float64)
+    clicks = np.floor(impressions * rng.uniform(0.002, 0.06, campaigns))
+    conversions = np.floor(clicks * rng.uniform(0.0, 0.12, campaigns))
+    spend = clicks * rng.uniform(0.2, 8.0, campaigns)
+    return {
+        "impressions": impressions,
+        "clicks": clicks,
+        "conversions": conversions,
+        "spend": spend,
+        "revenue": spend * rng.uniform(0.3, 4.0, campaigns),
+        "target_ctr": rng.choice([np.nan, 0.02, 0.03], campaigns),
+        "target_roi": rng.choice([np.nan, 1.0, 1.5], campaigns),
+    }
+
+
+def benchmark(campaigns: int, draws: int, worker_counts: List[int], repeat: int = 3) -> List[Dict]:
+    """Best-of-repeat seconds for the issue scan and the simulation at each worker count"""
+    columns = synthetic_portfolio(campaigns)
+    for lever, change in zip(SCENARIO_LEVERS, (0.2, 0.0, 0.0)):
+        columns[f"{lever}_change"] = np.full(campaigns, change)
+    # AnalysisAgent's fixed thresholds
+    patterns = {"low_ctr": ("ctr", 2, -1), "high_cost": ("cost_per_click", 5, 1),
+                "low_roi": ("roi", 100, -1), "low_conversion": ("conversion_rate", 5, -1)}
+    results = []
+    for workers in worker_counts:
+        executor = ShardedExecutor(workers=workers, min_shard_rows=1)
+        try:
+            timings = {}
+            for name, run in (("issues", lambda: portfolio_issues(columns, patterns, executor)),
+                              ("simulation", lambda: simulate_portfolio_totals(columns, draws, 0.7, 1, executor))):
+                # The first run also starts the workers
+                run()
+                seconds = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    run()
+                    seconds.append(time.perf_counter() - started)
+                timings[name] = min(seconds)
+            results.append({"workers": workers, **{f"{name}_seconds": round(value, 4) for name, value in timings.items()}})
+        finally:
+            executor.shutdown()
+    for result in results:
+        for name in ("issues", "simulation"):
+            result[f"{name}_speedup"] = round(results[0][f"{name}_seconds"] / result[f"{name}_seconds"], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sharded portfolio kernels across worker counts")
+    parser.add_argument("--campaigns", type=int, default=20_000)
+    parser.add_argument("--draws", type=int, default=1_000, help="Monte Carlo draws per campaign in the simulation")
+    parser.add_argument("--workers", default=None, help="Comma-separated worker counts (default 1, 2, 4, ... up to the cores)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(",")]
+    else:
+        worker_counts = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+    print(json.dumps({"campaigns": args.campaigns, "draws": args.draws, "cores": cores,
+                      "results": benchmark(args.campaigns, args.draws, worker_counts)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+import cProfile
+import functools
+import inspect
+import json
+import os
+import pstats
+import queue
+import random
+import re
+import shutil
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional
+from uuid import uuid4
+
+from app.utils.campaign_store import DATA_DIR
+
+# stacks: sampled call stacks, cheap enough to leave on for a share of traffic
+# cprofile: deterministic per-function timings, several times slower
+# memory: tracemalloc allocation diffs; tracing is process-wide and slows every request while on
+PROFILE_MODES = ("stacks", "cprofile", "memory")
+DEFAULT_PROFILE_DIR = DATA_DIR / "profiles"
+# Profiles kept in PROFILE_DIR; older ones are deleted as new ones are written (0 keeps all)
+DEFAULT_MAX_PROFILES = 200
+# Directory names of written profiles, which sort oldest first
+_PROFILE_ID_PATTERN = re.compile(r"^\d{8}-\d{6}-[0-9a-f]{8}$")
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 0.01
+DEFAULT_TRACEMALLOC_FRAMES = 10
+# Allocation diffs smaller than this are left out of memory.folded
+MIN_ALLOCATION_BYTES = 1024
+
+
+def parse_profile_modes(value: Optional[str]) -> FrozenSet[str]:
+    """Modes from an X-Profile header or env value: a comma-separated list, 'all', or '1' for stacks"""
+    if not value or value.strip().lower() in ("0", "false", "off"):
+        return frozenset()
+    value = value.strip().lower()
+    if value in ("1", "true", "on"):
+        return frozenset({"stacks"})
+    if value == "all":
+        return frozenset(PROFILE_MODES)
+    modes = {mode.strip() for mode in value.split(",") if mode.strip()}
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        raise ValueError(
+            f"Unknown profile modes: {', '.join(sorted(unknown))}; choose from {', '.join(PROFILE_MODES)}"
+        )
+    return frozenset(modes)
+
+
+def _frame_label(code) -> str:
+    # ';' separates frames and ' ' the count in the folded format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class RequestProfile:
+    """
+    Profile of one workflow run, broken down by LangGraph node. Threads
+    register for the node they work on; the sampler reads their stacks,
+    cProfile runs in each of them and tracemalloc snapshots bracket every
+    node. write() leaves the artifacts in one directory:
+    - stacks.folded and memory.folded, collapsed stacks rooted at the node
+      (speedscope, flamegraph.pl, inferno)
+    - <node>.pstats and request.pstats (snakeviz, gprof2dot, flameprof)
+    - summary.json with wall time, CPU time, samples and memory per node
+    tracemalloc sees the whole process, so a node's memory figures include
+    whatever concurrent requests allocated meanwhile.
+    """
+
+    def __init__(self, modes: Iterable[str], interval_seconds: Optional[float] = None):
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid4().hex[:8]}"
+        self.modes = frozenset(modes)
+        self.interval_seconds = interval_seconds or float(
+            os.getenv("PROFILE_SAMPLE_INTERVAL_SECONDS", DEFAULT_SAMPLE_INTERVAL_SECONDS)
+        )
+        # Where write() puts the artifacts by default, known before they are written
+        self.path = os.path.join(os.getenv("PROFILE_DIR") or DEFAULT_PROFILE_DIR, self.profile_id)
+        self._started = time.perf_counter()
+        self._wall_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+        # Thread id -> node it is working on
+        self._threads: Dict[int, str] = {}
+        self._stacks: Counter = Counter()
+        self._allocations: Counter = Counter()
+        self._cprofiles: Dict[str, List[cProfile.Profile]] = defaultdict(list)
+        self._nodes: Dict[str, Dict] = defaultdict(lambda: {
+            "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "samples": 0,
+            "process_memory_net_bytes": 0, "process_memory_peak_bytes": 0
+        })
+
+    @contextmanager
+    def thread(self, node: str) -> Iterator[None]:
+        """Attribute the calling thread's work to node until the block exits"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            if thread_id in self._threads:
+                # Already counted by an enclosing block
+                registered = False
+            else:
+                self._threads[thread_id] = node
+                registered = True
+        if not registered:
+            yield
+            return
+
+        profiler = None
+        if "cprofile" in self.modes:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler already holds this interpreter (Python 3.12+ allows one at a time)
+                profiler = None
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            cpu_seconds = time.thread_time() - cpu_started
+            if profiler is not None:
+                profiler.disable()
+            with self._lock:
+                del self._threads[thread_id]
+                self._nodes[node]["cpu_seconds"] += cpu_seconds
+                if profiler is not None:
+                    self._cprofiles[node].append(profiler)
+
+    @contextmanager
+    def node(self, node: str, in_thread: bool = True) -> Iterator[None]:
+        """
+        Time a node and diff the memory it allocated. in_thread also profiles
+        the calling thread, which async nodes leave out: the event loop thread
+        runs every other request's coroutines too.
+        """
+        before = None
+        if "memory" in self.modes and tracemalloc.is_tracing():
+            before = self._snapshot()
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            if in_thread:
+                with self.thread(node):
+                    yield
+            else:
+                yield
+        finally:
+            wall_seconds = time.perf_counter() - started
+            with self._lock:
+                self._nodes[node]["calls"] += 1
+                self._nodes[node]["wall_seconds"] += wall_seconds
+            if before is not None and tracemalloc.is_tracing():
+                self._record_allocations(node, before)
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def _record_allocations(self, node: str, before: tracemalloc.Snapshot):
+        peak = tracemalloc.get_traced_memory()[1]
+        diffs = self._snapshot().compare_to(before, "traceback")
+        with self._lock:
+            stats = self._nodes[node]
+            stats["process_memory_net_bytes"] += sum(diff.size_diff for diff in diffs)
+            stats["process_memory_peak_bytes"] = max(stats["process_memory_peak_bytes"], peak)
+            for diff in diffs:
+                if diff.size_diff >= MIN_ALLOCATION_BYTES:
+                    # Traceback frames run from the oldest call to the allocation
+                    frames = ";".join(
+                        f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in diff.traceback
+                    )
+                    self._allocations[f"{node};{frames}"] += diff.size_diff
+
+    def sample(self, frames: Dict[int, object]):
+        """Count the current stack of every registered thread, from sys._current_frames()"""
+        with self._lock:
+            threads = list(self._threads.items())
+        for thread_id, node in threads:
+            frame = frames.get(thread_id)
+            labels = []
+            while frame is not None:
+                if frame.f_code.co_filename != __file__:
+                    labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                labels.append(node)
+                with self._lock:
+                    self._stacks[";".join(reversed(labels))] += 1
+                    self._nodes[node]["samples"] += 1
+
+    def finish(self):
+        self._wall_seconds = time.perf_counter() - self._started
+
+    def write(self, directory: Optional[str] = None) -> str:
+        """Write the artifacts under directory/<profile_id>, by default self.path, and return the path"""
+        path = os.path.join(directory, self.profile_id) if directory else self.path
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            if "stacks" in self.modes:
+                self._write_folded(os.path.join(path, "stacks.folded"), self._stacks)
+            if "memory" in self.modes:
+                self._write_folded(os.path.join(path, "memory.folded"), self._allocations)
+            if self._cprofiles:
+                every = []
+                for node, profilers in self._cprofiles.items():
+                    pstats.Stats(*profilers).dump_stats(os.path.join(path, f"{node}.pstats"))
+                    every.extend(profilers)
+                pstats.Stats(*every).dump_stats(os.path.join(path, "request.pstats"))
+            summary = {
+                "profile_id": self.profile_id,
+                "modes": sorted(self.modes),
+                "wall_seconds": self._wall_seconds,
+                "sample_interval_seconds": self.interval_seconds if "stacks" in self.modes else None,
+                "nodes": {node: dict(stats) for node, stats in self._nodes.items()}
+            }
+            if "memory" in self.modes:
+                summary["memory_note"] = ("process_memory_* and memory.folded are process-wide: "
+                                          "they include allocations by requests running at the same time")
+        with open(os.path.join(path, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        self.path = path
+        return path
+
+    @staticmethod
+    def _write_folded(filename: str, counts: Counter):
+        with open(filename, "w") as f:
+            for stack, count in sorted(counts.items()):
+                f.write(f"{stack} {count}\n")
+
+
+class _StackSampler:
+    """One background thread sampling the stacks of every active profile, idle when there are none"""
+
+    def __init__(self):
+        self._profiles: List[RequestProfile] = []
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, profile: RequestProfile):
+        with self._condition:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def remove(self, profile: RequestProfile):
+        with self._condition:
+            self._profiles.remove(profile)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._profiles:
+                    self._condition.wait()
+                profiles = list(self._profiles)
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile.sample(frames)
+            del frames
+            time.sleep(min(profile.interval_seconds for profile in profiles))
+
+
+def prune_profiles(directory: str, keep: int):
+    """Delete all but the newest keep profiles in directory"""
+    try:
+        names = sorted(
+            name for name in os.listdir(directory)
+            if _PROFILE_ID_PATTERN.match(name) and os.path.isdir(os.path.join(directory, name))
+        )
+    except FileNotFoundError:
+        return
+    for name in names[:max(len(names) - keep, 0)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+class _ProfileWriter:
+    """Writes finished profiles on a background thread, so requests don't wait on the disk"""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, profile: RequestProfile):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-writer", daemon=True)
+                self._thread.start()
+        self._queue.put(profile)
+
+    def flush(self):
+        """Wait until every submitted profile is written"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            profile = self._queue.get()
+            try:
+                print(f"🔬 Profile written to {profile.write()}")
+                keep = int(os.getenv("PROFILE_MAX_PROFILES", DEFAULT_MAX_PROFILES))
+                if keep > 0:
+                    prune_profiles(os.path.dirname(profile.path), keep)
+            except OSError as e:
+                print(f"⚠️ Could not write profile {profile.profile_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+
+_sampler = _StackSampler()
+_writer = _ProfileWriter()
+_tracemalloc_lock = threading.Lock()
+# Profiles using tracemalloc, which is stopped again when the last one finishes
+# unless something else had already started it
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("profile", default=None)
+_current_node: ContextVar[Optional[str]] = ContextVar("profile_node", default=None)
+
+
+def request_profile(modes: Optional[Iterable[str]] = None) -> Optional[RequestProfile]:
+    """
+    A profile for a new request: with the modes asked for, or else for a
+    PROFILE_SAMPLE_RATE share of requests with PROFILE_SAMPLED_MODES (stacks)
+    """
+    modes = frozenset(modes or ())
+    if not modes:
+        rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        if rate <= 0 or random.random() >= rate:
+            return None
+        modes = parse_profile_modes(os.getenv("PROFILE_SAMPLED_MODES", "stacks"))
+    return RequestProfile(modes) if modes else None
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", DEFAULT_TRACEMALLOC_FRAMES)))
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+@contextmanager
+def profile_scope(profile: Optional[RequestProfile]) -> Iterator[Optional[RequestProfile]]:
+    """
+    Profile the block, then write the artifacts in the background to
+    profile.path, also when it raises; a None profile does nothing
+    """
+    if profile is None:
+        yield None
+        return
+    token = _current_profile.set(profile)
+    if "stacks" in profile.modes:
+        _sampler.add(profile)
+    if "memory" in profile.modes:
+        _start_tracemalloc()
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+        if "stacks" in profile.modes:
+            _sampler.remove(profile)
+        if "memory" in profile.modes:
+            _stop_tracemalloc()
+        profile.finish()
+        _writer.submit(profile)
+
+
+def flush_profiles():
+    """Wait for profiles still being written, e.g. before shutdown"""
+    _writer.flush()
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+def profiled_node(name: str, fn: Callable) -> Callable:
+    """Wrap a workflow node so the current profile, if any, attributes its work to name"""
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_node(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return await fn(*args, **kwargs)
+            token = _current_node.set(name)
+            try:
+                with profile.node(name, in_thread=False):
+                    return await fn(*args, **kwargs)
+            finally:
+                _current_node.reset(token)
+        return async_node
+
+    @functools.wraps(fn)
+    def node(*args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return fn(*args, **kwargs)
+        token = _current_node.set(name)
+        try:
+            with profile.node(name):
+                return fn(*args, **kwargs)
+        finally:
+            _current_node.reset(token)
+    return node
+
+
+def profiled_call(fn: Callable) -> Callable:
+    """
+    Wrap fn, about to run in a worker thread with the caller's context, so
+    the thread's work counts toward the node that handed it over
+    """
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        profile, node = _current_profile.get(), _current_node.get()
+        if profile is None or node is None:
+            return fn(*args, **kwargs)
+        with profile.thread(node):
+            return fn(*args, **kwargs)
+    return call
@@ -0,0 +1,135 @@
+import math
+from bisect import bisect_right
+from typing import Iterable, List, Optional
+
+
+class TDigest:
+    """
+    Mergeable streaming quantile sketch (merging t-digest). Memory is bounded by
+    the compression parameter regardless of how many values are added, and
+    rank/quantile queries are a binary search over the centroids.
+    """
+
+    def __init__(self, compression: float = 100, buffer_size: int = 500):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._means: List[float] = []
+        self._weights: List[float] = []
+        self._buffer: List[float] = []
+        self._centers: List[float] = []
+
+    def add(self, value: float):
+        if value != value:
+            return
+        self._buffer.append(value)
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.buffer_size:
+            self._compress()
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """Fold another digest into this one"""
+        other._compress()
+        self._compress()
+        self._means.extend(other._means)
+        self._weights.extend(other._weights)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(force=True)
+        return self
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(min(max(2 * q - 1, -1.0), 1.0))
+
+    def _compress(self, force: bool = False):
+        if not self._buffer and not force:
+            return
+        items = sorted(zip(
+            self._means + self._buffer,
+            self._weights + [1.0] * len(self._buffer)
+        ))
+        self._buffer = []
+        if not items:
+            return
+
+        total = sum(weight for _, weight in items)
+        means, weights = [], []
+        cumulative = 0.0
+        current_mean, current_weight = items[0]
+        for mean, weight in items[1:]:
+            q_left = cumulative / total
+            q_right = (cumulative + current_weight + weight) / total
+            if self._k(q_right) - self._k(q_left) <= 1:
+                current_weight += weight
+                current_mean += (mean - current_mean) * weight / current_weight
+            else:
+                means.append(current_mean)
+                weights.append(current_weight)
+                cumulative += current_weight
+                current_mean, current_weight = mean, weight
+        means.append(current_mean)
+        weights.append(current_weight)
+
+        self._means, self._weights = means, weights
+        # Cumulative weight at each centroid's midpoint, used for interpolation
+        self._centers = []
+        cumulative = 0.0
+        for weight in weights:
+            self._centers.append(cumulative + weight / 2)
+            cumulative += weight
+
+    def cdf(self, value: float) -> Optional[float]:
+        """Fraction of added values at or below value"""
+        self._compress()
+        if not self.count:
+            return None
+        if value < self.min:
+            return 0.0
+        if value >= self.max:
+            return 1.0
+
+        means, centers = self._means, self._centers
+        if value <= means[0]:
+            span = means[0] - self.min
+            rank = centers[0] * ((value - self.min) / span if span else 1.0)
+        elif value >= means[-1]:
+            span = self.max - means[-1]
+            fraction = (value - means[-1]) / span if span else 0.0
+            rank = centers[-1] + (self.count - centers[-1]) * fraction
+        else:
+            i = bisect_right(means, value) - 1
+            span = means[i + 1] - means[i]
+            fraction = (value - means[i]) / span if span else 0.0
+            rank = centers[i] + (centers[i + 1] - centers[i]) * fraction
+        return min(max(rank / self.count, 0.0), 1.0)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate value at quantile q (0-1)"""
+        self._compress()
+        if not self.count:
+            return None
+        target = min(max(q, 0.0), 1.0) * self.count
+        means, centers = self._means, self._centers
+        if target <= centers[0]:
+            fraction = target / centers[0] if centers[0] else 0.0
+            return self.min + (means[0] - self.min) * fraction
+        if target >= centers[-1]:
+            remaining = self.count - centers[-1]
+            fraction = (target - centers[-1]) / remaining if remaining else 0.0
+            return means[-1] + (self.max - means[-1]) * fraction
+        i = bisect_right(centers, target) - 1
+        span = centers[i + 1] - centers[i]
+        fraction = (target - centers[i]) / span if span else 0.0
+        return means[i] + (means[i + 1] - means[i]) * fraction
+
+    def __len__(self) -> int:
+        return int(self.count)
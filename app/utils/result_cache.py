@@ -0,0 +1,122 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.utils.campaign_store import DATA_DIR, METRIC_FIELDS
+
+DEFAULT_CACHE_PATH = DATA_DIR / "cache" / "results.sqlite3"
+DEFAULT_DELTA_THRESHOLD = 0.05
+
+
+def metric_snapshot(campaign_data: Dict) -> Dict:
+    """Extract the metrics a cached result was computed from"""
+    snapshot = {field: campaign_data.get(field) for field in METRIC_FIELDS}
+    last_7d = (campaign_data.get("trends") or {}).get("last_7d")
+    snapshot["last_7d"] = {field: last_7d[field] for field in METRIC_FIELDS} if last_7d else None
+    return snapshot
+
+
+def _values_moved(old: Dict, new: Dict, threshold: float) -> bool:
+    for field in METRIC_FIELDS:
+        before, after = old.get(field), new.get(field)
+        if before is None or after is None:
+            if before != after:
+                return True
+            continue
+        if before == 0:
+            if after != 0:
+                return True
+            continue
+        if abs(after - before) / abs(before) > threshold:
+            return True
+    return False
+
+
+def metrics_moved(old: Dict, new: Dict, threshold: float) -> bool:
+    """True if lifetime totals or rolling 7-day totals changed by more than threshold (relative)"""
+    if _values_moved(old, new, threshold):
+        return True
+    old_week, new_week = old.get("last_7d"), new.get("last_7d")
+    if old_week is None or new_week is None:
+        return old_week != new_week
+    return _values_moved(old_week, new_week, threshold)
+
+
+class ResultCache:
+    """
+    Persistent cache of per-campaign agent results (analysis, baseline summary).
+    Backed by SQLite so that a separate precompute worker and the API can share it.
+    """
+
+    def __init__(self,
+                 path: Optional[Path] = None,
+                 delta_threshold: Optional[float] = None):
+        self.path = Path(path or os.getenv("CAMPAIGN_CACHE_PATH", DEFAULT_CACHE_PATH))
+        self.delta_threshold = (
+            delta_threshold if delta_threshold is not None
+            else float(os.getenv("PRECOMPUTE_DELTA_THRESHOLD", DEFAULT_DELTA_THRESHOLD))
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    campaign_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    snapshot TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (campaign_id, stage)
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, campaign_id: str, stage: str) -> Optional[Dict]:
+        """Return the raw cache entry (value, snapshot, updated_at) if present"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, snapshot, updated_at FROM results WHERE campaign_id = ? AND stage = ?",
+                (campaign_id, stage)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "value": json.loads(row[0]),
+            "snapshot": json.loads(row[1]),
+            "updated_at": row[2]
+        }
+
+    def put(self, campaign_id: str, stage: str, value: Dict, campaign_data: Dict):
+        """Store a result together with the metrics it was computed from"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (
+                    campaign_id,
+                    stage,
+                    json.dumps(value, default=str),
+                    json.dumps(metric_snapshot(campaign_data)),
+                    datetime.now().isoformat()
+                )
+            )
+            self._conn.commit()
+
+    def needs_refresh(self, campaign_id: str, stage: str, campaign_data: Dict) -> bool:
+        entry = self.get(campaign_id, stage)
+        if entry is None:
+            return True
+        return metrics_moved(entry["snapshot"], metric_snapshot(campaign_data), self.delta_threshold)
+
+    def lookup(self, campaign_id: str, stage: str, campaign_data: Dict) -> Optional[Dict]:
+        """Return the cached value if the campaign has not moved past the delta threshold"""
+        entry = self.get(campaign_id, stage)
+        if entry is None:
+            return None
+        if metrics_moved(entry["snapshot"], metric_snapshot(campaign_data), self.delta_threshold):
+            return None
+        return entry["value"]
@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.utils.campaign_store import DATA_DIR
+
+DEFAULT_RESULTS_DIR = DATA_DIR / "results"
+DEFAULT_ROW_GROUP_SIZE = 5000
+DEFAULT_ROWS_PER_FILE = 500_000
+# Longest results wait, buffered or in an unpublished file, before they are published; bounds what a crash loses
+DEFAULT_PUBLISH_INTERVAL_SECONDS = 300.0
+
+CAMPAIGN_FIELDS = ("impressions", "clicks", "conversions", "spend", "revenue")
+METRIC_FIELDS = ("ctr", "conversion_rate", "cost_per_click", "cost_per_conversion", "roi", "ctr_vs_target", "roi_vs_target")
+
+# One row per campaign a run analyzed; runs without a campaign get one row with the campaign columns empty.
+# The date is not a column: it is the date=YYYY-MM-DD partition directory
+RESULTS_SCHEMA = pa.schema(
+    [
+        ("run_id", pa.string()),
+        ("recorded_at", pa.timestamp("us")),
+        ("session_id", pa.string()),
+        ("tenant", pa.string()),
+        ("lane", pa.string()),
+        ("user_input", pa.string()),
+        ("user_input_type", pa.string()),
+        ("tier", pa.string()),
+        ("model", pa.string()),
+        ("latency_seconds", pa.float64()),
+        ("degraded", pa.map_(pa.string(), pa.string())),
+        ("error", pa.string()),
+        ("campaign_id", pa.string()),
+        ("campaign_name", pa.string()),
+    ]
+    + [(field, pa.int64() if field in ("impressions", "clicks", "conversions") else pa.float64())
+       for field in CAMPAIGN_FIELDS]
+    + [(field, pa.float64()) for field in METRIC_FIELDS]
+    + [
+        ("issues", pa.list_(pa.string())),
+        ("analysis", pa.string()),
+        ("recommendations", pa.list_(pa.string())),
+    ]
+)
+
+
+def result_rows(result: Dict, **run) -> List[Dict]:
+    """
+    Flatten an orchestrator response into RESULTS_SCHEMA rows, one per
+    campaign; run holds the columns the response does not (session_id, user_input, model, ...)
+    """
+    row = {
+        "run_id": str(uuid4()),
+        "recorded_at": datetime.now(),
+        **run,
+        "user_input_type": result.get("user_input_type"),
+        "degraded": {part: str(reason) for part, reason in (result.get("degraded") or {}).items()},
+        "error": result.get("error"),
+        "recommendations": [str(item) for item in result.get("recommendations") or []],
+    }
+    if result.get("comparison"):
+        campaigns = [(entry["campaign_data"], entry.get("analysis") or {}) for entry in result["comparison"]]
+    elif result.get("campaign_data"):
+        campaigns = [(result["campaign_data"], result.get("analysis") or {})]
+    else:
+        return [row]
+
+    rows = []
+    for campaign_data, analysis in campaigns:
+        metrics = analysis.get("metrics") or {}
+        rows.append({
+            **row,
+            "campaign_id": str(campaign_data.get("campaign_id")),
+            "campaign_name": campaign_data.get("name"),
+            **{field: campaign_data.get(field) for field in CAMPAIGN_FIELDS},
+            **{field: metrics.get(field) for field in METRIC_FIELDS},
+            "issues": [str(issue) for issue in analysis.get("issues") or []],
+            "analysis": analysis.get("analysis"),
+        })
+    return rows
+
+
+class ResultsSink:
+    """
+    Appends run results to Parquet files under root_dir/date=YYYY-MM-DD/, for
+    scans over months of results. Rows are buffered and written
+    row_group_size at a time, so each row group is large enough to scan
+    efficiently. A file is written as a hidden .part-*.parquet and renamed
+    into place once it holds rows_per_file rows, the date rolls over or the
+    sink is closed, so readers only ever see complete files. Every
+    publish_interval_seconds whatever is buffered or open is published too,
+    so a crash loses at most that much.
+    """
+
+    def __init__(self,
+                 root_dir: Optional[Path] = None,
+                 row_group_size: Optional[int] = None,
+                 rows_per_file: Optional[int] = None,
+                 publish_interval_seconds: Optional[float] = None):
+        self.root_dir = Path(root_dir or os.getenv("RESULTS_DIR", DEFAULT_RESULTS_DIR))
+        self.row_group_size = row_group_size or int(os.getenv("RESULTS_ROW_GROUP_SIZE", DEFAULT_ROW_GROUP_SIZE))
+        self.rows_per_file = rows_per_file or int(os.getenv("RESULTS_ROWS_PER_FILE", DEFAULT_ROWS_PER_FILE))
+        self.publish_interval_seconds = (
+            publish_interval_seconds if publish_interval_seconds is not None
+            else float(os.getenv("RESULTS_PUBLISH_INTERVAL_SECONDS", DEFAULT_PUBLISH_INTERVAL_SECONDS))
+        )
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, List[Dict]] = {}
+        # Open file per date partition: [writer, hidden path, rows written]
+        self._writers: Dict[str, list] = {}
+        self._counts = {"rows": 0, "row_groups": 0, "files": 0}
+        self._closed = threading.Event()
+        if self.publish_interval_seconds > 0:
+            threading.Thread(target=self._publish_periodically, name="results-publish", daemon=True).start()
+
+    def record(self, result: Dict, **run):
+        """Buffer the rows of one run (see result_rows), writing a row group once enough are buffered"""
+        rows = result_rows(result, **run)
+        with self._lock:
+            for row in rows:
+                date = row["recorded_at"].date().isoformat()
+                buffer = self._buffers.setdefault(date, [])
+                buffer.append(row)
+                if len(buffer) >= self.row_group_size:
+                    self._write(date)
+            self._counts["rows"] += len(rows)
+
+    def flush(self):
+        """Write whatever is buffered, even if less than a row group, and publish the files"""
+        with self._lock:
+            for date in list(self._buffers):
+                self._write(date)
+            for date in list(self._writers):
+                self._publish(date)
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+
+    def _publish_periodically(self):
+        while not self._closed.wait(self.publish_interval_seconds):
+            self.flush()
+
+    def _write(self, date: str):
+        rows = self._buffers.pop(date, None)
+        if not rows:
+            return
+        # Rows for earlier dates are complete once a later date starts
+        for open_date in [d for d in self._writers if d < date]:
+            self._publish(open_date)
+        if date not in self._writers:
+            partition = self.root_dir / f"date={date}"
+            partition.mkdir(parents=True, exist_ok=True)
+            name = f"part-{time.strftime('%H%M%S')}-{os.getpid()}-{uuid4().hex[:8]}.parquet"
+            path = partition / f".{name}"
+            self._writers[date] = [pq.ParquetWriter(path, RESULTS_SCHEMA, compression="zstd"), path, 0]
+            self._counts["files"] += 1
+        entry = self._writers[date]
+        entry[0].write_table(pa.Table.from_pylist(rows, schema=RESULTS_SCHEMA), row_group_size=len(rows))
+        entry[2] += len(rows)
+        self._counts["row_groups"] += 1
+        if entry[2] >= self.rows_per_file:
+            self._publish(date)
+
+    def _publish(self, date: str):
+        writer, path, _ = self._writers.pop(date)
+        writer.close()
+        os.replace(path, path.with_name(path.name[1:]))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self._counts,
+                "buffered": sum(len(rows) for rows in self._buffers.values()),
+                "open_files": len(self._writers)
+            }
@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class SessionCache:
+    """Short-lived, session-scoped cache for speculative results"""
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple[str, str], Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.expired = 0
+        # Entries taken but not usable, e.g. computed from data that has since changed
+        self.stale = 0
+
+    def put(self, session_id: str, key: str, value: Any):
+        with self._lock:
+            self._evict_expired()
+            self._entries[(session_id, key)] = (time.monotonic() + self.ttl_seconds, value)
+
+    def pop(self,
+            session_id: str,
+            key: str,
+            usable: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        """
+        Remove and return an entry; each speculative result is used at most
+        once. An entry that usable() rejects is dropped and not counted as a hit.
+        """
+        with self._lock:
+            entry = self._entries.pop((session_id, key), None)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                self.expired += 1
+                return None
+            if usable is not None and not usable(value):
+                self.stale += 1
+                return None
+            self.hits += 1
+            return value
+
+    def discard_session(self, session_id: str):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == session_id]:
+                del self._entries[entry_key]
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for entry_key in [k for k, (expires_at, _) in self._entries.items() if expires_at < now]:
+            del self._entries[entry_key]
+            self.expired += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Below this many rows per shard, shipping work to other processes costs more
+# than it saves; kernels doing much more work per row pass their own
+DEFAULT_MIN_SHARD_ROWS = 250_000
+# Shards start on multiples of this, so kernels that seed per block of rows
+# give the same answer whatever the number of workers
+SHARD_ALIGNMENT = 1024
+# Arrays in the shared block start on cache-line boundaries
+_ALIGN = 64
+
+# (name, dtype, shape, byte offset) of each array in a shared block
+ArraySpec = Tuple[str, str, Tuple[int, ...], int]
+
+
+def _layout(arrays: Dict[str, Tuple[np.dtype, Tuple[int, ...]]]) -> Tuple[List[ArraySpec], int]:
+    specs, offset = [], 0
+    for name, (dtype, shape) in arrays.items():
+        dtype = np.dtype(dtype)
+        specs.append((name, dtype.str, shape, offset))
+        offset += -(-int(np.prod(shape, dtype=np.int64)) * dtype.itemsize // _ALIGN) * _ALIGN
+    return specs, offset
+
+
+def _views(buffer, specs: List[ArraySpec]) -> Dict[str, np.ndarray]:
+    return {
+        name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=buffer, offset=offset)
+        for name, dtype, shape, offset in specs
+    }
+
+
+def _run_shard(kernel: Callable, block_name: str, specs: List[ArraySpec], inputs: Tuple[str, ...],
+               start: int, stop: int, params: Dict) -> Any:
+    """Worker side: attach to the shared block and run the kernel over rows [start, stop)"""
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        views = _views(block.buf, specs)
+        columns = {name: views[name][start:stop] for name in inputs}
+        out = {name: view[start:stop] for name, view in views.items() if name not in inputs}
+        result = kernel(columns, out, start, **params)
+        # The block can only be closed once no array points into it
+        del views, columns, out
+        return result
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            # A failed kernel's traceback still holds views; the mapping goes when they are collected
+            pass
+
+
+class ShardedExecutor:
+    """
+    Runs a kernel over row shards of a set of columns on a pool of worker
+    processes. The columns are copied once into a shared memory block that
+    every worker maps, so no column is pickled; the kernel writes its per-row
+    outputs into shared output arrays and returns a small partial result per
+    shard, which merge() combines. Inputs too small to be worth the trip run
+    in-process with the same kernel.
+
+    A kernel is a module-level function kernel(columns, out, start, **params):
+    columns and out map names to the shard's rows, start is the index of the
+    shard's first row, and the return value must not reference the arrays.
+    """
+
+    def __init__(self, workers: Optional[int] = None, min_shard_rows: Optional[int] = None):
+        self.workers = workers or int(os.getenv("SHARD_WORKERS", 0)) or os.cpu_count() or 1
+        self.min_shard_rows = min_shard_rows or int(os.getenv("MIN_SHARD_ROWS", DEFAULT_MIN_SHARD_ROWS))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Forking a process that runs threads (the API, the LLM scheduler) is unsafe, so workers are spawned
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def shards(self, rows: int, min_shard_rows: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Row ranges to split rows into: one per worker, each at least min_shard_rows"""
+        count = min(self.workers, rows // (min_shard_rows or self.min_shard_rows))
+        if count <= 1:
+            return [(0, rows)]
+        size = -(-rows // count // SHARD_ALIGNMENT) * SHARD_ALIGNMENT
+        return [(start, min(start + size, rows)) for start in range(0, rows, size)]
+
+    def run(self,
+            kernel: Callable,
+            columns: Dict[str, np.ndarray],
+            outputs: Optional[Dict[str, Tuple[np.dtype, Tuple[int, ...]]]] = None,
+            merge: Optional[Callable[[List[Any]], Any]] = None,
+            min_shard_rows: Optional[int] = None,
+            **params) -> Tuple[Dict[str, np.ndarray], Any]:
+        """
+        Run kernel over every row of columns (equal-length arrays). outputs
+        names the per-row arrays to fill as name -> (dtype, trailing shape).
+        Returns the filled outputs and merge(partials), or the list of partial
+        results in row order without merge.
+        """
+        rows = len(next(iter(columns.values())))
+        outputs = outputs or {}
+        shards = self.shards(rows, min_shard_rows)
+        if len(shards) == 1:
+            out = {name: np.zeros((rows, *shape), dtype=dtype) for name, (dtype, shape) in outputs.items()}
+            partials = [kernel(columns, out, 0, **params)]
+            return out, merge(partials) if merge else partials
+
+        arrays = {name: (column.dtype, column.shape) for name, column in columns.items()}
+        arrays.update({name: (np.dtype(dtype), (rows, *shape)) for name, (dtype, shape) in outputs.items()})
+        specs, size = _layout(arrays)
+        block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        views = None
+        try:
+            views = _views(block.buf, specs)
+            for name, column in columns.items():
+                views[name][...] = column
+            pool = self._get_pool()
+            futures = [
+                pool.submit(_run_shard, kernel, block.name, specs, tuple(columns), start, stop, params)
+                for start, stop in shards
+            ]
+            partials = [future.result() for future in futures]
+            out = {name: views[name].copy() for name in outputs}
+        finally:
+            views = None
+            block.close()
+            block.unlink()
+        return out, merge(partials) if merge else partials
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+@lru_cache(maxsize=1)
+def default_sharded_executor() -> ShardedExecutor:
+    return ShardedExecutor()
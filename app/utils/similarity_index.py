@@ -0,0 +1,226 @@
+import hashlib
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.utils.anomaly_detector import period_rates
+from app.utils.verticals import classify_vertical
+
+# Bump when the feature layout changes so persisted indexes are rebuilt
+FEATURE_VERSION = 1
+METRIC_FEATURES = ("ctr", "conversion_rate", "cost_per_click", "roi", "spend")
+KEYWORD_DIMENSIONS = 64
+VERTICAL_DIMENSIONS = 16
+DIMENSIONS = len(METRIC_FEATURES) + KEYWORD_DIMENSIONS + VERTICAL_DIMENSIONS
+# Relative weight of each block in the cosine similarity
+METRIC_WEIGHT, KEYWORD_WEIGHT, VERTICAL_WEIGHT = 1.0, 1.0, 0.7
+
+
+def _bucket(token: str, dimensions: int):
+    """Stable (index, sign) for feature hashing, independent of PYTHONHASHSEED"""
+    digest = int(hashlib.md5(token.encode()).hexdigest()[:8], 16)
+    return digest % dimensions, 1.0 if digest & (1 << 31) else -1.0
+
+
+def _hashed(tokens: Iterable[str], dimensions: int) -> np.ndarray:
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for token in tokens:
+        index, sign = _bucket(token, dimensions)
+        vector[index] += sign
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _keyword_tokens(keywords) -> List[str]:
+    if isinstance(keywords, str):
+        keywords = keywords.split(";")
+    tokens = []
+    for keyword in keywords or []:
+        words = str(keyword).lower().split()
+        tokens.extend(words)
+        # Whole phrases too, so "digital banking" is closer to itself than to "digital" alone
+        if len(words) > 1:
+            tokens.append(" ".join(words))
+    return tokens
+
+
+def campaign_features(campaign: Dict) -> np.ndarray:
+    """Unit-length feature vector: squashed metrics, hashed keywords and hashed vertical"""
+    rates = period_rates(campaign)
+    spend = float(campaign.get("spend") or 0)
+    metrics = np.array([
+        math.log10(rates.get("ctr", 0.0) + 0.01) / 2,
+        math.log10(rates.get("conversion_rate", 0.0) + 0.01) / 2,
+        math.log10(rates.get("cost_per_click", 0.0) + 0.01) / 2,
+        math.tanh(rates.get("roi", 0.0) / 200),
+        math.log10(spend + 1) / 6,
+    ], dtype=np.float32)
+    vector = np.concatenate([
+        METRIC_WEIGHT * metrics / max(np.linalg.norm(metrics), 1e-9),
+        KEYWORD_WEIGHT * _hashed(_keyword_tokens(campaign.get("keywords")), KEYWORD_DIMENSIONS),
+        VERTICAL_WEIGHT * _hashed([classify_vertical(campaign)], VERTICAL_DIMENSIONS),
+    ])
+    return vector / np.linalg.norm(vector)
+
+
+def _peer_summary(campaign: Dict) -> Dict:
+    return {
+        "campaign_id": campaign["campaign_id"],
+        "name": campaign.get("name") or campaign["campaign_id"],
+        "vertical": classify_vertical(campaign),
+        "spend": float(campaign.get("spend") or 0),
+        **period_rates(campaign),
+    }
+
+
+class SimilarCampaignIndex:
+    """
+    Exact cosine nearest-neighbour index over campaign feature vectors, held
+    in one contiguous float32 matrix so a query is a single matrix-vector
+    product. Rows are updated in place, deleted rows go on a free list for
+    reuse, and the whole index is saved to an .npz file so restarts only
+    rebuild it when the campaign data changed.
+    """
+
+    def __init__(self, path: Optional[Path] = None, initial_capacity: int = 1024):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._reset(initial_capacity)
+
+    def _reset(self, capacity: int):
+        self._vectors = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._peers: List[Optional[Dict]] = [None] * capacity
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+        self.signature: Optional[str] = None
+
+    def _grow(self):
+        capacity = len(self._live) * 2
+        vectors = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+        vectors[:len(self._live)] = self._vectors
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        self._peers.extend([None] * (capacity - len(self._peers)))
+        self._vectors, self._live = vectors, live
+
+    def upsert_many(self, campaigns: Iterable[Dict]):
+        """Insert campaigns, or overwrite the row of a campaign already indexed"""
+        with self._lock:
+            for campaign in campaigns:
+                row = self._rows.get(campaign["campaign_id"])
+                if row is None:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        if self._size == len(self._live):
+                            self._grow()
+                        row = self._size
+                        self._size += 1
+                    self._rows[campaign["campaign_id"]] = row
+                self._vectors[row] = campaign_features(campaign)
+                self._peers[row] = _peer_summary(campaign)
+                self._live[row] = True
+
+    def delete(self, campaign_id: str) -> bool:
+        with self._lock:
+            row = self._rows.pop(campaign_id, None)
+            if row is None:
+                return False
+            self._live[row] = False
+            self._vectors[row] = 0.0
+            self._peers[row] = None
+            self._free.append(row)
+            return True
+
+    def rebuild(self, campaigns: Iterable[Dict], signature: Optional[str] = None):
+        with self._lock:
+            self._reset(len(self._live))
+        self.upsert_many(campaigns)
+        self.signature = signature
+
+    def query(self,
+              campaign: Dict,
+              k: int = 5,
+              pool: int = 20,
+              rank_by: Optional[str] = "roi") -> List[Dict]:
+        """
+        The k best campaigns by rank_by among the pool most similar to
+        campaign (or simply the k most similar when rank_by is None). The
+        campaign itself is excluded.
+        """
+        vector = campaign_features(campaign)
+        with self._lock:
+            n = self._size
+            if not n:
+                return []
+            scores = self._vectors[:n] @ vector
+            scores[~self._live[:n]] = -np.inf
+            own_row = self._rows.get(campaign.get("campaign_id"))
+            if own_row is not None:
+                scores[own_row] = -np.inf
+            take = min(pool if rank_by else k, n)
+            nearest = np.argpartition(-scores, take - 1)[:take]
+            nearest = nearest[np.argsort(-scores[nearest], kind="stable")]
+            peers = [
+                {**self._peers[row], "similarity": float(scores[row])}
+                for row in nearest if np.isfinite(scores[row])
+            ]
+        if rank_by:
+            peers.sort(key=lambda peer: peer.get(rank_by, -math.inf), reverse=True)
+        return peers[:k]
+
+    def save(self, signature: Optional[str] = None):
+        """Atomically write the index next to its signature"""
+        if self.path is None:
+            return
+        self.signature = signature
+        with self._lock:
+            n = self._size
+            meta = {
+                "version": FEATURE_VERSION,
+                "signature": signature,
+                "rows": self._rows,
+                "free": self._free,
+                "peers": self._peers[:n],
+            }
+            vectors, live = self._vectors[:n].copy(), self._live[:n].copy()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, vectors=vectors, live=live, meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, self.path)
+
+    def load(self, signature: Optional[str] = None) -> bool:
+        """Load the persisted index if it was built from the same data; False means rebuild"""
+        if self.path is None or not self.path.exists():
+            return False
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["version"] != FEATURE_VERSION or meta["signature"] != signature:
+                    return False
+                vectors, live = data["vectors"], data["live"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Could not load similarity index: {str(e)}")
+            return False
+
+        n = len(live)
+        with self._lock:
+            self._reset(max(n, 1024))
+            self._vectors[:n] = vectors
+            self._live[:n] = live
+            self._peers[:n] = meta["peers"]
+            self._rows = meta["rows"]
+            self._free = meta["free"]
+            self._size = n
+            self.signature = signature
+        return True
+
+    def __len__(self) -> int:
+        return len(self._rows)
@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from app.utils.campaign_store import METRIC_FIELDS
+from app.utils.deadline import Deadline, DeadlineExceeded, current_deadline
+from app.utils.llm_scheduler import Priority, current_llm_context
+from app.utils.profiling import profiled_call
+
+
+# _after_timeout() result telling a follower to run the call itself
+_RETRY = object()
+
+
+def campaign_fingerprint(campaign_data: Dict) -> str:
+    """Stable hash of a campaign's identity and metrics"""
+    payload = {field: campaign_data.get(field) for field in ("campaign_id", *METRIC_FIELDS)}
+    payload["trends_as_of"] = (campaign_data.get("trends") or {}).get("as_of")
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the
+    function and every caller that arrives while it is in flight shares its
+    result. Sync callers block on the future, async callers await it.
+
+    The leader runs under its own deadline and LLM lane, so a follower only
+    joins a leader in the same or a more urgent lane, waits no longer than
+    its own deadline allows, and runs the call itself if the leader ran out
+    of time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Key -> the leader's future and LLM lane
+        self._in_flight: Dict[Hashable, Tuple[Future, Priority]] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.retried = 0
+
+    def _join_or_lead(self, key: Hashable) -> Tuple[Future, bool]:
+        _, priority = current_llm_context()
+        with self._lock:
+            self.calls += 1
+            entry = self._in_flight.get(key)
+            if entry is not None and entry[1] <= priority:
+                self.coalesced += 1
+                return entry[0], False
+            # Later callers join this call rather than one in a slower lane
+            future = Future()
+            self._in_flight[key] = (future, priority)
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, fn: Callable, *args, **kwargs):
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                if self._in_flight.get(key, (None,))[0] is future:
+                    del self._in_flight[key]
+
+    def _after_timeout(self, future: Future, deadline: Optional[Deadline]) -> Any:
+        """
+        A follower's wait ended in a TimeoutError: the leader's result if it
+        arrived meanwhile, _RETRY to run the call again if the leader ran out of
+        its own time while this caller has some left, else the error
+        """
+        if not future.done():
+            raise DeadlineExceeded("Gave up waiting on a coalesced call to meet the request deadline")
+        error = future.exception()
+        if error is None:
+            return future.result()
+        if not isinstance(error, TimeoutError) or (deadline is not None and not deadline.remaining()):
+            raise error
+        with self._lock:
+            self.retried += 1
+        return _RETRY
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        while True:
+            future, is_leader = self._join_or_lead(key)
+            if is_leader:
+                self._finish(key, future, fn, *args, **kwargs)
+                return future.result()
+            deadline = current_deadline()
+            try:
+                return future.result(timeout=deadline.remaining() if deadline is not None else None)
+            except TimeoutError:
+                result = self._after_timeout(future, deadline)
+                if result is not _RETRY:
+                    return result
+
+    async def do_async(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Like do(), but runs the blocking function in a worker thread"""
+        while True:
+            future, is_leader = self._join_or_lead(key)
+            if is_leader:
+                await asyncio.to_thread(self._finish, key, future, profiled_call(fn), *args, **kwargs)
+                return future.result()
+            deadline = current_deadline()
+            try:
+                # Shielded: a follower giving up must not cancel the leader's future
+                return await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(future)),
+                    deadline.remaining() if deadline is not None else None
+                )
+            except TimeoutError:
+                result = self._after_timeout(future, deadline)
+                if result is not _RETRY:
+                    return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "retried": self.retried,
+                "in_flight": len(self._in_flight)
+            }
@@ -0,0 +1,245 @@
+import csv
+import json
+import threading
+from array import array
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from app.utils.anomaly_detector import AnomalyDetector
+from app.utils.campaign_store import DATA_DIR, METRIC_FIELDS
+
+WINDOWS = (7, 28)
+DEFAULT_HISTORY_DAYS = 90
+
+
+def derived_metrics(totals: Dict) -> Dict:
+    """Rate metrics in the same units AnalysisAgent uses (percentages and dollars)"""
+    impressions, clicks = totals["impressions"], totals["clicks"]
+    conversions, spend, revenue = totals["conversions"], totals["spend"], totals["revenue"]
+    return {
+        "ctr": clicks / impressions * 100 if impressions else None,
+        "conversion_rate": conversions / clicks * 100 if clicks else None,
+        "cost_per_click": spend / clicks if clicks else None,
+        "roi": (revenue - spend) / spend * 100 if spend else None,
+    }
+
+
+def _relative_change(current: Optional[float], previous: Optional[float]) -> Optional[float]:
+    if current is None or not previous:
+        return None
+    return (current - previous) / abs(previous)
+
+
+class CampaignSeries:
+    """
+    Daily metrics for one campaign, stored as one ring-buffered array per
+    metric. Rolling window sums are maintained on every write, so appending
+    or correcting a day is O(1) regardless of history length.
+    """
+
+    __slots__ = ("first_day", "capacity", "length", "columns", "window_sums", "prior_week")
+
+    def __init__(self, first_day: date, capacity: int = DEFAULT_HISTORY_DAYS):
+        if capacity < max(WINDOWS):
+            raise ValueError(f"capacity must cover the largest window ({max(WINDOWS)} days)")
+        self.first_day = first_day
+        self.capacity = capacity
+        self.length = 0
+        self.columns = [array('d', bytes(8 * capacity)) for _ in METRIC_FIELDS]
+        self.window_sums = {window: [0.0] * len(METRIC_FIELDS) for window in WINDOWS}
+        # Sums over days t-13..t-7, for week-over-week comparisons
+        self.prior_week = [0.0] * len(METRIC_FIELDS)
+
+    @property
+    def last_day(self) -> Optional[date]:
+        if not self.length:
+            return None
+        return date.fromordinal(self.first_day.toordinal() + self.length - 1)
+
+    def _value(self, field: int, t: int) -> float:
+        if t < 0 or t >= self.length or t < self.length - self.capacity:
+            return 0.0
+        return self.columns[field][t % self.capacity]
+
+    def _push(self, values: Sequence[float]):
+        t = self.length
+        for field, value in enumerate(values):
+            for window in WINDOWS:
+                self.window_sums[window][field] += value - self._value(field, t - window)
+            self.prior_week[field] += self._value(field, t - 7) - self._value(field, t - 14)
+            self.columns[field][t % self.capacity] = value
+        self.length += 1
+
+    def _correct(self, t: int, values: Sequence[float]):
+        age = self.length - 1 - t
+        for field, value in enumerate(values):
+            delta = value - self.columns[field][t % self.capacity]
+            for window in WINDOWS:
+                if age < window:
+                    self.window_sums[window][field] += delta
+            if 7 <= age < 14:
+                self.prior_week[field] += delta
+            self.columns[field][t % self.capacity] = value
+
+    def _reset(self, length: int):
+        for column in self.columns:
+            for i in range(self.capacity):
+                column[i] = 0.0
+        for sums in (*self.window_sums.values(), self.prior_week):
+            for i in range(len(sums)):
+                sums[i] = 0.0
+        self.length = length
+
+    def _extend_back(self, days: int):
+        # Only reachable while the whole history is retained, so nothing is lost by replaying it
+        history = [[self._value(field, t) for field in range(len(METRIC_FIELDS))] for t in range(self.length)]
+        self._reset(0)
+        self.first_day -= timedelta(days=days)
+        for _ in range(days):
+            self._push([0.0] * len(METRIC_FIELDS))
+        for values in history:
+            self._push(values)
+
+    def upsert(self, day: date, metrics: Dict):
+        """
+        Append a new day, or write a day within the retained history, i.e. the
+        capacity days up to the newest one, even if it precedes the first day seen
+        """
+        values = [float(metrics.get(field) or 0) for field in METRIC_FIELDS]
+        t = (day - self.first_day).days
+        if t < self.length - self.capacity:
+            raise ValueError(f"{day.isoformat()} is older than the retained history")
+        if t < 0:
+            # Uploads can arrive out of order or newest-first
+            self._extend_back(-t)
+            t = 0
+        if t < self.length:
+            self._correct(t, values)
+            return
+
+        # Days without rows count as zero activity
+        if t - self.length >= self.capacity:
+            self._reset(t)
+        while self.length < t:
+            self._push([0.0] * len(METRIC_FIELDS))
+        self._push(values)
+
+    def column(self, field: str, days: Optional[int] = None) -> List[float]:
+        """Oldest-first values of one metric over the retained (or last N) days"""
+        index = METRIC_FIELDS.index(field)
+        start = max(self.length - min(days or self.capacity, self.capacity), 0)
+        return [self._value(index, t) for t in range(start, self.length)]
+
+    def trends(self) -> Dict:
+        """Rolling 7/28-day totals and rates plus week-over-week deltas"""
+        result = {"as_of": self.last_day.isoformat() if self.last_day else None, "days": self.length}
+        for window in WINDOWS:
+            totals = dict(zip(METRIC_FIELDS, self.window_sums[window]))
+            result[f"last_{window}d"] = {**totals, **derived_metrics(totals)}
+
+        if self.length >= 14:
+            this_week = result["last_7d"]
+            prior = dict(zip(METRIC_FIELDS, self.prior_week))
+            prior.update(derived_metrics(prior))
+            wow = {
+                key: _relative_change(this_week[key], prior[key])
+                for key in (*METRIC_FIELDS, "ctr", "conversion_rate", "cost_per_click")
+            }
+            # ROI can be negative, so compare it in percentage points
+            wow["roi_points"] = (
+                this_week["roi"] - prior["roi"]
+                if this_week["roi"] is not None and prior["roi"] is not None else None
+            )
+            result["week_over_week"] = wow
+        return result
+
+
+class TimeSeriesStore:
+    """
+    Per-day campaign metrics, from campaign_daily.csv plus an append-only upload
+    log. Every new day is also fed to the anomaly detector.
+    """
+
+    def __init__(self,
+                 data_dir: Optional[Path] = None,
+                 capacity: int = DEFAULT_HISTORY_DAYS,
+                 anomaly_detector: Optional[AnomalyDetector] = None):
+        self.data_dir = Path(data_dir) if data_dir else DATA_DIR
+        self.upload_log_path = self.data_dir / "uploads" / "daily.ndjson"
+        self.capacity = capacity
+        self.anomaly_detector = anomaly_detector or AnomalyDetector()
+        self._series: Dict[str, CampaignSeries] = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            self._series = {}
+            self.anomaly_detector.reset()
+            csv_path = self.data_dir / "campaign_daily.csv"
+            if csv_path.exists():
+                with open(csv_path, newline='') as f:
+                    for row in csv.DictReader(f):
+                        self._upsert(row["campaign_id"], date.fromisoformat(row["date"]), row)
+            if self.upload_log_path.exists():
+                with open(self.upload_log_path, 'r') as f:
+                    for line in f:
+                        if line.strip():
+                            row = json.loads(line)
+                            self._upsert(row["campaign_id"], date.fromisoformat(row["date"]), row)
+
+    def _upsert(self, campaign_id: str, day: date, metrics: Dict) -> CampaignSeries:
+        series = self._series.get(campaign_id)
+        if series is None:
+            series = self._series[campaign_id] = CampaignSeries(day, self.capacity)
+        is_new_day = series.last_day is None or day > series.last_day
+        series.upsert(day, metrics)
+        # Corrections to past days don't re-train the baseline
+        if is_new_day:
+            self.anomaly_detector.observe(campaign_id, metrics, day)
+        return series
+
+    def append_many(self, rows: Iterable[Dict]) -> Dict[int, str]:
+        """
+        Record validated daily rows (campaign_id, date and metrics) and persist
+        the accepted ones. Returns an error message per rejected row index.
+        """
+        accepted, errors = [], {}
+        with self._lock:
+            for i, row in enumerate(rows):
+                try:
+                    self._upsert(row["campaign_id"], date.fromisoformat(str(row["date"])), row)
+                    accepted.append(row)
+                except ValueError as e:
+                    errors[i] = str(e)
+            if not accepted:
+                return errors
+            self.upload_log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.upload_log_path, 'a') as f:
+                for row in accepted:
+                    f.write(json.dumps(
+                        {"campaign_id": row["campaign_id"], "date": str(row["date"]),
+                         **{field: row.get(field, 0) for field in METRIC_FIELDS}}
+                    ) + "\n")
+        return errors
+
+    def get(self, campaign_id: str) -> Optional[CampaignSeries]:
+        return self._series.get(campaign_id)
+
+    def trends(self, campaign_id: str) -> Optional[Dict]:
+        series = self._series.get(campaign_id)
+        if series is None or not series.length:
+            return None
+        with self._lock:
+            return series.trends()
+
+    def anomalies(self, campaign_id: str, days: int = 7) -> List[Dict]:
+        """Anomaly alerts raised over the last N days of a campaign's series"""
+        series = self._series.get(campaign_id)
+        if series is None or not series.length:
+            return []
+        return self.anomaly_detector.recent_alerts(campaign_id, since=series.last_day - timedelta(days=days - 1))
+
+    def __len__(self) -> int:
+        return len(self._series)
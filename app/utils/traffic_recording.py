@@ -0,0 +1,204 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+
+RECORDING_FORMAT = "traffic-recording"
+RECORDING_VERSION = 1
+
+# Seconds between background flushes of the recording, so a crash or a quiet
+# server loses little without flushing (and compressing worse) after every turn
+FLUSH_INTERVAL_SECONDS = 1.0
+
+# LLM calls made for the turn being recorded, shared with the threads the turn starts
+_turn_calls: ContextVar[Optional[List[Dict]]] = ContextVar("traffic_turn_calls", default=None)
+
+
+def prompt_key(messages) -> str:
+    """Short digest of a prompt, for finding the recorded response to the same prompt"""
+    if isinstance(messages, str):
+        text = messages
+    else:
+        text = "\n".join(f"{getattr(message, 'type', '')}:{getattr(message, 'content', message)}" for message in messages)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def record_llm_call(llm, messages, response, seconds: float):
+    """Add a finished LLM call to the turn being recorded, if there is one"""
+    calls = _turn_calls.get()
+    if calls is not None:
+        calls.append({
+            "prompt": prompt_key(messages),
+            "model": getattr(llm, "model", None),
+            "seconds": round(seconds, 4),
+            "content": getattr(response, "content", str(response)),
+        })
+
+
+class TrafficRecorder:
+    """
+    Records chat turns as they are served: the session, when the turn
+    arrived, the user input and settings, how long it took, and every LLM
+    response received for it with the call's latency. Turns are appended to
+    a gzipped NDJSON file, one line each, after a header line.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._dirty = False
+        self._write({"format": RECORDING_FORMAT, "version": RECORDING_VERSION, "started_at": self._started})
+        self.turns = 0
+        # Flushed on a timer rather than by the next turn, which may never come
+        self._closed = threading.Event()
+        threading.Thread(target=self._flush_periodically, name="traffic-recording-flush", daemon=True).start()
+
+    def _write(self, record: Dict):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._dirty = True
+
+    def _flush_periodically(self):
+        while not self._closed.wait(FLUSH_INTERVAL_SECONDS):
+            with self._lock:
+                if self._dirty and not self._file.closed:
+                    self._file.flush()
+                    self._dirty = False
+
+    @contextmanager
+    def turn(self, session_id: str, user_input: str, **settings) -> Iterator[Dict]:
+        """
+        Record the turn run inside the block. settings (tier, deadline_seconds)
+        are replayed with it; set "error" on the yielded dict if the turn failed.
+        """
+        calls: List[Dict] = []
+        turn = {"session_id": session_id, "at": round(time.time() - self._started, 4),
+                "user_input": user_input, **settings}
+        token = _turn_calls.set(calls)
+        started = time.perf_counter()
+        try:
+            yield turn
+        except Exception as e:
+            turn["error"] = str(e)
+            raise
+        finally:
+            _turn_calls.reset(token)
+            turn["seconds"] = round(time.perf_counter() - started, 4)
+            turn["llm"] = calls
+            with self._lock:
+                self._write(turn)
+                self.turns += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+            self._dirty = False
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._file.close()
+
+
+@lru_cache(maxsize=1)
+def traffic_recorder() -> Optional[TrafficRecorder]:
+    """The process-wide recorder when TRAFFIC_RECORD_FILE is set, else None"""
+    path = os.getenv("TRAFFIC_RECORD_FILE")
+    return TrafficRecorder(Path(path)) if path else None
+
+
+def record_turn(session_id: str, user_input: str, **settings):
+    """recorder.turn() when traffic is being recorded, else a no-op context"""
+    recorder = traffic_recorder()
+    return recorder.turn(session_id, user_input, **settings) if recorder is not None else nullcontext({})
+
+
+def read_recording(path: Path) -> Tuple[Dict, List[Dict]]:
+    """The header and the turns of a recording, in arrival order"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = []
+        try:
+            for line in f:
+                lines.append(line)
+        except EOFError:
+            # A recorder that was not closed leaves the last block without its trailer
+            pass
+    if not lines:
+        raise ValueError(f"{path} is empty")
+    header = json.loads(lines[0])
+    if header.get("format") != RECORDING_FORMAT:
+        raise ValueError(f"{path} is not a traffic recording")
+    turns = []
+    for line in lines[1:]:
+        try:
+            turns.append(json.loads(line))
+        except json.JSONDecodeError:
+            # The last line of an interrupted recording can be cut short
+            break
+    return header, sorted(turns, key=lambda turn: turn["at"])
+
+
+class ReplayLLM:
+    """
+    Local stand-in for the chat model that answers from a recording: a
+    prompt seen while recording gets the response recorded for it, after
+    the recorded latency. Prompts that changed since (new code, new data)
+    get the recorded responses in turn, so the traffic keeps its shape.
+    """
+
+    def __init__(self, path: Path):
+        _, turns = read_recording(path)
+        self.path = Path(path)
+        self._by_prompt: Dict[str, Deque[Dict]] = {}
+        self._in_order: Deque[Dict] = deque()
+        for turn in turns:
+            for call in turn.get("llm", []):
+                self._by_prompt.setdefault(call["prompt"], deque()).append(call)
+                self._in_order.append(call)
+        models = {call.get("model") for call in self._in_order if call.get("model")}
+        self.model = "replay:" + ",".join(sorted(models)) if models else "replay"
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _next(self, calls: Deque[Dict]) -> Dict:
+        # Rotated rather than consumed, so traffic can be replayed more than once
+        call = calls.popleft()
+        calls.append(call)
+        return call
+
+    def invoke(self, messages, *args, **kwargs) -> AIMessage:
+        with self._lock:
+            calls = self._by_prompt.get(prompt_key(messages))
+            if calls:
+                self.hits += 1
+            else:
+                self.misses += 1
+                calls = self._in_order
+            if not calls:
+                raise RuntimeError(f"No LLM responses recorded in {self.path}")
+            call = self._next(calls)
+        time.sleep(call["seconds"])
+        return AIMessage(content=call["content"])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "recorded_calls": len(self._in_order)}
+
+
+@lru_cache(maxsize=None)
+def replay_llm(path: str) -> ReplayLLM:
+    """One stand-in per recording, shared by every LLMInitializer in the process"""
+    return ReplayLLM(Path(path))
@@ -0,0 +1,158 @@
+import json
+import re
+from collections import deque
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TAXONOMY_PATH = Path(__file__).parent.parent / "data" / "vertical_taxonomy.json"
+DEFAULT_VERTICAL = "digital marketing"
+# Labels below this share of the total match weight are dropped
+MIN_LABEL_SHARE = 0.2
+
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, collapse punctuation to single spaces and pad, so patterns match whole words"""
+    return f" {_NON_ALPHANUMERIC.sub(' ', text.lower()).strip()} "
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher: every pattern is found in one pass over the text,
+    in O(len(text) + matches) regardless of how many patterns there are.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Pattern ending at a node, and the nearest node on the fail chain with one
+        self._output: List[Optional[int]] = [None]
+        self._dict_link: List[int] = [0]
+        self.patterns: List[str] = []
+
+        for pattern in patterns:
+            node = 0
+            for ch in pattern:
+                child = self._goto[node].get(ch)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][ch] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                    self._dict_link.append(0)
+                node = child
+            if self._output[node] is None:
+                self._output[node] = len(self.patterns)
+                self.patterns.append(pattern)
+
+        # Breadth-first, so every fail target is finished before it is used
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                fail = self._fail[child]
+                self._dict_link[child] = fail if self._output[fail] is not None else self._dict_link[fail]
+
+    def find_all(self, text: str) -> List[int]:
+        """Indexes into self.patterns of every match, in the order they end"""
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        matches = []
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if output[node] is not None else dict_link[node]
+            while hit:
+                matches.append(output[hit])
+                hit = dict_link[hit]
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+
+class VerticalClassifier:
+    """
+    Weighted multi-label vertical classification from a keyword taxonomy.
+    All taxonomy terms are compiled into one Aho-Corasick automaton, and a
+    campaign's name and keywords are scanned in a single pass.
+    """
+
+    def __init__(self, taxonomy: Dict):
+        self.default_vertical = taxonomy.get("default", DEFAULT_VERTICAL)
+        self.verticals: Dict[str, Dict] = taxonomy["verticals"]
+
+        # A term may belong to several verticals with different weights
+        term_labels: Dict[str, List[Tuple[str, float]]] = {}
+        for vertical, entry in self.verticals.items():
+            for term, weight in entry.get("terms", {}).items():
+                term_labels.setdefault(normalize_text(term), []).append((vertical, float(weight)))
+        self._automaton = AhoCorasick(term_labels)
+        self._labels = [term_labels[pattern] for pattern in self._automaton.patterns]
+
+    @classmethod
+    def from_file(cls, path: Path = TAXONOMY_PATH) -> "VerticalClassifier":
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def campaign_text(campaign: Dict) -> str:
+        keywords = campaign.get("keywords") or []
+        if isinstance(keywords, str):
+            keywords = keywords.split(";")
+        return " ; ".join([str(campaign.get("name") or ""), *map(str, keywords)])
+
+    def classify_text(self, text: str) -> List[Tuple[str, float]]:
+        """(vertical, share of match weight) pairs, strongest first; each distinct term counts once"""
+        scores: Dict[str, float] = {}
+        for pattern in set(self._automaton.find_all(normalize_text(text))):
+            for vertical, weight in self._labels[pattern]:
+                scores[vertical] = scores.get(vertical, 0.0) + weight
+        total = sum(scores.values())
+        if not total:
+            return [(self.default_vertical, 1.0)]
+        labels = sorted(
+            ((vertical, score / total) for vertical, score in scores.items()),
+            key=lambda label: label[1], reverse=True
+        )
+        kept = [label for label in labels if label[1] >= MIN_LABEL_SHARE] or labels[:1]
+        kept_total = sum(share for _, share in kept)
+        return [(vertical, share / kept_total) for vertical, share in kept]
+
+    def classify(self, campaign: Dict) -> List[Tuple[str, float]]:
+        """Weighted verticals for a campaign; an explicit `vertical` field wins outright"""
+        vertical = str(campaign.get("vertical") or "").strip().lower()
+        if vertical:
+            return [(vertical, 1.0)]
+        return self.classify_text(self.campaign_text(campaign))
+
+    def topic(self, vertical: str) -> str:
+        return self.verticals.get(vertical, {}).get("topic", vertical)
+
+    def trends(self, vertical: str) -> Optional[str]:
+        return self.verticals.get(vertical, {}).get("trends")
+
+    @property
+    def term_count(self) -> int:
+        return len(self._automaton)
+
+
+@lru_cache(maxsize=1)
+def default_classifier() -> VerticalClassifier:
+    """Classifier for the bundled taxonomy, compiled once per process"""
+    return VerticalClassifier.from_file(TAXONOMY_PATH)
+
+
+def classify_vertical(campaign: Dict) -> str:
+    """Primary vertical of a campaign"""
+    return default_classifier().classify(campaign)[0][0]
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.utils.budget_optimizer import DEFAULT_ELASTICITY
+from app.utils.sharded_executor import ShardedExecutor, default_sharded_executor
+
+DEFAULT_DRAWS = 10_000
+DEFAULT_CACHE_SIZE = 1024
+# Relative changes a scenario may apply, e.g. {"spend": 0.2} for +20% spend
+SCENARIO_LEVERS = ("spend", "ctr", "conversion_rate")
+INTERVAL = (5, 95)
+# Uncertainty of how reach responds to spend
+ELASTICITY_SD = 0.1
+# Campaigns a portfolio simulation draws with one generator, bounding its
+# memory to a block of (campaigns, draws) arrays at a time
+SIMULATION_BLOCK = 64
+# Campaign draws a shard needs to be worth sending to a worker process
+MIN_SHARD_DRAWS = 2_000_000
+
+# Levers simulated for every recommendation, by label
+STANDARD_SCENARIOS = {
+    "Spend +20%": {"spend": 0.2},
+    "CTR +10%": {"ctr": 0.1},
+    "Conversion rate +10%": {"conversion_rate": 0.1},
+}
+
+
+def _normalize_scenario(scenario: Dict) -> Dict[str, float]:
+    unknown = set(scenario) - set(SCENARIO_LEVERS)
+    if unknown:
+        raise ValueError(f"Unknown scenario levers: {', '.join(sorted(unknown))}")
+    normalized = {lever: float(scenario.get(lever) or 0.0) for lever in SCENARIO_LEVERS}
+    for lever, change in normalized.items():
+        if change <= -1:
+            raise ValueError(f"{lever} change must be above -100%")
+    return normalized
+
+
+def _distribution(samples: np.ndarray) -> Dict:
+    low, median, high = np.percentile(samples, (INTERVAL[0], 50, INTERVAL[1]))
+    return {"mean": float(samples.mean()), "p5": float(low), "p50": float(median), "p95": float(high)}
+
+
+def simulate(campaigns: List[Dict],
+             scenarios: List[Dict],
+             draws: int = DEFAULT_DRAWS,
+             elasticity: float = DEFAULT_ELASTICITY,
+             seed: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Monte Carlo draws of revenue, spend and conversions for each campaign
+    under its scenario, plus the same draws under no change. Rates carry
+    their posterior uncertainty: CTR and conversion rate are Beta draws from
+    the observed counts, and revenue per conversion is a Gamma draw around
+    the observed average. Reach scales with spend at an elasticity drawn
+    around the given one (diminishing returns). Both arms share the draws
+    (common random numbers), so their difference isolates the effect of the
+    change.
+
+    Returns (campaigns, draws) arrays.
+    """
+    impressions = np.array([float(c.get("impressions") or 0) for c in campaigns])
+    clicks = np.array([float(c.get("clicks") or 0) for c in campaigns])
+    conversions = np.array([float(c.get("conversions") or 0) for c in campaigns])
+    spend = np.array([float(c.get("spend") or 0) for c in campaigns])
+    revenue = np.array([float(c.get("revenue") or 0) for c in campaigns])
+    levers = np.array([[scenario[lever] for lever in SCENARIO_LEVERS] for scenario in scenarios])
+    return simulate_columns(
+        impressions, clicks, conversions, spend, revenue, levers, draws, elasticity, np.random.default_rng(seed)
+    )
+
+
+def simulate_columns(impressions: np.ndarray,
+                     clicks: np.ndarray,
+                     conversions: np.ndarray,
+                     spend: np.ndarray,
+                     revenue: np.ndarray,
+                     levers: np.ndarray,
+                     draws: int,
+                     elasticity: float,
+                     rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """simulate() over campaign columns, with levers as (campaigns, SCENARIO_LEVERS) changes"""
+    shape = (len(impressions), draws)
+    ctr = rng.beta(clicks[:, None] + 1, np.maximum(impressions - clicks, 0)[:, None] + 1, size=shape)
+    conversion_rate = rng.beta(conversions[:, None] + 1, np.maximum(clicks - conversions, 0)[:, None] + 1, size=shape)
+    # The average order value is known to within roughly 1/sqrt(conversions)
+    order_shape = np.maximum(conversions, 1.0)
+    average_order = np.where(conversions > 0, revenue / np.maximum(conversions, 1.0), 0.0)
+    order_value = rng.gamma(order_shape[:, None], (average_order / order_shape)[:, None], size=shape)
+
+    spend_factor = 1 + levers[:, 0]
+    reach_elasticity = np.clip(rng.normal(elasticity, ELASTICITY_SD, size=shape), 0.05, 0.95)
+    reach = impressions[:, None] * spend_factor[:, None] ** reach_elasticity
+    baseline_conversions = impressions[:, None] * ctr * conversion_rate
+    scenario_conversions = (
+        reach * np.minimum(ctr * (1 + levers[:, 1])[:, None], 1.0)
+        * np.minimum(conversion_rate * (1 + levers[:, 2])[:, None], 1.0)
+    )
+    return {
+        "baseline_spend": spend,
+        "baseline_revenue": baseline_conversions * order_value,
+        "baseline_conversions": baseline_conversions,
+        "spend": spend * spend_factor,
+        "revenue": scenario_conversions * order_value,
+        "conversions": scenario_conversions,
+    }
+
+
+def _portfolio_totals_kernel(columns: Dict[str, np.ndarray],
+                             out: Dict[str, np.ndarray],
+                             start: int,
+                             draws: int,
+                             elasticity: float,
+                             seed: int) -> Dict:
+    """
+    Sums of simulate_columns() draws over a shard of campaigns. Each block of
+    SIMULATION_BLOCK campaigns has its own generator, seeded by its position,
+    so the totals are the same however the campaigns were sharded.
+    """
+    rows = len(columns["impressions"])
+    levers = np.column_stack([columns[f"{lever}_change"] for lever in SCENARIO_LEVERS])
+    totals = {"spend": 0.0, "baseline_spend": 0.0}
+    totals.update({name: np.zeros(draws) for name in ("revenue", "conversions", "baseline_revenue")})
+    for offset in range(0, rows, SIMULATION_BLOCK):
+        block = slice(offset, min(offset + SIMULATION_BLOCK, rows))
+        samples = simulate_columns(
+            columns["impressions"][block], columns["clicks"][block], columns["conversions"][block],
+            columns["spend"][block], columns["revenue"][block], levers[block], draws, elasticity,
+            np.random.default_rng([seed, (start + offset) // SIMULATION_BLOCK])
+        )
+        totals["spend"] += float(samples["spend"].sum())
+        totals["baseline_spend"] += float(samples["baseline_spend"].sum())
+        for name in ("revenue", "conversions", "baseline_revenue"):
+            totals[name] += samples[name].sum(axis=0)
+    return totals
+
+
+def _merge_totals(partials: List[Dict]) -> Dict:
+    return {name: sum(partial[name] for partial in partials) for name in partials[0]}
+
+
+def simulate_portfolio_totals(columns: Dict[str, np.ndarray],
+                              draws: int,
+                              elasticity: float,
+                              seed: int,
+                              executor: Optional[ShardedExecutor] = None) -> Dict:
+    """
+    Draws of portfolio totals: spend and baseline_spend are sums, revenue,
+    conversions and baseline_revenue (draws,) arrays. columns holds the
+    campaign totals plus a <lever>_change column per SCENARIO_LEVERS entry.
+    Large portfolios are sharded across the worker processes.
+    """
+    _, totals = (executor or default_sharded_executor()).run(
+        _portfolio_totals_kernel, columns, merge=_merge_totals,
+        min_shard_rows=max(SIMULATION_BLOCK, MIN_SHARD_DRAWS // draws),
+        draws=draws, elasticity=elasticity, seed=seed
+    )
+    return totals
+
+
+def summarize(spend: np.ndarray,
+              revenue: np.ndarray,
+              conversions: np.ndarray,
+              baseline_spend: np.ndarray,
+              baseline_revenue: np.ndarray) -> Dict:
+    """Distributions for one campaign (1-D draws) or a portfolio total"""
+    roi = np.where(spend > 0, (revenue - spend) / np.where(spend > 0, spend, 1.0) * 100, 0.0)
+    baseline_roi = np.where(
+        baseline_spend > 0, (baseline_revenue - baseline_spend) / np.where(baseline_spend > 0, baseline_spend, 1.0) * 100, 0.0
+    )
+    revenue_change = revenue - baseline_revenue
+    return {
+        "draws": int(revenue.shape[-1]),
+        "spend": float(np.mean(spend)),
+        "revenue": _distribution(revenue),
+        "roi": _distribution(roi),
+        "conversions": _distribution(conversions),
+        "revenue_change": _distribution(revenue_change),
+        "roi_change": _distribution(roi - baseline_roi),
+        "probability_revenue_increase": float((revenue_change > 0).mean()),
+        "probability_roi_increase": float((roi > baseline_roi).mean()),
+    }
+
+
+class WhatIfSimulator:
+    """
+    Simulates proposed spend/CTR/conversion-rate changes for campaigns and
+    portfolios. Results are cached per (campaign metrics, scenario, draws),
+    and each key seeds its own generator, so a cached or recomputed result is
+    identical.
+    """
+
+    def __init__(self,
+                 draws: Optional[int] = None,
+                 cache_size: int = DEFAULT_CACHE_SIZE,
+                 elasticity: float = DEFAULT_ELASTICITY):
+        self.draws = draws or int(os.getenv("WHAT_IF_DRAWS", DEFAULT_DRAWS))
+        self.cache_size = cache_size
+        self.elasticity = elasticity
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(campaigns: List[Dict], scenarios: List[Dict], draws: int, elasticity: float) -> str:
+        payload = [
+            [{field: campaign.get(field) for field in ("campaign_id", "impressions", "clicks", "conversions", "spend", "revenue")}
+             for campaign in campaigns],
+            scenarios,
+            draws,
+            round(elasticity, 6),
+        ]
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _cached(self, key: str, compute) -> Dict:
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+        result = compute()
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def simulate_campaign(self,
+                          campaign: Dict,
+                          scenario: Dict,
+                          draws: Optional[int] = None,
+                          elasticity: Optional[float] = None) -> Dict:
+        """
+        Revenue/ROI distributions for one campaign under one scenario. Pass the
+        campaign's fitted elasticity (e.g. from a BudgetPlan) to keep spend
+        scenarios consistent with the optimizer.
+        """
+        draws = draws or self.draws
+        elasticity = elasticity if elasticity is not None else self.elasticity
+        normalized = _normalize_scenario(scenario)
+        key = self._key([campaign], [normalized], draws, elasticity)
+
+        def compute():
+            samples = simulate([campaign], [normalized], draws, elasticity, seed=int(key[:8], 16))
+            result = summarize(
+                np.broadcast_to(samples["spend"][0], (draws,)),
+                samples["revenue"][0],
+                samples["conversions"][0],
+                np.broadcast_to(samples["baseline_spend"][0], (draws,)),
+                samples["baseline_revenue"][0],
+            )
+            return {"campaign_id": campaign.get("campaign_id"), "scenario": normalized, **result}
+
+        return self._cached(key, compute)
+
+    def simulate_portfolio(self, campaigns: List[Dict], scenarios: List[Dict], draws: Optional[int] = None) -> Dict:
+        """Distributions of portfolio totals with one scenario per campaign"""
+        if len(campaigns) != len(scenarios):
+            raise ValueError("Expected one scenario per campaign")
+        draws = draws or self.draws
+        normalized = [_normalize_scenario(scenario) for scenario in scenarios]
+        key = self._key(campaigns, normalized, draws, self.elasticity)
+
+        def compute():
+            columns = {
+                field: np.array([float(campaign.get(field) or 0) for campaign in campaigns])
+                for field in ("impressions", "clicks", "conversions", "spend", "revenue")
+            }
+            for lever in SCENARIO_LEVERS:
+                columns[f"{lever}_change"] = np.array([scenario[lever] for scenario in normalized])
+            totals = simulate_portfolio_totals(columns, draws, self.elasticity, seed=int(key[:8], 16))
+            result = summarize(
+                np.full(draws, totals["spend"]),
+                totals["revenue"],
+                totals["conversions"],
+                np.full(draws, totals["baseline_spend"]),
+                totals["baseline_revenue"],
+            )
+            return {"campaigns": len(campaigns), **result}
+
+        return self._cached(key, compute)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "cached": len(self._cache),
+                "hit_rate": self.hits / total if total else 0.0
+            }
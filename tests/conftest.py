@@ -0,0 +1,19 @@
+import atexit
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+# Modules that build the chat model at import time need a key; no test calls the model
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+# Importing api builds the stores, caches and indexes, which write next to their data. Point them at a
+# copy of the bundled data before anything imports app, so a test run leaves the working tree alone
+_PACKAGE_DATA = Path(__file__).parent.parent / "app" / "data"
+_data_dir = Path(tempfile.mkdtemp(prefix="campaign-tests-"))
+shutil.copytree(
+    _PACKAGE_DATA, _data_dir, dirs_exist_ok=True,
+    ignore=shutil.ignore_patterns("cache", "uploads", "index", "profiles", "conversations", "results")
+)
+os.environ["APP_DATA_DIR"] = str(_data_dir)
+atexit.register(shutil.rmtree, _data_dir, True)
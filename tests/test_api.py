@@ -0,0 +1,89 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+import api
+from app.utils.conversation_manager import MessageType
+
+
+def _system_messages(session_id):
+    return [message for message in api.conversation_manager.get_conversation_history(session_id)
+            if message.type == MessageType.SYSTEM_RESPONSE]
+
+
+def test_record_response_skips_done_and_failed_turns():
+    session_id = api.conversation_manager.create_session("api-done").session_id
+    api._record_response(session_id, {"user_input_type": "DONE"})
+    api._record_response(session_id, {"user_input_type": "RECOMMENDATION", "error": "boom"})
+    assert _system_messages(session_id) == []
+
+
+def test_record_response_tolerates_missing_fields():
+    session_id = api.conversation_manager.create_session("api-partial").session_id
+    api._record_response(session_id, {"user_input_type": "SUMMARY", "analysis": {"analysis": "ok"}})
+    [message] = _system_messages(session_id)
+    assert message.metadata["recommendations"] == []
+    assert message.metadata["campaign_data"] is None
+
+
+def test_tenant_comes_from_the_api_key(monkeypatch):
+    monkeypatch.setenv("API_KEYS", "secret1=acme,secret2")
+    assert api._tenant("secret1") == "acme"
+    assert api._tenant("secret2").startswith("key-")
+    for key in (None, "made-up"):
+        with pytest.raises(HTTPException) as error:
+            api._tenant(key)
+        assert error.value.status_code == 401
+
+
+def test_tenant_is_shared_without_api_keys(monkeypatch):
+    monkeypatch.delenv("API_KEYS", raising=False)
+    assert api._tenant("anything") is None
+    assert api._tenant(None) is None
+
+
+class _Campaigns:
+    """The parts of CampaignStore that resolving a turn's campaigns reads"""
+    default_campaign_id = "CAMPAIGN-A"
+    names = SimpleNamespace(resolve=lambda text, limit: [])
+
+    def __contains__(self, campaign_id):
+        return campaign_id in ("CAMPAIGN-A", "CAMPAIGN-B")
+
+
+def test_record_response_keeps_every_compared_campaign(monkeypatch):
+    session_id = api.conversation_manager.create_session("api-compare").session_id
+    api._record_response(session_id, {
+        "user_input_type": "SUMMARY",
+        "campaign_data": {"campaign_id": "CAMPAIGN-A"},
+        "context": {"campaign_ids": ["CAMPAIGN-A", "CAMPAIGN-B"], "conversation_history": []},
+    })
+    [message] = _system_messages(session_id)
+    assert message.metadata["context"] == {"campaign_ids": ["CAMPAIGN-A", "CAMPAIGN-B"]}
+
+    # A follow-up naming no campaign continues with both
+    handlers = api.orchestrator.agent_handlers
+    monkeypatch.setattr(handlers, "campaign_store", _Campaigns())
+    state = SimpleNamespace(
+        context={"conversation_history": api.conversation_manager.get_conversation_history(session_id)},
+        user_input="and what should I change?"
+    )
+    assert handlers._resolve_campaign_ids(state) == ["CAMPAIGN-A", "CAMPAIGN-B"]
+
+
+def test_shutdown_stops_jobs_before_saving_conversations(monkeypatch):
+    calls = []
+    monkeypatch.setattr(api, "job_queue", SimpleNamespace(start=lambda: calls.append("start jobs"),
+                                                          stop=lambda: calls.append("stop jobs")))
+    monkeypatch.setattr(api, "conversation_manager", SimpleNamespace(load=lambda: calls.append("load"),
+                                                                     save=lambda: calls.append("save")))
+    monkeypatch.setattr(api, "traffic_recorder", lambda: None)
+
+    async def serve():
+        async with api.lifespan(api.app):
+            calls.append("serving")
+
+    asyncio.run(serve())
+    assert calls == ["load", "start jobs", "serving", "stop jobs", "save"]
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from app.utils.benchmarks import PORTFOLIO_SEGMENT, PortfolioBenchmarks
+
+
+def _campaigns(count, name, seed):
+    rng = np.random.default_rng(seed)
+    campaigns = []
+    for i in range(count):
+        impressions = int(rng.integers(5_000, 50_000))
+        clicks = int(impressions * rng.lognormal(-4, 0.5))
+        campaigns.append({
+            "campaign_id": f"{name}-{i}",
+            "name": f"{name} {i}",
+            "impressions": impressions,
+            "clicks": clicks,
+            "conversions": int(clicks * rng.uniform(0.01, 0.1)),
+            "spend": float(clicks * rng.lognormal(0, 0.6)),
+            "revenue": float(clicks * rng.lognormal(0.5, 0.8)),
+        })
+    return campaigns
+
+
+@pytest.fixture(scope="module")
+def portfolio():
+    return _campaigns(300, "Running shoes", 1) + _campaigns(200, "Credit card", 2) + _campaigns(5, "Dog food", 3)
+
+
+def test_percentiles_match_the_portfolio(portfolio):
+    benchmarks = PortfolioBenchmarks(min_samples=20)
+    benchmarks.rebuild(portfolio)
+    ctr = np.array([c["clicks"] / c["impressions"] * 100 for c in portfolio])
+    for q in (10, 25, 50, 75, 90):
+        value = float(np.percentile(ctr, q))
+        assert benchmarks.percentile("ctr", value) == pytest.approx(q, abs=1.0)
+    assert benchmarks.segment_sizes() == {
+        "fashion": 300, "fintech": 200, "food & beverage": 5, PORTFOLIO_SEGMENT: 505,
+    }
+
+
+def test_incremental_adds_match_a_rebuild(portfolio):
+    rebuilt = PortfolioBenchmarks(min_samples=20)
+    rebuilt.rebuild(portfolio)
+    incremental = PortfolioBenchmarks(min_samples=20)
+    for start in range(0, len(portfolio), 50):
+        incremental.add_many(portfolio[start:start + 50])
+    for campaign in portfolio[::50]:
+        expected = rebuilt.compare(campaign)
+        actual = incremental.compare(campaign)
+        assert actual.keys() == expected.keys()
+        for metric, comparison in expected.items():
+            assert actual[metric]["segment"] == comparison["segment"]
+            assert actual[metric]["percentile"] == pytest.approx(comparison["percentile"], abs=1.0)
+            assert actual[metric]["median"] == pytest.approx(comparison["median"], rel=0.02)
+
+
+def test_small_verticals_fall_back_to_the_portfolio(portfolio):
+    benchmarks = PortfolioBenchmarks(min_samples=20, adverse_percentile=25)
+    benchmarks.rebuild(portfolio)
+    shoes = benchmarks.compare(portfolio[0])
+    assert {c["segment"] for c in shoes.values()} == {"fashion"}
+    dog_food = benchmarks.compare(portfolio[-1])
+    assert {c["segment"] for c in dog_food.values()} == {PORTFOLIO_SEGMENT}
+    assert dog_food["ctr"]["sample_size"] == len(portfolio)
+    assert benchmarks.percentile("ctr", 1.0, segment="digital marketing") is None
+
+    # Low CTR is adverse, high cost per click is adverse
+    worst = dict(portfolio[0], clicks=1, spend=1_000.0)
+    comparison = benchmarks.compare(worst)
+    assert comparison["ctr"]["adverse"] and comparison["cost_per_click"]["adverse"]
+    assert comparison["ctr"]["p25"] <= comparison["ctr"]["median"] <= comparison["ctr"]["p75"]
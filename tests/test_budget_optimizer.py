@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from app.utils.budget_optimizer import BudgetOptimizer, calibrate_scale, fit_elasticities, optimize_allocation
+from app.utils.campaign_store import CampaignStore
+
+
+def _value(x, scale, elasticity, objective):
+    revenue = float(np.sum(np.where(scale > 0, scale * np.power(x, elasticity), 0.0)))
+    # "roi" stops buying revenue below $1 per $1, i.e. it maximizes profit
+    return revenue - float(x.sum()) if objective == "roi" else revenue
+
+
+def _brute_force(scale, elasticity, budget, lower, upper, objective, steps=200):
+    grids = [np.linspace(lo, hi, steps) if hi > lo else np.array([lo]) for lo, hi in zip(lower, upper)]
+    points = np.stack([axis.ravel() for axis in np.meshgrid(*grids, indexing="ij")], axis=1)
+    points = points[points.sum(axis=1) <= budget * (1 + 1e-9)]
+    revenue = np.where(scale > 0, scale * np.power(points, elasticity), 0.0).sum(axis=1)
+    if objective == "roi":
+        revenue = revenue - points.sum(axis=1)
+    return float(revenue.max())
+
+
+PORTFOLIOS = [
+    # scale, elasticity, lower, upper, budget
+    ([30.0, 12.0], [0.6, 0.8], [10.0, 10.0], [400.0, 400.0], 300.0),
+    ([50.0, 5.0, 20.0], [0.5, 0.9, 0.7], [0.0, 0.0, 0.0], [200.0, 200.0, 200.0], 250.0),
+    ([8.0, 8.0, 8.0], [0.3, 0.6, 0.9], [5.0, 5.0, 5.0], [60.0, 90.0, 30.0], 100.0),
+    ([3.0, 40.0], [0.95, 0.2], [50.0, 1.0], [500.0, 50.0], 400.0),
+]
+
+
+@pytest.mark.parametrize("objective", ["revenue", "roi"])
+@pytest.mark.parametrize("scale, elasticity, lower, upper, budget", PORTFOLIOS)
+def test_allocation_matches_brute_force(scale, elasticity, lower, upper, budget, objective):
+    scale, elasticity, lower, upper = map(np.array, (scale, elasticity, lower, upper))
+    x = optimize_allocation(scale, elasticity, budget, lower, upper, objective)
+    assert x.sum() <= budget * (1 + 1e-6)
+    assert np.all(x >= lower - 1e-9) and np.all(x <= upper + 1e-9)
+    steps = 400 if len(scale) == 2 else 100
+    best = _brute_force(scale, elasticity, budget, lower, upper, objective, steps)
+    # The grid only approximates the optimum, so the allocation must do at least as well, give or take
+    assert _value(x, scale, elasticity, objective) >= best - abs(best) * 1e-3
+
+
+def test_revenue_objective_spends_the_whole_budget():
+    scale, elasticity = np.array([30.0, 12.0]), np.array([0.6, 0.8])
+    x = optimize_allocation(scale, elasticity, 300.0, np.zeros(2), np.full(2, 1000.0))
+    assert x.sum() == pytest.approx(300.0, rel=1e-6)
+    # Equal marginal revenue at an interior optimum
+    marginal = scale * elasticity * x ** (elasticity - 1)
+    assert marginal[0] == pytest.approx(marginal[1], rel=1e-4)
+
+
+def test_roi_objective_stops_at_a_dollar_of_marginal_return():
+    scale, elasticity = np.array([30.0, 12.0]), np.array([0.6, 0.8])
+    x = optimize_allocation(scale, elasticity, 1e9, np.zeros(2), np.full(2, 1e9), "roi")
+    assert x.sum() < 1e9
+    assert scale * elasticity * x ** (elasticity - 1) == pytest.approx([1.0, 1.0], rel=1e-4)
+
+
+def test_budget_above_every_cap_fills_the_caps():
+    scale, elasticity = np.array([30.0, 12.0, 7.0]), np.array([0.6, 0.8, 0.5])
+    upper = np.array([50.0, 80.0, 20.0])
+    for objective in ("revenue", "roi"):
+        x = optimize_allocation(scale, elasticity, 10_000.0, np.zeros(3), upper, objective)
+        assert x[0] == pytest.approx(upper[0])
+        assert np.all(x <= upper + 1e-9)
+    assert optimize_allocation(scale, elasticity, 10_000.0, np.zeros(3), upper) == pytest.approx(upper)
+
+
+def test_campaigns_without_a_curve_hold_their_minimum():
+    scale, elasticity = np.array([0.0, 12.0]), np.array([0.7, 0.7])
+    lower, upper = np.array([40.0, 0.0]), np.array([40.0, 500.0])
+    x = optimize_allocation(scale, elasticity, 200.0, lower, upper)
+    assert x == pytest.approx([40.0, 160.0])
+    # Nothing to optimize at all
+    assert optimize_allocation(np.zeros(2), elasticity, 200.0, lower, upper) == pytest.approx(lower)
+
+
+def test_invalid_budgets_and_objectives_are_rejected():
+    scale, elasticity = np.array([30.0, 12.0]), np.array([0.6, 0.8])
+    with pytest.raises(ValueError, match="below the sum"):
+        optimize_allocation(scale, elasticity, 10.0, np.array([20.0, 20.0]), np.array([50.0, 50.0]))
+    with pytest.raises(ValueError, match="objective"):
+        optimize_allocation(scale, elasticity, 100.0, np.zeros(2), np.full(2, 50.0), "clicks")
+
+
+def test_zero_spend_has_no_curve():
+    spend, revenue = np.array([0.0, 100.0, 50.0]), np.array([80.0, 0.0, 100.0])
+    scale = calibrate_scale(spend, revenue, np.full(3, 0.7))
+    assert scale[:2] == pytest.approx([0.0, 0.0])
+    assert scale[2] * 50.0 ** 0.7 == pytest.approx(100.0)
+
+
+def test_elasticity_is_recovered_from_daily_history():
+    rng = np.random.default_rng(3)
+    spend = rng.uniform(50, 500, size=(6, 60))
+    revenue = 4.0 * spend ** 0.6 * rng.lognormal(0, 0.01, size=spend.shape)
+    elasticity = fit_elasticities(spend, revenue)
+    # Shrunk towards the portfolio median, which is the same curve here
+    assert elasticity == pytest.approx(np.full(6, 0.6), abs=0.02)
+    # Without history, the default prior
+    assert fit_elasticities(np.full((1, 3), np.nan), np.full((1, 3), np.nan)) == pytest.approx([0.7])
+
+
+def test_plan_keeps_spend_moves_within_max_change(tmp_path):
+    store = CampaignStore(data_dir=tmp_path)
+    store.append_many([
+        {"campaign_id": "strong", "name": "Strong", "impressions": 1000, "clicks": 10, "conversions": 1,
+         "spend": 100.0, "revenue": 600.0},
+        {"campaign_id": "weak", "name": "Weak", "impressions": 1000, "clicks": 10, "conversions": 1,
+         "spend": 100.0, "revenue": 120.0},
+        {"campaign_id": "idle", "name": "Idle", "impressions": 0, "clicks": 0, "conversions": 0,
+         "spend": 0.0, "revenue": 0.0},
+    ])
+    plan = BudgetOptimizer(store, max_change=0.5, ttl_seconds=0).plan()
+    strong, weak, idle = (plan.allocation_for(campaign_id) for campaign_id in ("strong", "weak", "idle"))
+    assert strong["recommended_spend"] == pytest.approx(150.0)
+    assert weak["recommended_spend"] == pytest.approx(50.0)
+    assert idle["recommended_spend"] == 0.0
+    assert plan.totals()["recommended_spend"] == pytest.approx(200.0)
@@ -0,0 +1,74 @@
+import copy
+import json
+import pickle
+
+import orjson
+import pytest
+
+from app.utils.campaign_record import CampaignRecord, FrozenDict, InvalidCampaignError
+
+
+def _campaign(**fields):
+    return {"campaign_id": "c1", "name": "Spring", "impressions": "1,000", "clicks": 50, "conversions": 5,
+            "spend": 100, "revenue": 250, **fields}
+
+
+def test_metric_fields_are_validated_and_typed():
+    record = CampaignRecord.from_dict(_campaign())
+    assert record.impressions == 1000 and record.spend == 100.0
+    assert record.ctr == pytest.approx(5.0) and record.roi == pytest.approx(150.0)
+    with pytest.raises(InvalidCampaignError) as error:
+        CampaignRecord.from_dict(_campaign(clicks=-1, spend="abc"))
+    assert set(error.value.errors) == {"clicks", "spend"}
+
+
+def test_nested_values_are_frozen():
+    trends = {"week_over_week": {"ctr": -0.2}, "days": [{"clicks": 3}]}
+    keywords = ["running", "shoes"]
+    record = CampaignRecord.from_dict(_campaign(trends=trends, keywords=keywords))
+    # The caller's objects are copied, not shared
+    trends["week_over_week"]["ctr"] = 0.5
+    keywords.append("sale")
+    assert record["trends"]["week_over_week"]["ctr"] == -0.2
+    assert record["keywords"] == ("running", "shoes")
+
+    with pytest.raises(TypeError):
+        record["trends"]["week_over_week"]["ctr"] = 0.0
+    with pytest.raises(TypeError):
+        record["trends"].update(as_of="2024-01-01")
+    with pytest.raises(AttributeError):
+        record["trends"]["days"].append({})
+    with pytest.raises(TypeError):
+        record["trends"]["days"][0]["clicks"] = 4
+    with pytest.raises(AttributeError):
+        record.spend = 0.0
+    # A copy is an ordinary dict again
+    editable = dict(record["trends"])
+    editable["as_of"] = "2024-01-01"
+    assert "as_of" not in record["trends"]
+
+
+def test_with_fields_freezes_updates_and_shares_the_rest():
+    record = CampaignRecord.from_dict(_campaign(benchmarks={"ctr": {"percentile": 40.0}}))
+    market_context = {"trends": "growing"}
+    enriched = record.with_fields(market_context=market_context, verticals=[{"vertical": "fashion"}])
+    market_context["background"] = "added later"
+    assert dict(enriched["market_context"]) == {"trends": "growing"}
+    assert isinstance(enriched["market_context"], FrozenDict)
+    assert enriched["verticals"][0]["vertical"] == "fashion"
+    assert enriched["benchmarks"] is record["benchmarks"]
+    assert "market_context" not in record
+
+
+def test_frozen_records_serialize_like_dicts():
+    record = CampaignRecord.from_dict(_campaign(trends={"days": [{"clicks": 3}]}, keywords=["shoes"]))
+    expected = {**_campaign(), "impressions": 1000, "spend": 100.0, "revenue": 250.0,
+                "trends": {"days": [{"clicks": 3}]}, "keywords": ["shoes"]}
+    assert json.loads(json.dumps(record.to_dict())) == expected
+    assert orjson.loads(orjson.dumps(record.to_dict())) == expected
+    assert isinstance(record["trends"], dict)
+
+    restored = pickle.loads(pickle.dumps(record))
+    assert restored.to_dict() == record.to_dict()
+    assert isinstance(restored["trends"], FrozenDict)
+    assert copy.deepcopy(record) is record and copy.deepcopy(record["trends"]) is record["trends"]
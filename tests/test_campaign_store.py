@@ -0,0 +1,128 @@
+import io
+import sys
+import threading
+
+from app.services.campaign_ingest import CampaignIngestor
+from app.utils.benchmarks import PORTFOLIO_SEGMENT
+from app.utils.campaign_store import CampaignStore
+
+
+def _csv(rows):
+    lines = ["campaign_id,name,impressions,clicks,conversions,spend,revenue"]
+    lines += [f"{campaign_id},Campaign {campaign_id},1000,{clicks},5,50,120" for campaign_id, clicks in rows]
+    return io.BytesIO(("\n".join(lines) + "\n").encode())
+
+
+def _count_saves(store):
+    saves = []
+    save = store.similar_campaigns.save
+    store.similar_campaigns.save = lambda *args, **kwargs: (saves.append(1), save(*args, **kwargs))
+    return saves
+
+
+def test_ingest_saves_similar_index_once(tmp_path):
+    store = CampaignStore(data_dir=tmp_path)
+    saves = _count_saves(store)
+    report = CampaignIngestor(store, batch_size=2).ingest(_csv([(f"c{i}", 10) for i in range(7)]), "upload.csv")
+    assert report["rows_ingested"] == 7
+    assert len(saves) == 1
+    assert len(store.similar_campaigns) == 7
+
+
+def test_append_outside_bulk_saves_index(tmp_path):
+    store = CampaignStore(data_dir=tmp_path)
+    saves = _count_saves(store)
+    store.append_many([{"campaign_id": "c1", "impressions": 1000, "clicks": 10, "conversions": 1,
+                        "spend": 5.0, "revenue": 9.0}])
+    assert len(saves) == 1
+
+
+def _count_rebuilds(store):
+    rebuilds = []
+    rebuild = store.benchmarks.rebuild
+    store.benchmarks.rebuild = lambda campaigns: (rebuilds.append(1), rebuild(campaigns))
+    return rebuilds
+
+
+def test_reupload_rebuilds_benchmarks_once(tmp_path):
+    store = CampaignStore(data_dir=tmp_path)
+    CampaignIngestor(store, batch_size=2).ingest(_csv([(f"c{i}", 10) for i in range(6)]), "first.csv")
+    rebuilds = _count_rebuilds(store)
+    CampaignIngestor(store, batch_size=2).ingest(_csv([(f"c{i}", 20) for i in range(6)]), "again.csv")
+    assert len(rebuilds) == 1
+    assert store.benchmarks.segment_sizes()[PORTFOLIO_SEGMENT] == 6
+    assert store.get("c3")["clicks"] == 20
+
+
+def test_concurrent_appends_keep_indexes_consistent(tmp_path):
+    store = CampaignStore(data_dir=tmp_path)
+
+    def upload(spend):
+        for start in range(0, 40, 4):
+            store.append_many([
+                {"campaign_id": f"c{i}", "name": f"Campaign {i}", "impressions": 1000, "clicks": 10,
+                 "conversions": 1, "spend": spend, "revenue": 9.0}
+                for i in range(start, start + 4)
+            ])
+
+    threads = [threading.Thread(target=upload, args=(spend,)) for spend in (5.0, 7.0)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.benchmarks.segment_sizes()[PORTFOLIO_SEGMENT] == 40
+    assert len(store.similar_campaigns) == 40
+    # The similar-campaign index holds the version the log ends with
+    index = store.similar_campaigns
+    for i in range(40):
+        assert index._peers[index._rows[f"c{i}"]]["spend"] == store.get(f"c{i}")["spend"]
+
+
+def _record(campaign_id, clicks=10):
+    return {"campaign_id": campaign_id, "impressions": 1000, "clicks": clicks, "conversions": 1,
+            "spend": 5.0, "revenue": 9.0}
+
+
+def test_readers_never_see_a_partly_written_batch(tmp_path):
+    store = CampaignStore(data_dir=tmp_path)
+    store.similar_campaigns.save = lambda *args, **kwargs: None
+    writing = [0]
+    done = threading.Event()
+    errors = []
+
+    def read():
+        # Ask for the records of the batch being written, as soon as the store knows them
+        while not done.is_set():
+            batch = writing[0]
+            for i in range(0, 3000, 7):
+                campaign_id = f"b{batch}-{i}"
+                if campaign_id in store:
+                    try:
+                        assert store.get(campaign_id)["campaign_id"] == campaign_id
+                    except Exception as e:
+                        errors.append(e)
+
+    reader = threading.Thread(target=read)
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        reader.start()
+        for batch in range(5):
+            writing[0] = batch
+            store.append_many([_record(f"b{batch}-{i}") for i in range(3000)])
+    finally:
+        done.set()
+        reader.join()
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+
+
+def test_iteration_stops_at_the_log_published_when_it_started(tmp_path):
+    store = CampaignStore(data_dir=tmp_path)
+    store.append_many([_record(f"c{i}") for i in range(3)])
+    campaigns = store.iter_campaigns()
+    first = next(campaigns)
+    store.append_many([_record("c0", clicks=99), _record("c9")])
+    seen = [first] + list(campaigns)
+    assert sorted(record["campaign_id"] for record in seen) == ["c0", "c1", "c2"]
+    assert all(record["clicks"] == 10 for record in seen)
@@ -0,0 +1,98 @@
+import math
+import random
+import threading
+
+import pytest
+
+from app.utils.conversation_index import ConversationIndex
+from app.utils.knowledge_index import BM25_B, BM25_K1, tokenize
+
+WORDS = [f"term{i}" for i in range(300)] + ["campaign", "budget", "cpc"]
+
+
+def _messages(count, seed=7):
+    rng = random.Random(seed)
+    messages = []
+    for n in range(count):
+        words = rng.choices(WORDS[:300], k=rng.randint(3, 15)) + rng.sample(["campaign", "budget", "cpc"], 2)
+        if n % 40 == 0:
+            words.append("fintech")
+        messages.append(" ".join(words))
+    return messages
+
+
+def _brute_force(messages, query, k):
+    docs = [tokenize(message) for message in messages]
+    average_length = sum(map(len, docs)) / len(docs)
+    scores = []
+    for doc, tokens in enumerate(docs):
+        score = 0.0
+        for term in set(tokenize(query)):
+            tf = tokens.count(term)
+            if not tf:
+                continue
+            df = sum(1 for other in docs if term in other)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / average_length))
+        if score:
+            scores.append(score)
+    return sorted(scores, reverse=True)[:k]
+
+
+@pytest.mark.parametrize("query", ["cpc fintech campaign", "term3 term7", "campaign budget cpc", "term250"])
+def test_pruned_search_matches_exhaustive_bm25(query):
+    messages = _messages(2000)
+    index = ConversationIndex()
+    for n, message in enumerate(messages):
+        index.add(f"s{n // 10}", n % 10, "USER_INPUT", message)
+    hits = index.search(query, k=10)
+    assert [round(hit["score"], 6) for hit in hits] == [round(score, 6) for score in _brute_force(messages, query, 10)]
+
+
+def test_search_skips_removed_and_filtered_messages():
+    index = ConversationIndex()
+    index.add("s1", 0, "USER_INPUT", "fintech cpc question")
+    index.add("s2", 0, "USER_INPUT", "fintech cpc question")
+    index.add("s2", 1, "SYSTEM_RESPONSE", "fintech cpc answer")
+    index.remove_session("s1")
+    assert {(hit["session_id"], hit["position"]) for hit in index.search("fintech cpc")} == {("s2", 0), ("s2", 1)}
+    assert [hit["type"] for hit in index.search("fintech cpc", msg_type="SYSTEM_RESPONSE")] == ["SYSTEM_RESPONSE"]
+    assert index.search("fintech", session_id="s1") == []
+
+
+def test_search_while_messages_are_added():
+    index = ConversationIndex()
+    messages = _messages(3000)
+    done = threading.Event()
+    errors = []
+
+    def search():
+        while not done.is_set():
+            try:
+                for hit in index.search("cpc fintech campaign", k=5):
+                    assert hit["score"] > 0
+            except Exception as e:
+                errors.append(e)
+
+    searcher = threading.Thread(target=search)
+    searcher.start()
+    try:
+        for n, message in enumerate(messages):
+            index.add(f"s{n // 10}", n % 10, "USER_INPUT", message)
+    finally:
+        done.set()
+        searcher.join()
+    assert errors == []
+    assert len(index.search("fintech", k=1000)) == 75
+
+
+def test_saved_index_searches_the_same(tmp_path):
+    index = ConversationIndex()
+    for n, message in enumerate(_messages(500)):
+        index.add(f"s{n // 10}", n % 10, "USER_INPUT", message)
+    index.remove_session("s3")
+    index.save(tmp_path / "index")
+    loaded = ConversationIndex.load(tmp_path / "index")
+    for query in ("cpc fintech campaign", "term3 term7"):
+        assert ([round(hit["score"], 6) for hit in loaded.search(query)]
+                == [round(hit["score"], 6) for hit in index.search(query)])
@@ -0,0 +1,83 @@
+import threading
+
+from app.utils.conversation_manager import ConversationManager, MessageType
+
+
+def test_recreated_session_drops_old_postings(tmp_path):
+    manager = ConversationManager(store_dir=tmp_path)
+    manager.create_session("s1")
+    manager.add_message("s1", "what is my cpc this week", MessageType.USER_INPUT)
+
+    manager.create_session("s1")
+    manager.add_message("s1", "show me the campaign summary", MessageType.USER_INPUT)
+
+    assert manager.search("cpc") == []
+    hits = manager.search("summary")
+    assert [hit["snippet"] for hit in hits] == ["show me the campaign summary"]
+
+
+def test_concurrent_messages_keep_positions(tmp_path):
+    manager = ConversationManager(store_dir=tmp_path)
+    manager.create_session("s1")
+    barrier = threading.Barrier(8)
+
+    def turn(n):
+        barrier.wait()
+        for i in range(25):
+            manager.add_message("s1", f"token{n}x{i} question", MessageType.USER_INPUT)
+
+    threads = [threading.Thread(target=turn, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    messages = manager.get_conversation_history("s1")
+    assert len(messages) == 200
+    for n in range(8):
+        for i in range(0, 25, 6):
+            [hit] = manager.search(f"token{n}x{i}", session_id="s1")
+            assert messages[hit["position"]].content == f"token{n}x{i} question"
+
+
+def test_save_matches_index_to_messages_under_concurrent_turns(tmp_path):
+    manager = ConversationManager(store_dir=tmp_path / "conversations")
+    manager.create_session("s1")
+    done = threading.Event()
+
+    def turns():
+        n = 0
+        while not done.is_set():
+            message = manager.add_message("s1", f"word{n} question", MessageType.USER_INPUT)
+            if n % 3 == 0:
+                manager.remove_message("s1", message)
+            n += 1
+
+    writer = threading.Thread(target=turns)
+    writer.start()
+    try:
+        for _ in range(5):
+            manager.save()
+    finally:
+        done.set()
+        writer.join()
+
+    restored = ConversationManager(store_dir=tmp_path / "conversations")
+    restored.load()
+    messages = restored.get_conversation_history("s1")
+    for position, message in enumerate(messages):
+        word = message.content.split()[0]
+        assert [hit["position"] for hit in restored.search(word, session_id="s1")] == [position]
+
+
+def test_load_recovers_a_save_interrupted_mid_swap(tmp_path):
+    store_dir = tmp_path / "conversations"
+    manager = ConversationManager(store_dir=store_dir)
+    manager.add_message("s1", "what is my cpc", MessageType.USER_INPUT)
+    manager.save()
+    # As if the process died after moving the previous save aside
+    store_dir.rename(tmp_path / "conversations.old")
+
+    restored = ConversationManager(store_dir=store_dir)
+    assert restored.load() == 1
+    assert restored.search("cpc")[0]["snippet"] == "what is my cpc"
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.deadline import Deadline, DeadlineExceeded, call_with_deadline, deadline_scope, on_abandoned
+from app.utils.llm_scheduler import LLMScheduler, ScheduledLLM
+
+
+class SlowLLM:
+    model = "slow"
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.kwargs = None
+        self.finished = threading.Event()
+
+    def invoke(self, messages, **kwargs):
+        self.kwargs = kwargs
+        time.sleep(self.seconds)
+        self.finished.set()
+        return "late"
+
+
+def test_abandoned_call_runs_on_daemon_thread():
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(1)
+
+    with deadline_scope(Deadline(0.05)), pytest.raises(DeadlineExceeded):
+        call_with_deadline(slow)
+    assert started.wait(1)
+    threads = [thread for thread in threading.enumerate() if thread.name == "deadline-call"]
+    assert threads and all(thread.daemon for thread in threads)
+
+
+def test_on_abandoned_runs_when_caller_gives_up():
+    abandoned = threading.Event()
+
+    def slow():
+        with on_abandoned(abandoned.set):
+            time.sleep(0.5)
+
+    with deadline_scope(Deadline(0.05)), pytest.raises(DeadlineExceeded):
+        call_with_deadline(slow)
+    assert abandoned.wait(0.2)
+
+
+def test_on_abandoned_not_run_for_finished_call():
+    abandoned = threading.Event()
+
+    def quick():
+        with on_abandoned(abandoned.set):
+            return 42
+
+    with deadline_scope(Deadline(1)):
+        assert call_with_deadline(quick) == 42
+    assert not abandoned.is_set()
+
+
+def test_abandoned_llm_call_returns_its_slot(monkeypatch):
+    monkeypatch.setenv("LLM_MIN_SECONDS", "0")
+    scheduler = LLMScheduler(max_concurrent=1, interactive_reserved=0)
+    llm = SlowLLM(0.5)
+    scheduled = ScheduledLLM(llm, scheduler)
+
+    with deadline_scope(Deadline(0.1)), pytest.raises(DeadlineExceeded):
+        scheduled.invoke("hello")
+    assert scheduler.stats()["in_flight"] == 0
+    # The late answer does not release the slot a second time
+    assert llm.finished.wait(1)
+    time.sleep(0.05)
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_llm_call_gets_remaining_deadline_as_timeout(monkeypatch):
+    monkeypatch.setenv("LLM_MIN_SECONDS", "0")
+    llm = SlowLLM(0)
+    with deadline_scope(Deadline(5)):
+        ScheduledLLM(llm, LLMScheduler()).invoke("hello")
+    assert 0 < llm.kwargs["timeout"] <= 5
+    assert llm.kwargs["max_retries"] == 1
+
+
+def test_llm_call_without_deadline_keeps_client_defaults():
+    llm = SlowLLM(0)
+    ScheduledLLM(llm, LLMScheduler()).invoke("hello")
+    assert "timeout" not in llm.kwargs
@@ -0,0 +1,58 @@
+import threading
+
+from app.orchestrator.orchestrator import WorkflowCancelled
+from app.services.job_queue import JobQueue, JobStatus
+
+
+class FakeOrchestrator:
+    def __init__(self, result=None):
+        self.result = result if result is not None else {"user_input_type": "RECOMMENDATION"}
+        self.runs = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def run_with_progress(self, user_input, progress, **kwargs):
+        self.runs += 1
+        self.started.set()
+        self.release.wait(5)
+        if progress("task", "gather_data") is False:
+            raise WorkflowCancelled("cancelled")
+        return self.result
+
+
+def test_cancelled_queued_job_never_runs():
+    orchestrator = FakeOrchestrator()
+    jobs = JobQueue(orchestrator, workers=1)
+    job = jobs.submit("s1", "hello", {})
+    assert jobs.cancel("s1")
+    jobs.start()
+    jobs.stop()
+    assert job.status == JobStatus.CANCELLED
+    assert orchestrator.runs == 0
+
+
+def test_cancelling_running_job_stops_it_at_next_node():
+    orchestrator = FakeOrchestrator()
+    jobs = JobQueue(orchestrator, workers=1)
+    jobs.start()
+    job = jobs.submit("s1", "hello", {})
+    assert orchestrator.started.wait(5)
+    assert jobs.cancel("s1")
+    # Still running until it reaches a node boundary, not cancelled under the worker
+    assert job.status == JobStatus.PROCESSING
+    orchestrator.release.set()
+    jobs.stop()
+    assert job.status == JobStatus.CANCELLED
+    assert orchestrator.runs == 1
+
+
+def test_completed_job_reports_result():
+    orchestrator = FakeOrchestrator({"user_input_type": "DONE"})
+    orchestrator.release.set()
+    completed = []
+    jobs = JobQueue(orchestrator, on_complete=completed.append, workers=1)
+    jobs.start()
+    job = jobs.submit("s1", "thanks", {})
+    jobs.stop()
+    assert job.status == JobStatus.COMPLETED
+    assert completed == [job]
@@ -0,0 +1,89 @@
+import json
+import math
+import random
+
+import pytest
+
+from app.utils import knowledge_index
+from app.utils.knowledge_index import BM25_B, BM25_K1, KnowledgeIndex, build_index, tokenize
+
+WORDS = [f"term{i}" for i in range(200)] + ["fintech", "fashion", "insurance"]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    rng = random.Random(3)
+    corpus_dir = tmp_path / "knowledge"
+    corpus_dir.mkdir()
+    for n in range(6):
+        paragraphs = [" ".join(rng.choices(WORDS, k=rng.randint(5, 40))) for _ in range(20)]
+        (corpus_dir / f"doc_{n}.md").write_text(f"# Topic {n}\n\n" + "\n\n".join(paragraphs))
+    (corpus_dir / "notes.txt").write_text("fintech " + "x" * 60)
+    return corpus_dir
+
+
+def _brute_force(index, query, k):
+    passages = [index.passage(i) for i in range(index.passage_count)]
+    docs = [tokenize(f"{p['title']} {p['text']}") for p in passages]
+    average_length = sum(map(len, docs)) / len(docs)
+    scores = []
+    for passage_id, tokens in enumerate(docs):
+        score = 0.0
+        for term in set(tokenize(query)):
+            tf = tokens.count(term)
+            if not tf:
+                continue
+            df = sum(1 for other in docs if term in other)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / average_length))
+        if score:
+            scores.append((-score, passage_id))
+    return [(passage_id, -score) for score, passage_id in sorted(scores)[:k]]
+
+
+@pytest.mark.parametrize("query", ["fintech fashion", "term3 term7 term150", "Topic insurance", "term42"])
+def test_search_matches_exhaustive_bm25(corpus, tmp_path, query):
+    build_index(corpus, tmp_path / "index")
+    index = KnowledgeIndex(tmp_path / "index")
+    hits = index.search(query, k=5)
+    expected = _brute_force(index, query, 5)
+    assert [hit["id"] for hit in hits] == [passage_id for passage_id, _ in expected]
+    assert [hit["score"] for hit in hits] == pytest.approx([score for _, score in expected])
+
+
+def test_term_table_lookups(corpus, tmp_path):
+    stats = build_index(corpus, tmp_path / "index")
+    index = KnowledgeIndex(tmp_path / "index")
+    assert index.term_count == stats["terms"]
+    assert list(index._terms) == sorted(index._terms)
+    docs, freqs = index.term_postings("fintech")
+    assert len(docs) == len(freqs) > 0
+    assert all("fintech" in tokenize(index.passage(int(i))["text"]) for i in docs)
+    # Missing terms, and ones longer than any indexed term, match nothing
+    assert index.term_postings("term999") is None
+    assert index.term_postings("x" * 200) is None
+    assert index.term_postings("x" * 60) is not None
+    assert index.search("zzz the and") == []
+    # The vocabulary no longer rides along in the meta file
+    assert "vocabulary" not in json.loads((tmp_path / "index" / "meta.json").read_text())
+
+
+def test_stale_index_formats_are_rebuilt(corpus, tmp_path, monkeypatch):
+    index_dir = tmp_path / "index"
+    build_index(corpus, index_dir)
+    meta_path = index_dir / "meta.json"
+    meta = json.loads(meta_path.read_text())
+    meta_path.write_text(json.dumps({k: v for k, v in meta.items() if k != "format"}))
+    with pytest.raises(ValueError, match="older format"):
+        KnowledgeIndex(index_dir)
+
+    # The corpus is unchanged, so only the format can trigger the rebuild
+    monkeypatch.setattr(knowledge_index, "INDEX_DIR", index_dir)
+    monkeypatch.setattr(knowledge_index, "corpus_signature", lambda *args: meta["corpus_signature"])
+    monkeypatch.setattr(knowledge_index, "build_index", lambda: build_index(corpus, index_dir))
+    knowledge_index.default_knowledge_index.cache_clear()
+    try:
+        index = knowledge_index.default_knowledge_index()
+    finally:
+        knowledge_index.default_knowledge_index.cache_clear()
+    assert index is not None and index.search("fintech")
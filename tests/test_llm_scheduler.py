@@ -0,0 +1,26 @@
+from app.utils.llm_scheduler import LLMScheduler, Priority
+
+
+def _scheduler(**kwargs):
+    return LLMScheduler(max_concurrent=4, tenant_max_concurrent=2, interactive_reserved=1,
+                        tenant_weights={}, queue_timeout_seconds=1.0, **kwargs)
+
+
+def test_idle_tenants_are_evicted():
+    scheduler = _scheduler(tenant_tokens_per_minute=0, tenant_idle_seconds=0)
+    for n in range(50):
+        with scheduler.slot(100, tenant=f"t{n}", priority=Priority.INTERACTIVE):
+            pass
+    assert len(scheduler._tenants) <= 1
+
+
+def test_busy_and_rate_limited_tenants_are_kept():
+    scheduler = _scheduler(tenant_tokens_per_minute=1000, tenant_idle_seconds=0)
+    with scheduler.slot(100, tenant="spent", priority=Priority.INTERACTIVE):
+        pass
+    with scheduler.slot(100, tenant="busy", priority=Priority.INTERACTIVE):
+        with scheduler.slot(100, tenant="other", priority=Priority.INTERACTIVE):
+            pass
+        # Still holding a slot, and "spent" has not refilled its bucket
+        assert {"busy", "spent"} <= set(scheduler._tenants)
+    assert "spent" in scheduler._tenants
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+from fastapi import HTTPException
+
+import api
+from app.utils.profiling import RequestProfile, flush_profiles, profile_scope, prune_profiles
+
+
+def test_profile_is_written_in_background(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    with profile_scope(RequestProfile({"stacks"})) as profile:
+        with profile.node("gather_data"):
+            sum(range(1000))
+    assert profile.path == os.path.join(str(tmp_path), profile.profile_id)
+    flush_profiles()
+    with open(os.path.join(profile.path, "summary.json")) as f:
+        summary = json.load(f)
+    assert summary["nodes"]["gather_data"]["calls"] == 1
+    assert "process_memory_net_bytes" in summary["nodes"]["gather_data"]
+
+
+def test_memory_profile_is_labelled_process_wide(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    with profile_scope(RequestProfile({"memory"})) as profile:
+        with profile.node("analyze_data"):
+            _ = [bytearray(4096) for _ in range(10)]
+    flush_profiles()
+    with open(os.path.join(profile.path, "summary.json")) as f:
+        assert "process-wide" in json.load(f)["memory_note"]
+
+
+def test_old_profiles_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_MAX_PROFILES", "3")
+    (tmp_path / "notes").mkdir()
+    profiles = []
+    for _ in range(5):
+        with profile_scope(RequestProfile({"stacks"})) as profile:
+            profiles.append(profile)
+        flush_profiles()
+    kept = sorted(name for name in os.listdir(tmp_path) if name != "notes")
+    assert kept == sorted(profile.profile_id for profile in profiles)[-3:]
+    # Anything that is not a profile is left alone
+    assert (tmp_path / "notes").exists()
+    prune_profiles(str(tmp_path / "missing"), 1)
+
+
+def test_profile_header_is_refused_unless_enabled(monkeypatch):
+    monkeypatch.delenv("PROFILE_HEADER_ENABLED", raising=False)
+    assert api._profile_modes(None) == frozenset()
+    with pytest.raises(HTTPException) as error:
+        api._profile_modes("memory")
+    assert error.value.status_code == 403
+    monkeypatch.setenv("PROFILE_HEADER_ENABLED", "1")
+    assert api._profile_modes("stacks,memory") == {"stacks", "memory"}
@@ -0,0 +1,74 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.utils.quantile_sketch import TDigest
+
+QUANTILES = [0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999]
+
+
+@pytest.fixture(scope="module")
+def skewed():
+    return np.random.default_rng(7).lognormal(0, 1.5, 50_000)
+
+
+def _digest(values, **kwargs) -> TDigest:
+    digest = TDigest(**kwargs)
+    digest.update(values.tolist())
+    return digest
+
+
+def _assert_accurate(digest: TDigest, values: np.ndarray):
+    ordered = np.sort(values)
+    for q in QUANTILES:
+        estimate = digest.quantile(q)
+        # Rank error is what the sketch bounds; values in a long tail can sit far apart
+        assert abs(np.searchsorted(ordered, estimate) / len(ordered) - q) < 0.005, q
+        assert abs(digest.cdf(np.quantile(values, q)) - q) < 0.005, q
+        if 0.05 <= q <= 0.95:
+            assert estimate == pytest.approx(np.quantile(values, q), rel=0.02), q
+
+
+def test_quantiles_of_skewed_data_match_numpy(skewed):
+    digest = _digest(skewed)
+    _assert_accurate(digest, skewed)
+    assert len(digest) == len(skewed)
+    # Memory stays bounded by the compression, not the number of values
+    assert len(digest._means) <= 100
+
+
+def test_merged_digests_match_numpy(skewed):
+    parts = [_digest(skewed[i::5]) for i in range(5)]
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    _assert_accurate(merged, skewed)
+    assert merged.count == len(skewed)
+    assert (merged.min, merged.max) == (skewed.min(), skewed.max())
+
+
+def test_merging_disjoint_ranges(skewed):
+    # Each part sees only one slice of the distribution, the worst case for a merge
+    ordered = np.sort(skewed)
+    merged = TDigest()
+    for part in np.array_split(ordered, 4):
+        merged.merge(_digest(part))
+    _assert_accurate(merged, skewed)
+
+
+def test_extremes_and_empty_digest():
+    digest = TDigest()
+    assert digest.quantile(0.5) is None and digest.cdf(1.0) is None
+    digest.update([3.0, math.nan, 1.0, 2.0])
+    assert len(digest) == 3
+    assert digest.quantile(0) == 1.0 and digest.quantile(1) == 3.0
+    assert digest.cdf(0.5) == 0.0 and digest.cdf(3.0) == 1.0
+    assert digest.quantile(0.5) == pytest.approx(2.0)
+
+
+def test_constant_values():
+    digest = _digest(np.full(1000, 4.2))
+    assert digest.quantile(0.1) == pytest.approx(4.2)
+    assert digest.quantile(0.9) == pytest.approx(4.2)
+    assert digest.cdf(4.2) == 1.0
@@ -0,0 +1,38 @@
+import time
+
+import pyarrow.parquet as pq
+
+from app.utils.results_sink import ResultsSink
+
+RESULT = {
+    "user_input_type": "SUMMARY",
+    "campaign_data": {"campaign_id": "1", "name": "Spring", "impressions": 1000, "clicks": 10},
+    "analysis": {"metrics": {"ctr": 0.01}, "issues": [], "analysis": "ok"},
+}
+
+
+def _published(root):
+    return sorted(path for path in root.rglob("*.parquet") if not path.name.startswith("."))
+
+
+def test_rows_are_published_on_the_interval(tmp_path):
+    sink = ResultsSink(tmp_path, row_group_size=1000, rows_per_file=100_000, publish_interval_seconds=0.1)
+    try:
+        sink.record(RESULT, session_id="s1")
+        deadline = time.monotonic() + 5
+        while not _published(tmp_path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        [path] = _published(tmp_path)
+        assert pq.read_table(path).column("campaign_id").to_pylist() == ["1"]
+        assert not [path for path in tmp_path.rglob(".*.parquet")]
+    finally:
+        sink.close()
+
+
+def test_without_an_interval_rows_wait_for_close(tmp_path):
+    sink = ResultsSink(tmp_path, row_group_size=1000, rows_per_file=100_000, publish_interval_seconds=0)
+    sink.record(RESULT, session_id="s1")
+    time.sleep(0.2)
+    assert _published(tmp_path) == []
+    sink.close()
+    assert len(_published(tmp_path)) == 1
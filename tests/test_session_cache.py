@@ -0,0 +1,22 @@
+from app.utils.session_cache import SessionCache
+
+
+def test_unusable_entry_is_not_a_hit():
+    cache = SessionCache()
+    cache.put("s1", "summary", {"campaign_id": "1"})
+    assert cache.pop("s1", "summary", usable=lambda value: value["campaign_id"] == "2") is None
+    assert (cache.hits, cache.stale) == (0, 1)
+    # Taken at most once, usable or not
+    assert cache.pop("s1", "summary") is None
+
+
+def test_usable_and_expired_entries():
+    cache = SessionCache()
+    cache.put("s1", "summary", {"campaign_id": "1"})
+    assert cache.pop("s1", "summary", usable=lambda value: value["campaign_id"] == "1") == {"campaign_id": "1"}
+    assert cache.hits == 1
+
+    expiring = SessionCache(ttl_seconds=-1)
+    expiring.put("s1", "summary", {"campaign_id": "1"})
+    assert expiring.pop("s1", "summary") is None
+    assert (expiring.hits, expiring.expired) == (0, 1)
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils.deadline import Deadline, DeadlineExceeded, deadline_scope
+from app.utils.llm_scheduler import Priority, llm_request_context
+from app.utils.single_flight import SingleFlight
+
+
+def _in_thread(fn):
+    result = {}
+
+    def run():
+        try:
+            result["value"] = fn()
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, result
+
+
+def test_follower_retries_when_the_leader_runs_out_of_time():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def analyze():
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            time.sleep(0.2)
+            raise DeadlineExceeded("leader out of time")
+        return "analysis"
+
+    leader, leader_result = _in_thread(lambda: flight.do("key", analyze))
+    started.wait()
+    with deadline_scope(Deadline(5)):
+        assert flight.do("key", analyze) == "analysis"
+    leader.join()
+    assert isinstance(leader_result["error"], DeadlineExceeded)
+    assert flight.stats()["retried"] == 1
+
+
+def test_follower_waits_no_longer_than_its_own_deadline():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "analysis"
+
+    leader, leader_result = _in_thread(lambda: flight.do("key", slow))
+    started.wait()
+    began = time.monotonic()
+    with deadline_scope(Deadline(0.2)), pytest.raises(DeadlineExceeded):
+        flight.do("key", slow)
+    assert time.monotonic() - began < 1
+    release.set()
+    leader.join()
+    assert leader_result["value"] == "analysis"
+
+
+def test_interactive_caller_does_not_wait_on_a_batch_leader():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def call():
+        started.set()
+        release.wait(5)
+        return "batch"
+
+    def batch():
+        with llm_request_context("acme", Priority.BATCH):
+            return flight.do("key", call)
+
+    leader, _ = _in_thread(batch)
+    started.wait()
+    with llm_request_context("acme", Priority.INTERACTIVE):
+        assert flight.do("key", lambda: "interactive") == "interactive"
+    release.set()
+    leader.join()
+    assert flight.stats()["coalesced"] == 0
+
+
+def test_async_follower_retries_when_the_leader_runs_out_of_time():
+    flight = SingleFlight()
+    calls = []
+
+    def analyze():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            raise DeadlineExceeded("leader out of time")
+        return "analysis"
+
+    async def follower():
+        await asyncio.sleep(0.05)
+        with deadline_scope(Deadline(5)):
+            return await flight.do_async("key", analyze)
+
+    async def both():
+        return await asyncio.gather(flight.do_async("key", analyze), follower(), return_exceptions=True)
+
+    leader_result, follower_result = asyncio.run(both())
+    assert isinstance(leader_result, DeadlineExceeded)
+    assert follower_result == "analysis"
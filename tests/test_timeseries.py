@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.utils.timeseries import CampaignSeries
+
+START = date(2024, 3, 1)
+
+
+def _metrics(i):
+    return {"impressions": 1000 + i, "clicks": 10 + i, "conversions": 1, "spend": 5.0 + i, "revenue": 9.0}
+
+
+def _in_order(days):
+    series = CampaignSeries(START)
+    for i in range(days):
+        series.upsert(START + timedelta(days=i), _metrics(i))
+    return series
+
+
+def test_newest_first_upload_keeps_every_day():
+    series = CampaignSeries(START + timedelta(days=19))
+    for i in reversed(range(20)):
+        series.upsert(START + timedelta(days=i), _metrics(i))
+    expected = _in_order(20)
+    assert series.first_day == START
+    assert series.length == 20
+    assert series.column("clicks") == expected.column("clicks")
+    assert series.trends() == expected.trends()
+
+
+def test_out_of_order_day_fills_gap_before_first_day():
+    series = CampaignSeries(START + timedelta(days=5))
+    series.upsert(START + timedelta(days=5), _metrics(5))
+    series.upsert(START + timedelta(days=2), _metrics(2))
+    assert series.first_day == START + timedelta(days=2)
+    assert series.column("clicks") == [12.0, 0.0, 0.0, 15.0]
+    assert series.last_day == START + timedelta(days=5)
+
+
+def test_day_outside_retention_window_is_rejected():
+    series = CampaignSeries(START, capacity=30)
+    series.upsert(START, _metrics(0))
+    series.upsert(START - timedelta(days=29), _metrics(1))
+    with pytest.raises(ValueError):
+        series.upsert(START - timedelta(days=30), _metrics(2))
+    series.upsert(START + timedelta(days=40), _metrics(3))
+    with pytest.raises(ValueError):
+        series.upsert(START + timedelta(days=10), _metrics(4))
@@ -0,0 +1,57 @@
+import gzip
+import json
+import time
+
+from app.services.traffic_replay import TrafficReplayer
+from app.utils import traffic_recording
+from app.utils.traffic_recording import RECORDING_FORMAT, RECORDING_VERSION, TrafficRecorder, read_recording
+
+
+def _write_recording(path, turns):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"format": RECORDING_FORMAT, "version": RECORDING_VERSION, "started_at": 0}) + "\n")
+        for turn in turns:
+            f.write(json.dumps(turn) + "\n")
+
+
+def test_waiting_sessions_hold_no_worker(tmp_path):
+    # Four sessions each answer at once, then come back 0.4s later
+    turns = []
+    for n in range(4):
+        turns.append({"session_id": f"s{n}", "at": 0.0, "user_input": "hi", "seconds": 0.01})
+        turns.append({"session_id": f"s{n}", "at": 0.4, "user_input": "more", "seconds": 0.01})
+    recording = tmp_path / "traffic.ndjson.gz"
+    _write_recording(recording, turns)
+
+    replayer = TrafficReplayer(recording, speed=1.0, target="http://replay.invalid", workers=1)
+    sent = []
+
+    def send(http, session_id, turn):
+        sent.append((turn["session_id"], turn["user_input"]))
+        time.sleep(0.01)
+        return turn["session_id"], None, False
+
+    replayer._send_http = send
+    report = replayer.run()
+
+    assert report["replayed"]["turns"] == 8
+    assert report["replayed"]["sessions"] == 4
+    # A session holding the only worker through its wait would delay the others by 0.4s
+    assert report["replayed"]["schedule_lag_seconds"]["max"] < 0.2
+    assert report["replayed"]["duration_seconds"] < 0.8
+    for n in range(4):
+        assert sent.index((f"s{n}", "hi")) < sent.index((f"s{n}", "more"))
+
+
+def test_recording_is_readable_before_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(traffic_recording, "FLUSH_INTERVAL_SECONDS", 0.05)
+    path = tmp_path / "traffic.ndjson.gz"
+    recorder = TrafficRecorder(path)
+    try:
+        with recorder.turn("s1", "what is my cpc", tier="llm"):
+            pass
+        time.sleep(0.3)
+        _, turns = read_recording(path)
+        assert [turn["user_input"] for turn in turns] == ["what is my cpc"]
+    finally:
+        recorder.close()
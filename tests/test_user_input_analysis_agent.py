@@ -0,0 +1,19 @@
+import pytest
+
+from app.agents.user_input_analysis_agent import UserInputAnalysisAgent, UserInputType
+
+
+@pytest.mark.parametrize("text", ["thanks", "Thanks!", "That's all, thanks!", "ok, bye", "  done. ", "Thank you, goodbye"])
+def test_farewell_is_done(text):
+    assert UserInputAnalysisAgent.classify_by_keywords(text)["type"] == UserInputType.DONE
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Thanks! Now what should I improve?", UserInputType.RECOMMENDATION),
+    ("What have I done wrong with CTR?", UserInputType.RECOMMENDATION),
+    ("Thanks, how did the campaign perform?", UserInputType.SUMMARY),
+    ("Give me an overview before we're done", UserInputType.SUMMARY),
+    ("How do I exit this campaign early?", UserInputType.RECOMMENDATION),
+])
+def test_mixed_intent_is_not_done(text, expected):
+    assert UserInputAnalysisAgent.classify_by_keywords(text)["type"] == expected